@@ -1,14 +1,15 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'WS Shopify Connector',
-    'version': '16.0.01',
+    'version': '16.0.02',
     'category': 'Services',
     'author': 'Semantic Web Software',
     'website': 'wsemantic.com',
     'summary': 'Odoo connector for multiple Shopify stores',
     'description': """
        Odoo-Shopify connector supporting multiple shops and unified REST
-       product export without GraphQL.
+       product export, with optional GraphQL bulk operations for the
+       product import.
     """,
     'depends': ['base', 'sale', 'sale_management', 'product', 'stock', 'delivery'],
 
@@ -20,6 +21,7 @@
         'wizard/export_products_shopify_view.xml',
         'wizard/export_order_shopify_view.xml',
         'views/shopify_instance_view.xml',
+        'views/shopify_api_metric_view.xml',
         'views/res_partner_view.xml',
         'views/product_view.xml',
         'views/order_view.xml',
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""End-to-end throughput benchmark of the sync paths against the local stub.
+
+Seeds a database with synthetic products (templates with ``Color`` and
+``Talla`` attribute lines, one variant per combination, each with its SKU
+and barcode) and stock, starts
+``shopify_stub`` with synthetic customers and orders, points a dedicated
+``shopify.web`` instance at it and runs, in order:
+
+* ``export_products`` -> ``product.template.export_products_to_shopify``
+* ``export_stock``    -> ``product.template.export_stock_to_shopify``
+* ``import_customers``-> ``res.partner.import_shopify_customers``
+* ``import_orders``   -> ``sale.order.import_shopify_orders``
+
+Each operation is called again until a run makes no progress (the sync
+methods stop after a batch or a time budget), and the report gives items
+per second, API calls, 429s and SQL queries per operation.
+``export_stock`` sends the stock of the variants ``export_products``
+mapped, so run it after that operation.
+
+The sync methods commit, so use a throwaway database with this module
+installed; the product export only selects published products, so
+``website_sale`` (which adds ``is_published``) must be installed too::
+
+    python benchmarks/run_benchmark.py -c odoo.conf -d bench_db --scale 1000
+    python benchmarks/run_benchmark.py -c odoo.conf -d bench_db --scale 10000 \\
+        --ops export_products,export_stock --latency-ms 50
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import shopify_stub  # noqa: E402
+
+_logger = logging.getLogger('shopify_benchmark')
+
+SKU_PREFIX = 'BENCH-'
+# Cada plantilla tiene una variante por combinación de color y talla, como exige la exportación
+COLORS = ('Rojo', 'Azul')
+SIZES = ('S', 'M', 'L')
+OPERATIONS = ('export_products', 'export_stock', 'import_customers', 'import_orders')
+
+
+def _attribute(env, name, values):
+    Attribute = env['product.attribute'].sudo()
+    attribute = Attribute.search([('name', '=', name)], limit=1) or Attribute.create({
+        'name': name, 'create_variant': 'always'})
+    existing = {value.name: value for value in attribute.value_ids}
+    missing = [value for value in values if value not in existing]
+    if missing:
+        for value in env['product.attribute.value'].sudo().create([
+                {'name': value, 'attribute_id': attribute.id} for value in missing]):
+            existing[value.name] = value
+    return attribute, [existing[value].id for value in values]
+
+
+def seed(env, scale, batch_size=1000):
+    """Create storable variants with stock until ``scale`` exist, unless already seeded.
+
+    Variant ``n`` gets the SKU ``{SKU_PREFIX}{n}`` the stub's order lines
+    reference and a unique barcode.
+    """
+    Product = env['product.product'].sudo()
+    existing = Product.search_count([('default_code', '=like', SKU_PREFIX + '%')])
+    if existing >= scale:
+        return
+    color, color_value_ids = _attribute(env, 'Color', COLORS)
+    size, size_value_ids = _attribute(env, 'Talla', SIZES)
+    per_template = len(COLORS) * len(SIZES)
+    published = 'is_published' in env['product.template']._fields
+    location = env['stock.warehouse'].search([('company_id', '=', env.company.id)], limit=1).lot_stock_id
+    template_batch = max(1, batch_size // per_template)
+    first = existing // per_template
+    last = -(-scale // per_template)
+    for start in range(first, last, template_batch):
+        stop = min(last, start + template_batch)
+        templates = env['product.template'].sudo().create([dict({
+            'name': 'Producto {}'.format(n),
+            'detailed_type': 'product',
+            'list_price': 19.9,
+            'wholesale_price': 16.45,
+            'attribute_line_ids': [
+                (0, 0, {'attribute_id': color.id, 'value_ids': [(6, 0, color_value_ids)]}),
+                (0, 0, {'attribute_id': size.id, 'value_ids': [(6, 0, size_value_ids)]}),
+            ],
+        }, **({'is_published': True} if published else {})) for n in range(start, stop)])
+        variants = Product.browse()
+        for template in templates:
+            variants |= template.product_variant_ids.sorted('id')
+        for number, variant in enumerate(variants, start * per_template):
+            variant.write({
+                'default_code': '{}{}'.format(SKU_PREFIX, number),
+                'barcode': '99{:011d}'.format(number),
+            })
+        env['stock.quant'].sudo().with_context(inventory_mode=True).create([{
+            'product_id': variant.id,
+            'location_id': location.id,
+            'inventory_quantity': 10,
+        } for variant in variants]).action_apply_inventory()
+        env.cr.commit()
+        _logger.info("Seeded %s/%s variants", stop * per_template, scale)
+
+
+def setup_instance(env, base_url):
+    Instance = env['shopify.web'].sudo()
+    instance = Instance.search([('name', '=', 'Benchmark stub')], limit=1)
+    vals = {
+        'name': 'Benchmark stub',
+        'shopify_api_key': 'bench',
+        'shopify_password': 'bench',
+        'shopify_shared_secret': 'bench',
+        'shopify_host': base_url,
+        'shopify_version': '2024-01',
+        'shopify_active': True,
+    }
+    if instance:
+        instance.write(vals)
+    else:
+        instance = Instance.create(vals)
+    # Las demás instancias no deben recibir llamadas durante la prueba
+    (Instance.search([('shopify_active', '=', True)]) - instance).write({'shopify_active': False})
+    env['shopify.location'].sudo().import_shopify_locations(instance)
+    env.cr.commit()
+    return instance
+
+
+def count_progress(env, operation, instance, stub):
+    stats = stub.stats()['by_endpoint']
+    if operation == 'export_products':
+        return stats.get('POST products.json', 0) + stats.get('PUT products/{id}.json', 0)
+    if operation == 'export_stock':
+        return stats.get('POST inventory_levels/set.json', 0)
+    if operation == 'import_customers':
+        return env['shopify.partner.map'].sudo().search_count([('shopify_instance_id', '=', instance.id)])
+    return env['shopify.order.map'].sudo().search_count([('shopify_instance_id', '=', instance.id)])
+
+
+def run_operation(env, operation, instance):
+    if operation == 'export_products':
+        env['product.template'].export_products_to_shopify(instance, update=True)
+    elif operation == 'export_stock':
+        env['product.template'].export_stock_to_shopify(instance)
+    elif operation == 'import_customers':
+        env['res.partner'].import_shopify_customers(instance, False)
+    elif operation == 'import_orders':
+        env['sale.order'].import_shopify_orders(instance, False, False, False)
+
+
+def benchmark(env, operation, instance, stub, max_rounds):
+    from odoo import sql_db
+
+    stub.reset_stats()
+    items_before = count_progress(env, operation, instance, stub)
+    queries_before = sql_db.sql_counter
+    started = time.time()
+    rounds = 0
+    items = 0
+    while rounds < max_rounds:
+        rounds += 1
+        run_operation(env, operation, instance)
+        env.cr.commit()
+        env.invalidate_all()
+        done = count_progress(env, operation, instance, stub) - items_before
+        if done == items:
+            break
+        items = done
+    elapsed = time.time() - started
+    stats = stub.stats()
+    return {
+        'operation': operation,
+        'items': items,
+        'rounds': rounds,
+        'seconds': elapsed,
+        'items_per_second': items / elapsed if elapsed else 0.0,
+        'api_calls': stats['calls'],
+        'throttled': stats['throttled'],
+        'sql_queries': sql_db.sql_counter - queries_before,
+    }
+
+
+def report(results, scale):
+    header = '{:<18} {:>8} {:>7} {:>10} {:>10} {:>10} {:>7} {:>12}'
+    print('\nScale: {} records'.format(scale))
+    print(header.format('operation', 'items', 'rounds', 'seconds', 'items/s', 'api calls', '429s', 'sql queries'))
+    for r in results:
+        print(header.format(r['operation'], r['items'], r['rounds'], '{:.1f}'.format(r['seconds']),
+                            '{:.1f}'.format(r['items_per_second']), r['api_calls'], r['throttled'],
+                            r['sql_queries']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-c', '--config', help='Odoo configuration file')
+    parser.add_argument('-d', '--database', required=True, help='throwaway database with ws_shopify installed')
+    parser.add_argument('--scale', type=int, default=1000, help='records per collection (1000, 10000, 100000)')
+    parser.add_argument('--ops', default=','.join(OPERATIONS), help='comma separated subset of ' + ', '.join(OPERATIONS))
+    parser.add_argument('--max-rounds', type=int, default=10000)
+    parser.add_argument('--capacity', type=int, default=40, help='stub bucket size (40 standard, 400 Plus)')
+    parser.add_argument('--leak-rate', type=float, default=0.0,
+                        help='stub leak rate in calls/s; 0 (default) measures the connector, not the rate limit')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='latency added by the stub to every call')
+    args = parser.parse_args()
+
+    operations = [op for op in args.ops.split(',') if op]
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        parser.error('unknown operations: {}'.format(', '.join(sorted(unknown))))
+
+    import odoo
+    from odoo import SUPERUSER_ID, api
+
+    odoo.tools.config.parse_config((['-c', args.config] if args.config else []) + ['-d', args.database])
+    logging.basicConfig(level=logging.INFO)
+
+    fixtures = shopify_stub.generate_fixtures(
+        customers=args.scale if 'import_customers' in operations else 0,
+        orders=args.scale if 'import_orders' in operations else 0,
+        sku_prefix=SKU_PREFIX, sku_count=args.scale,
+    )
+    stub = shopify_stub.StubShop(fixtures, capacity=args.capacity, leak_rate=args.leak_rate,
+                                 latency=args.latency_ms / 1000.0)
+    server, base_url = shopify_stub.start_server(stub)
+
+    registry = odoo.registry(args.database)
+    results = []
+    try:
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            seed(env, args.scale)
+            instance = setup_instance(env, base_url)
+            for operation in operations:
+                results.append(benchmark(env, operation, instance, stub, args.max_rounds))
+    finally:
+        server.shutdown()
+    report(results, args.scale)
+
+
+if __name__ == '__main__':
+    main()
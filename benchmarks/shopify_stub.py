@@ -0,0 +1,715 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for the Shopify Admin REST API used by this module.
+
+It serves, from in-memory fixtures, the endpoints the connector calls:
+products, variants, inventory items and levels (including
+``inventory_levels/set``), locations, customers and their metafields,
+orders, draft orders, gift cards and payouts. Like Shopify it paginates
+with ``Link`` headers (``page_info``), honours ``limit``, ``since_id``,
+``*_at_min``/``*_at_max``, ``order`` and ``fields``, reports
+``X-Shopify-Shop-Api-Call-Limit`` and answers 429 with ``Retry-After``
+when its leaky bucket overflows.
+
+``POST graphql.json`` implements the bulk operation calls used by the
+product import (``bulkOperationRunQuery`` and ``currentBulkOperation``)
+for product/variant exports: operations complete after
+``bulk_polls`` status polls and their JSONL result is served from
+``GET /_bulk/<n>.jsonl``.
+
+Point an instance at it by setting its *Shopify Host* to the server URL
+(e.g. ``http://127.0.0.1:8765``). ``GET /_stats`` returns the calls
+received per endpoint and ``POST /_reset`` clears them.
+
+Only the standard library is used, so it can also run on its own::
+
+    python benchmarks/shopify_stub.py --port 8765 --customers 1000 --orders 1000
+    python benchmarks/shopify_stub.py --fixtures shop.json --leak-rate 0
+"""
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = re.compile(r'^/admin/api/[^/]+/')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 250
+DEFAULT_LOCATION_ID = 1001
+
+
+def _iso(dt):
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def _parse_dt(value):
+    value = value.strip().replace(' ', 'T').replace('Z', '+00:00')
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class Bucket:
+    """Leaky bucket with Shopify's REST semantics; ``leak_rate=0`` never throttles.
+
+    The leak rate defaults to ``capacity / 20`` calls per second, as in Shopify.
+    """
+
+    def __init__(self, capacity=40, leak_rate=None):
+        self.capacity = capacity
+        self.leak_rate = capacity / 20.0 if leak_rate is None else leak_rate
+        self.fill = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Return ``(accepted, used)`` for one incoming call."""
+        with self._lock:
+            if not self.leak_rate:
+                return True, 1
+            now = time.monotonic()
+            self.fill = max(0.0, self.fill - (now - self.updated) * self.leak_rate)
+            self.updated = now
+            if self.fill + 1 > self.capacity:
+                return False, self.capacity
+            self.fill += 1
+            return True, int(round(self.fill))
+
+
+class StubShop:
+    """In-memory shop state shared by the request handlers."""
+
+    COLLECTIONS = ('products', 'customers', 'orders', 'draft_orders', 'locations', 'gift_cards', 'payouts')
+
+    def __init__(self, fixtures=None, capacity=40, leak_rate=None, latency=0.0, bulk_polls=1):
+        fixtures = fixtures or {}
+        self.lock = threading.RLock()
+        self.bulk_polls = bulk_polls
+        self.bulk_operations = []
+        self.bulk_results = {}
+        self.bucket = Bucket(capacity, leak_rate)
+        self.latency = latency
+        self.data = {name: {} for name in self.COLLECTIONS}
+        self.metafields = {}
+        self.inventory_items = {}
+        self.inventory_levels = {}
+        self.next_id = 10 ** 9
+        for name in self.COLLECTIONS:
+            for record in fixtures.get(name, []):
+                self.data[name][record['id']] = record
+        for owner_id, metafields in fixtures.get('metafields', {}).items():
+            self.metafields[int(owner_id)] = metafields
+        if not self.data['locations']:
+            self.data['locations'][DEFAULT_LOCATION_ID] = {
+                'id': DEFAULT_LOCATION_ID, 'name': 'Stub Warehouse', 'active': True, 'legacy': False}
+        for product in self.data['products'].values():
+            for variant in product.get('variants', []):
+                self._track_inventory(variant)
+        self.reset_stats()
+
+    # -- bookkeeping ------------------------------------------------------
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls = Counter()
+            self.throttled = 0
+            self.bytes_sent = 0
+            self.started = time.time()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'calls': sum(self.calls.values()),
+                'throttled': self.throttled,
+                'bytes_sent': self.bytes_sent,
+                'elapsed': time.time() - self.started,
+                'by_endpoint': dict(self.calls),
+                'records': {name: len(records) for name, records in self.data.items()},
+            }
+
+    def new_id(self):
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def _touch(self, record, created=False):
+        now = _iso(datetime.now(timezone.utc))
+        if created:
+            record.setdefault('created_at', now)
+        record['updated_at'] = now
+        return record
+
+    def _track_inventory(self, variant):
+        item_id = variant.setdefault('inventory_item_id', self.new_id())
+        self.inventory_items[item_id] = {'id': item_id, 'sku': variant.get('sku') or ''}
+        self.inventory_levels.setdefault((item_id, DEFAULT_LOCATION_ID), {
+            'inventory_item_id': item_id, 'location_id': DEFAULT_LOCATION_ID,
+            'available': variant.get('inventory_quantity', 0), 'updated_at': _iso(datetime.now(timezone.utc)),
+        })
+
+    # -- listing ----------------------------------------------------------
+
+    def select(self, records, query):
+        """Filter and sort ``records`` like Shopify list endpoints."""
+        records = list(records)
+        if query.get('ids'):
+            ids = {int(i) for i in query['ids'].split(',') if i}
+            records = [r for r in records if r['id'] in ids]
+        if query.get('since_id'):
+            since = int(query['since_id'])
+            records = [r for r in records if r['id'] > since]
+        for field in ('created_at', 'updated_at'):
+            if query.get(field + '_min'):
+                low = _parse_dt(query[field + '_min'])
+                records = [r for r in records if r.get(field) and _parse_dt(r[field]) >= low]
+            if query.get(field + '_max'):
+                high = _parse_dt(query[field + '_max'])
+                records = [r for r in records if r.get(field) and _parse_dt(r[field]) <= high]
+        status = query.get('status')
+        if status and status != 'any':
+            records = [r for r in records if r.get('status', status) == status]
+        if query.get('namespace'):
+            records = [r for r in records if r.get('namespace') == query['namespace']]
+        if query.get('location_ids'):
+            locations = {int(i) for i in query['location_ids'].split(',') if i}
+            records = [r for r in records if r.get('location_id') in locations]
+        order = query.get('order', 'id asc') if not query.get('since_id') else 'id asc'
+        key, _sep, direction = order.partition(' ')
+        records.sort(key=lambda r: (r.get(key) or '', r.get('id') or 0) if key != 'id' else r.get('id') or 0,
+                     reverse=direction.lower() == 'desc')
+        return records
+
+    def bulk_products_jsonl(self, bulk_query):
+        """JSONL export of the products matching ``bulk_query``, variants after their product."""
+        query = {}
+        match = re.search(r"updated_at:>=\\?'([^'\\]+)", bulk_query)
+        if match:
+            query['updated_at_min'] = match.group(1)
+        lines = []
+        with self.lock:
+            for product in self.select(self.data['products'].values(), query):
+                product_gid = 'gid://shopify/Product/{}'.format(product['id'])
+                lines.append({'id': product_gid, 'updatedAt': product.get('updated_at')})
+                for variant in product.get('variants', []):
+                    lines.append({
+                        'id': 'gid://shopify/ProductVariant/{}'.format(variant['id']),
+                        'sku': variant.get('sku') or None,
+                        'barcode': variant.get('barcode') or None,
+                        'inventoryItem': {'id': 'gid://shopify/InventoryItem/{}'.format(variant['inventory_item_id'])},
+                        '__parentId': product_gid,
+                    })
+        return ''.join(json.dumps(line) + '\n' for line in lines).encode()
+
+    @staticmethod
+    def project(record, fields):
+        if not fields:
+            return record
+        wanted = [f.strip() for f in fields.split(',')]
+        return {f: record[f] for f in wanted if f in record}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    shop = None  # asignado por make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    # -- plumbing ---------------------------------------------------------
+
+    def _send(self, status, payload=None, headers=None, used=None):
+        body = json.dumps(payload if payload is not None else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if used is not None:
+            self.send_header('X-Shopify-Shop-Api-Call-Limit', '{}/{}'.format(used, self.shop.bucket.capacity))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.shop.lock:
+            self.shop.bytes_sent += len(body)
+
+    def _send_raw(self, content):
+        if content is None:
+            return self._send(404, {'errors': 'Not Found'})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/jsonl')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        with self.shop.lock:
+            self.shop.bytes_sent += len(content)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        if url.path == '/_stats':
+            return self._send(200, self.shop.stats())
+        if url.path == '/_reset':
+            self.shop.reset_stats()
+            return self._send(200, {})
+        bulk = re.fullmatch(r'/_bulk/(\d+)\.jsonl', url.path)
+        if bulk:
+            return self._send_raw(self.shop.bulk_results.get(int(bulk.group(1))))
+        body = self._body()
+        endpoint = API_PREFIX.sub('', url.path)
+        if endpoint == url.path:
+            return self._send(404, {'errors': 'Not Found'})
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if query.get('page_info'):
+            state = json.loads(base64.urlsafe_b64decode(query['page_info'].encode()))
+            query = dict(state['query'], limit=query.get('limit', state['query'].get('limit')),
+                         offset=state['offset'])
+        with self.shop.lock:
+            self.shop.calls['{} {}'.format(method, re.sub(r'/\d+', '/{id}', endpoint))] += 1
+        accepted, used = self.shop.bucket.take()
+        if not accepted:
+            with self.shop.lock:
+                self.shop.throttled += 1
+            retry_after = 1.0 / self.shop.bucket.leak_rate
+            return self._send(429, {'errors': 'Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service.'},
+                              {'Retry-After': '{:.1f}'.format(retry_after)}, used)
+        if self.shop.latency:
+            time.sleep(self.shop.latency)
+        for pattern, handler_name in ROUTES:
+            match = re.fullmatch(pattern, '{} {}'.format(method, endpoint))
+            if match:
+                status, payload, headers = getattr(self, handler_name)(query, body, *match.groups())
+                return self._send(status, payload, headers, used)
+        return self._send(404, {'errors': 'Not Found'}, used=used)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _page(self, root_key, records, query, project=True):
+        limit = min(int(query.get('limit') or DEFAULT_LIMIT), MAX_LIMIT)
+        offset = int(query.get('offset') or 0)
+        page = records[offset:offset + limit]
+        headers = {}
+        links = []
+        filters = {k: v for k, v in query.items() if k not in ('offset', 'page_info')}
+        base = 'http://{}{}'.format(self.headers.get('Host'), urlsplit(self.path).path)
+        for rel, start in (('previous', offset - limit), ('next', offset + limit)):
+            if (rel == 'next' and start < len(records)) or (rel == 'previous' and offset > 0):
+                token = base64.urlsafe_b64encode(json.dumps({'query': filters, 'offset': max(0, start)}).encode())
+                links.append('<{}?limit={}&page_info={}>; rel="{}"'.format(base, limit, token.decode(), rel))
+        if links:
+            headers['Link'] = ', '.join(links)
+        fields = query.get('fields') if project else None
+        return 200, {root_key: [self.shop.project(r, fields) for r in page]}, headers
+
+    def _list(self, collection, query):
+        with self.shop.lock:
+            records = self.shop.select(self.shop.data[collection].values(), query)
+        return self._page(collection, records, query)
+
+    def _get(self, collection, root_key, record_id, query):
+        record = self.shop.data[collection].get(int(record_id))
+        if not record:
+            return 404, {'errors': 'Not Found'}, None
+        return 200, {root_key: self.shop.project(record, query.get('fields'))}, None
+
+    # -- endpoints --------------------------------------------------------
+
+    def shop_info(self, query, body):
+        return 200, {'shop': {'id': 1, 'name': 'Shopify stub', 'myshopify_domain': 'stub.myshopify.com'}}, None
+
+    def list_products(self, query, body):
+        return self._list('products', query)
+
+    def get_product(self, query, body, product_id):
+        return self._get('products', 'product', product_id, query)
+
+    def _apply_variants(self, product, variants):
+        existing = {v['id']: v for v in product.get('variants', [])}
+        missing = [v['id'] for v in variants if v.get('id') and int(v['id']) not in existing]
+        if missing:
+            return ['Variant ids {} do not exist'.format(missing)]
+        result = []
+        for position, data in enumerate(variants, 1):
+            variant = existing.get(int(data['id'])) if data.get('id') else None
+            if variant is None:
+                variant = {'id': self.shop.new_id(), 'product_id': product['id']}
+                self.shop._touch(variant, created=True)
+            variant.update({k: v for k, v in data.items() if k != 'id'})
+            variant['position'] = position
+            self.shop._track_inventory(variant)
+            result.append(variant)
+        product['variants'] = result
+        return None
+
+    def create_product(self, query, body):
+        data = dict(body.get('product') or {})
+        with self.shop.lock:
+            product = {'id': self.shop.new_id(), 'title': data.get('title'), 'status': data.get('status', 'active')}
+            self.shop._touch(product, created=True)
+            self._apply_variants(product, [dict(v, id=None) for v in data.pop('variants', [])])
+            product.update({k: v for k, v in data.items() if k != 'id'})
+            self.shop.data['products'][product['id']] = product
+        return 201, {'product': product}, None
+
+    def update_product(self, query, body, product_id):
+        data = dict(body.get('product') or {})
+        with self.shop.lock:
+            product = self.shop.data['products'].get(int(product_id))
+            if not product:
+                return 404, {'errors': 'Not Found'}, None
+            if 'variants' in data:
+                errors = self._apply_variants(product, data.pop('variants'))
+                if errors:
+                    return 422, {'errors': {'variants': errors}}, None
+            product.update({k: v for k, v in data.items() if k != 'id'})
+            self.shop._touch(product)
+        return 200, {'product': product}, None
+
+    def delete_product(self, query, body, product_id):
+        with self.shop.lock:
+            if not self.shop.data['products'].pop(int(product_id), None):
+                return 404, {'errors': 'Not Found'}, None
+        return 200, {}, None
+
+    def _find_variant(self, variant_id):
+        for product in self.shop.data['products'].values():
+            for variant in product.get('variants', []):
+                if variant['id'] == int(variant_id):
+                    return product, variant
+        return None, None
+
+    def get_variant(self, query, body, variant_id):
+        with self.shop.lock:
+            _product, variant = self._find_variant(variant_id)
+        if not variant:
+            return 404, {'errors': 'Not Found'}, None
+        return 200, {'variant': self.shop.project(variant, query.get('fields'))}, None
+
+    def update_variant(self, query, body, variant_id):
+        with self.shop.lock:
+            product, variant = self._find_variant(variant_id)
+            if not variant:
+                return 404, {'errors': 'Not Found'}, None
+            variant.update({k: v for k, v in (body.get('variant') or {}).items() if k != 'id'})
+            self.shop._touch(variant)
+            self.shop._touch(product)
+            self.shop._track_inventory(variant)
+        return 200, {'variant': variant}, None
+
+    def get_inventory_item(self, query, body, item_id):
+        item = self.shop.inventory_items.get(int(item_id))
+        if not item:
+            return 404, {'errors': 'Not Found'}, None
+        return 200, {'inventory_item': self.shop.project(item, query.get('fields'))}, None
+
+    def list_inventory_levels(self, query, body):
+        with self.shop.lock:
+            levels = [dict(level, id=level['inventory_item_id']) for level in self.shop.inventory_levels.values()]
+            levels = self.shop.select(levels, dict(query, order='id asc'))
+            for level in levels:
+                level.pop('id')
+        return self._page('inventory_levels', levels, query)
+
+    def set_inventory_level(self, query, body):
+        try:
+            key = (int(body['inventory_item_id']), int(body['location_id']))
+            available = int(body['available'])
+        except (KeyError, TypeError, ValueError):
+            return 400, {'errors': 'inventory_item_id, location_id and available are required'}, None
+        with self.shop.lock:
+            if key[0] not in self.shop.inventory_items:
+                return 422, {'errors': ['Inventory item does not exist']}, None
+            level = self.shop.inventory_levels.setdefault(key, {'inventory_item_id': key[0], 'location_id': key[1]})
+            level.update(available=available, updated_at=_iso(datetime.now(timezone.utc)))
+        return 200, {'inventory_level': level}, None
+
+    def list_locations(self, query, body):
+        return self._list('locations', query)
+
+    def list_customers(self, query, body):
+        return self._list('customers', query)
+
+    def get_customer(self, query, body, customer_id):
+        return self._get('customers', 'customer', customer_id, query)
+
+    def create_customer(self, query, body):
+        data = dict(body.get('customer') or {})
+        with self.shop.lock:
+            customer = dict(data, id=self.shop.new_id())
+            self.shop._touch(customer, created=True)
+            self.shop.data['customers'][customer['id']] = customer
+        return 201, {'customer': customer}, None
+
+    def update_customer(self, query, body, customer_id):
+        with self.shop.lock:
+            customer = self.shop.data['customers'].get(int(customer_id))
+            if not customer:
+                return 404, {'errors': 'Not Found'}, None
+            customer.update({k: v for k, v in (body.get('customer') or {}).items() if k != 'id'})
+            self.shop._touch(customer)
+        return 200, {'customer': customer}, None
+
+    def list_metafields(self, query, body, owner_id):
+        with self.shop.lock:
+            records = self.shop.select(self.shop.metafields.get(int(owner_id), []), query)
+        return self._page('metafields', records, query)
+
+    def create_metafield(self, query, body, owner_id):
+        data = dict(body.get('metafield') or {})
+        with self.shop.lock:
+            metafields = self.shop.metafields.setdefault(int(owner_id), [])
+            for metafield in metafields:
+                if (metafield.get('namespace'), metafield.get('key')) == (data.get('namespace'), data.get('key')):
+                    metafield.update(data)
+                    return 200, {'metafield': metafield}, None
+            metafield = dict(data, id=self.shop.new_id(), owner_id=int(owner_id))
+            metafields.append(metafield)
+        return 201, {'metafield': metafield}, None
+
+    def update_metafield(self, query, body, owner_id, metafield_id):
+        with self.shop.lock:
+            for metafield in self.shop.metafields.get(int(owner_id), []):
+                if metafield['id'] == int(metafield_id):
+                    metafield.update({k: v for k, v in (body.get('metafield') or {}).items() if k != 'id'})
+                    return 200, {'metafield': metafield}, None
+        return 404, {'errors': 'Not Found'}, None
+
+    def list_orders(self, query, body):
+        return self._list('orders', query)
+
+    def list_draft_orders(self, query, body):
+        return self._list('draft_orders', query)
+
+    def create_draft_order(self, query, body):
+        data = dict(body.get('draft_order') or {})
+        with self.shop.lock:
+            draft = dict(data, id=self.shop.new_id(), status='open')
+            draft.setdefault('name', '#D{}'.format(len(self.shop.data['draft_orders']) + 1))
+            self.shop._touch(draft, created=True)
+            self.shop.data['draft_orders'][draft['id']] = draft
+        return 201, {'draft_order': draft}, None
+
+    def update_draft_order(self, query, body, draft_id):
+        with self.shop.lock:
+            draft = self.shop.data['draft_orders'].get(int(draft_id))
+            if not draft:
+                return 404, {'errors': 'Not Found'}, None
+            draft.update({k: v for k, v in (body.get('draft_order') or {}).items() if k != 'id'})
+            self.shop._touch(draft)
+        return 200, {'draft_order': draft}, None
+
+    def graphql(self, query, body):
+        text = body.get('query') or ''
+        if 'bulkOperationRunQuery' in text:
+            return 200, {'data': {'bulkOperationRunQuery': self._run_bulk(body.get('variables') or {})}}, None
+        if 'currentBulkOperation' in text:
+            return 200, {'data': {'currentBulkOperation': self._current_bulk()}}, None
+        return 200, {'errors': [{'message': 'Only bulk operation calls are supported by the stub'}]}, None
+
+    def _run_bulk(self, variables):
+        bulk_query = variables.get('query') or ''
+        with self.shop.lock:
+            current = self.shop.bulk_operations[-1] if self.shop.bulk_operations else None
+            if current and current['status'] == 'RUNNING':
+                return {'bulkOperation': None, 'userErrors': [
+                    {'field': None, 'message': 'A bulk query operation for this app and shop is already in progress: {}.'
+                        .format(current['id'])}]}
+            if not re.search(r'\bproducts\b', bulk_query):
+                return {'bulkOperation': None, 'userErrors': [
+                    {'field': ['query'], 'message': 'Only product exports are supported by the stub'}]}
+            number = len(self.shop.bulk_operations) + 1
+            operation = {
+                'id': 'gid://shopify/BulkOperation/{}'.format(number), 'number': number, 'status': 'RUNNING',
+                'errorCode': None, 'query': bulk_query, 'objectCount': '0', 'url': None, 'polls': 0,
+            }
+            self.shop.bulk_operations.append(operation)
+        return {'bulkOperation': {'id': operation['id'], 'status': operation['status']}, 'userErrors': []}
+
+    def _current_bulk(self):
+        with self.shop.lock:
+            if not self.shop.bulk_operations:
+                return None
+            operation = self.shop.bulk_operations[-1]
+            if operation['status'] == 'RUNNING':
+                operation['polls'] += 1
+                if operation['polls'] >= self.shop.bulk_polls:
+                    content = self.shop.bulk_products_jsonl(operation['query'])
+                    self.shop.bulk_results[operation['number']] = content
+                    operation['status'] = 'COMPLETED'
+                    operation['objectCount'] = str(content.count(b'\n'))
+                    if content:
+                        operation['url'] = 'http://{}/_bulk/{}.jsonl'.format(self.headers.get('Host'), operation['number'])
+            return {k: v for k, v in operation.items() if k not in ('number', 'polls')}
+
+    def list_gift_cards(self, query, body):
+        return self._list('gift_cards', query)
+
+    def list_payouts(self, query, body):
+        return self._list('payouts', query)
+
+
+ROUTES = [
+    (r'GET shop\.json', 'shop_info'),
+    (r'GET products\.json', 'list_products'),
+    (r'POST products\.json', 'create_product'),
+    (r'GET products/(\d+)\.json', 'get_product'),
+    (r'PUT products/(\d+)\.json', 'update_product'),
+    (r'DELETE products/(\d+)\.json', 'delete_product'),
+    (r'GET variants/(\d+)\.json', 'get_variant'),
+    (r'PUT variants/(\d+)\.json', 'update_variant'),
+    (r'GET inventory_items/(\d+)\.json', 'get_inventory_item'),
+    (r'GET inventory_levels\.json', 'list_inventory_levels'),
+    (r'POST inventory_levels/set\.json', 'set_inventory_level'),
+    (r'GET locations\.json', 'list_locations'),
+    (r'GET customers\.json', 'list_customers'),
+    (r'POST customers\.json', 'create_customer'),
+    (r'GET customers/(\d+)\.json', 'get_customer'),
+    (r'PUT customers/(\d+)\.json', 'update_customer'),
+    (r'GET customers/(\d+)/metafields\.json', 'list_metafields'),
+    (r'POST customers/(\d+)/metafields\.json', 'create_metafield'),
+    (r'PUT customers/(\d+)/metafields/(\d+)\.json', 'update_metafield'),
+    (r'GET orders\.json', 'list_orders'),
+    (r'GET draft_orders\.json', 'list_draft_orders'),
+    (r'POST draft_orders\.json', 'create_draft_order'),
+    (r'PUT draft_orders/(\d+)\.json', 'update_draft_order'),
+    (r'GET gift_cards\.json', 'list_gift_cards'),
+    (r'GET shopify_payments/payouts\.json', 'list_payouts'),
+    (r'POST graphql\.json', 'graphql'),
+]
+
+
+def generate_fixtures(products=0, customers=0, orders=0, variants_per_product=3, sku_prefix='BENCH-', sku_count=None):
+    """Build deterministic synthetic fixtures.
+
+    Order lines reference the SKUs ``{sku_prefix}{n}`` for ``n`` below
+    ``sku_count`` (default: one per product variant, or 100), so the caller
+    can seed matching products on the Odoo side.
+    """
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    next_id = [10 ** 6]
+
+    def new_id():
+        next_id[0] += 1
+        return next_id[0]
+
+    def address(i):
+        return {
+            'first_name': 'Nombre{}'.format(i), 'last_name': 'Apellido{}'.format(i),
+            'address1': 'Calle {} nº {}'.format(i % 97, i % 13 + 1), 'city': 'Madrid', 'zip': '28{:03d}'.format(i % 1000),
+            'province': 'Madrid', 'country_code': 'ES', 'phone': '+3460{:07d}'.format(i),
+        }
+
+    fixtures = {'products': [], 'customers': [], 'orders': [], 'metafields': {}}
+    for i in range(products):
+        stamp = _iso(base + timedelta(minutes=i))
+        product_id = new_id()
+        fixtures['products'].append({
+            'id': product_id, 'title': 'Producto {}'.format(i), 'status': 'active',
+            'created_at': stamp, 'updated_at': stamp,
+            'options': [{'name': 'Talla', 'position': 1}],
+            'variants': [{
+                'id': new_id(), 'product_id': product_id, 'title': 'T{}'.format(v), 'option1': 'T{}'.format(v),
+                'sku': '{}{}'.format(sku_prefix, i * variants_per_product + v),
+                'barcode': '84{:011d}'.format(i * variants_per_product + v), 'price': '19.90',
+                'inventory_quantity': 10,
+            } for v in range(variants_per_product)],
+        })
+    sku_count = sku_count or (products * variants_per_product) or 100
+    for i in range(customers):
+        stamp = _iso(base + timedelta(minutes=i))
+        customer_id = new_id()
+        fixtures['customers'].append(dict(
+            id=customer_id, email='cliente{}@example.com'.format(i), first_name='Nombre{}'.format(i),
+            last_name='Apellido{}'.format(i), phone='+3460{:07d}'.format(i), created_at=stamp, updated_at=stamp,
+            default_address=address(i), addresses=[address(i)],
+        ))
+        fixtures['metafields'][customer_id] = [
+            {'id': new_id(), 'namespace': 'custom', 'key': 'referencia', 'value': 'REF{}'.format(i)}]
+    for i in range(orders):
+        stamp = _iso(base + timedelta(minutes=i))
+        buyer = fixtures['customers'][i % customers] if customers else dict(
+            id=new_id(), email='pedido{}@example.com'.format(i), first_name='Nombre{}'.format(i),
+            last_name='Apellido{}'.format(i), default_address=address(i))
+        fixtures['orders'].append({
+            'id': new_id(), 'name': '#{}'.format(1001 + i), 'email': buyer['email'], 'created_at': stamp,
+            'updated_at': stamp, 'financial_status': 'paid', 'customer': buyer,
+            'billing_address': buyer['default_address'], 'shipping_address': buyer['default_address'],
+            'line_items': [{
+                'id': new_id(), 'title': 'Producto {}'.format(n), 'sku': '{}{}'.format(sku_prefix, n % sku_count),
+                'variant_id': None, 'quantity': 1 + n % 3, 'price': '19.90', 'discount_allocations': [],
+                'tax_lines': [{'title': 'IVA 21%', 'rate': 0.21, 'price': '3.45'}],
+            } for n in (i, i + 1)],
+        })
+    return fixtures
+
+
+def make_server(shop, host='127.0.0.1', port=0):
+    """Return a :class:`ThreadingHTTPServer` serving ``shop`` (not started)."""
+    handler = type('BoundStubHandler', (StubHandler,), {'shop': shop})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(shop, host='127.0.0.1', port=0):
+    """Serve ``shop`` on a background thread; return ``(server, base_url)``."""
+    server = make_server(shop, host, port)
+    threading.Thread(target=server.serve_forever, name='shopify-stub', daemon=True).start()
+    return server, 'http://{}:{}'.format(*server.server_address[:2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', help='JSON file with the collections to serve')
+    parser.add_argument('--dump-fixtures', help='write the generated fixtures to this file and exit')
+    parser.add_argument('--products', type=int, default=0)
+    parser.add_argument('--customers', type=int, default=0)
+    parser.add_argument('--orders', type=int, default=0)
+    parser.add_argument('--capacity', type=int, default=40, help='bucket size (40 standard, 400 Plus)')
+    parser.add_argument('--leak-rate', type=float, help='calls per second (default capacity/20); 0 disables throttling')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='delay added to every answer')
+    parser.add_argument('--bulk-polls', type=int, default=1, help='status polls before a bulk operation completes')
+    args = parser.parse_args()
+
+    if args.fixtures:
+        with open(args.fixtures) as handle:
+            fixtures = json.load(handle)
+    else:
+        fixtures = generate_fixtures(args.products, args.customers, args.orders)
+    if args.dump_fixtures:
+        with open(args.dump_fixtures, 'w') as handle:
+            json.dump(fixtures, handle)
+        return
+    shop = StubShop(fixtures, capacity=args.capacity, leak_rate=args.leak_rate, latency=args.latency_ms / 1000.0,
+                    bulk_polls=args.bulk_polls)
+    server = make_server(shop, args.host, args.port)
+    print('Shopify stub listening on http://{}:{}'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
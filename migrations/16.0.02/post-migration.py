@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+# Campos binarios que shopify.product.image guardaba en sus propios adjuntos, por preferencia
+OLD_IMAGE_FIELDS = ('shopify_image', 'image')
+
+
+def migrate(cr, version):
+    """Move the images stored in the old binary fields to checksum-keyed attachments.
+
+    ``shopify_image`` used to be a stored binary; it is now computed from
+    ``attachment_id``. Each record gets the shared attachment of its old
+    content (one per checksum) and the old field attachments are removed.
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    Image = env['shopify.product.image']
+    old_attachments = env['ir.attachment'].search([
+        ('res_model', '=', Image._name),
+        ('res_field', 'in', OLD_IMAGE_FIELDS),
+    ])
+    by_record = {}
+    for attachment in old_attachments.sorted(lambda a: OLD_IMAGE_FIELDS.index(a.res_field)):
+        by_record.setdefault(attachment.res_id, attachment)
+
+    migrated = 0
+    for record in Image.browse(list(by_record)).exists():
+        if record.attachment_id:
+            continue
+        attachment = by_record[record.id]
+        content = attachment.raw
+        if not content:
+            continue
+        shared = Image._get_image_attachment(content, attachment.checksum, record.shopify_image_id,
+                                             mimetype=attachment.mimetype)
+        record.write({'attachment_id': shared.id, 'checksum': attachment.checksum})
+        migrated += 1
+    old_attachments.unlink()
+    _logger.info("WSSH %d imágenes de Shopify pasadas a adjuntos compartidos por checksum", migrated)
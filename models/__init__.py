@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from . import shopify_web
+from . import shopify_api_budget
+from . import shopify_api_metric
+from . import shopify_sync_state
 from . import res_partner
 from . import sale_order
 from . import product
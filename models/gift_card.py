@@ -1,10 +1,11 @@
 # create a class for gift card from shopify
-import requests
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 
 import logging
 
+from . import shopify_client
+
 _logger = logging.getLogger(__name__)
 
 
@@ -25,39 +26,22 @@ class GiftCard(models.Model):
     def import_gift_cards(self, shopify_instance_ids):
         if shopify_instance_ids == False:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
-        for shopify_instance_id in shopify_instance_ids:
-            url = self.get_card_url(shopify_instance_id, endpoint='gift_cards.json')
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token,
-            }
-            params = {
-                "limit": 250,  # Adjust the page size as needed
-                "page_info": None,
-                "status": "enabled"
-            }
+        return shopify_instance_ids._shopify_fan_out('gift.card', 'import_gift_cards_sub')
 
-            all_gift_cards = []
-            while True:
-                response = requests.get(url, headers=headers, params=params)
-                if response.status_code == 200 and response.content:
-                    gift_cards = response.json()
-                    cards = gift_cards.get('gift_cards', [])
-                    all_gift_cards.extend(cards)
-                    page_info = gift_cards.get('page_info', {})
-                    if 'has_next_page' in page_info and page_info['has_next_page']:
-                        params['page_info'] = page_info['next_page']
-                    else:
-                        break
-                else:
-                    break
+    def import_gift_cards_sub(self, shopify_instance_id):
+        params = {
+            "limit": 250,  # Adjust the page size as needed
+            "status": "enabled",
+            "fields": shopify_client.GIFT_CARD_FIELDS,
+        }
 
-            if all_gift_cards:
-                cards = self.create_gift_cards(all_gift_cards, shopify_instance_id)
-                return cards
-            else:
-                _logger.info("Gift Cards not found in shopify store")
-                return []
+        card_list = []
+        for cards in shopify_instance_id.shopify_iter_pages('gift_cards.json', 'gift_cards', params):
+            card_list.extend(self.create_gift_cards(cards, shopify_instance_id))
+
+        if not card_list:
+            _logger.info("Gift Cards not found in shopify store")
+        return card_list
 
     def get_card_url(self, shopify_instance_id, endpoint):
         shop_url = "https://{}.myshopify.com/admin/api/{}/{}".format(shopify_instance_id.shopify_host,
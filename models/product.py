@@ -1,19 +1,26 @@
 # -*- coding: utf-8 -*-
 import base64
 import datetime
+import hashlib
 import time
 import json
 
 import requests, re
+from dateutil import parser
+from pytz import utc
 from bs4 import BeautifulSoup
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
-from odoo.tools import config
-config['limit_time_real'] = 10000000
 import logging
 
+from . import shopify_client
+from .shopify_mapping_index import ShopifyExportPrefetch, ShopifyMappingIndex, ShopifyVariantResolver
+
 _logger = logging.getLogger(__name__)
 
+# Plantillas cuyas variantes, atributos y mapeos se cargan juntos al exportar
+EXPORT_PREFETCH_SIZE = 100
+
 # Mapeo de tallas con letras a valores numéricos para ordenación
 SIZE_MAPPING = {
     '4XS': 0,
@@ -90,6 +97,13 @@ class ProductProduct(models.Model):
         help='Mapeos entre el item inventory de Shopify y la variante en Odoo'
     )
 
+    shopify_image_id = fields.Many2one(
+        "shopify.product.image",
+        string="Shopify Image",
+        ondelete="set null",
+        help="Shopify image assigned to this variant"
+    )
+
     shopify_variant_map_ids = fields.One2many(
         "shopify.variant.map",
         "odoo_id",
@@ -113,6 +127,13 @@ class ProductTemplate(models.Model):
         string="Shopify Product Mappings",
         help="Mappings to Shopify products across multiple websites"
     )
+
+    shopify_image_ids = fields.One2many(
+        "shopify.product.image",
+        "shopify_template_id",
+        string="Shopify Images",
+        help="Images of the product in Shopify; each stores its bytes in a shared attachment"
+    )
     
     @api.model_create_multi
     def create(self, vals_list):
@@ -126,9 +147,18 @@ class ProductTemplate(models.Model):
                                                                      shopify_instance_id.shopify_version, endpoint)
         return shop_url
 
-    def import_shopify_products_sub(self, shopify_instance_id, skip_existing_products, from_date, to_date, sort_order="asc", stop_on_first_mapped=False):
+    def import_shopify_products_sub(self, shopify_instance_id, skip_existing_products, from_date, to_date, sort_order="asc",
+                                    stop_on_first_mapped=False, full_scan=False):
         """Fetch products from a single Shopify instance.
 
+        Without dates, in ascending order, the import is incremental: only the
+        products with ``updated_at`` after ``shopify_last_date_product_import``
+        are requested, oldest first, and the watermark advances after each
+        committed page. A full scan runs when there is no watermark yet, when
+        ``full_scan`` is set or while an interrupted full scan is pending.
+        Instances using the ``bulk`` engine run those imports through
+        :meth:`_import_shopify_products_bulk` instead.
+
         :param shopify_instance_id: Shopify instance record
         :param skip_existing_products: Whether to skip creation of products that already exist
         :param from_date: Start date for fetching products
@@ -137,71 +167,168 @@ class ProductTemplate(models.Model):
         :param stop_on_first_mapped: If ``True`` stop processing when the first
             product already mapped in Odoo is found. Useful when fetching in
             descending order to recreate missing mappings.
+        :param full_scan: If ``True`` page through the whole catalog instead of
+            the products updated since the watermark.
         """
         _logger.info("WSSH Starting product import for instance %s", shopify_instance_id.name)
 
-        url = self.get_products_url(shopify_instance_id, endpoint='products.json')
-        access_token = shopify_instance_id.shopify_shared_secret
-        headers = {
-            "X-Shopify-Access-Token": access_token,
-        }
-
         params = {
             "limit": 250,
-            "order": f"id {sort_order}",
-            "pageInfo": None,
+            # El emparejamiento usa el id y las variantes (sku, barcode); updated_at para la marca de agua e images para las imágenes
+            "fields": shopify_client.PRODUCT_IMPORT_FIELDS,
         }
 
+        # Solo las importaciones ascendentes sin fechas guardan punto de control o marca de agua:
+        # con fechas o en orden descendente ni since_id ni updated_at delimitan lo pendiente
+        checkpoint = sort_order == "asc" and not stop_on_first_mapped and not (from_date or to_date)
+        last_product_id = checkpoint and shopify_instance_id.shopify_last_import_product_id
+        watermark = checkpoint and shopify_instance_id.shopify_last_date_product_import
+        incremental = bool(watermark) and not full_scan and not last_product_id
+        if checkpoint and not last_product_id and shopify_instance_id.shopify_product_import_engine == 'bulk':
+            return self._import_shopify_products_bulk(
+                shopify_instance_id, skip_existing_products, watermark if incremental else False)
+        if incremental:
+            # updated_at_min es inclusivo: los productos del mismo segundo se reprocesan, sin huecos
+            params.update({
+                "updated_at_min": self._shopify_datetime(watermark),
+                "order": "updated_at asc",
+            })
+            _logger.info("WSSH Importación incremental de productos actualizados desde %s", watermark)
+        elif last_product_id:
+            # since_id ya devuelve los productos por id ascendente
+            params["since_id"] = last_product_id
+            _logger.info("WSSH Reanudando importación de productos desde el ID %s", last_product_id)
+        else:
+            params["order"] = f"id {sort_order}"
+            if checkpoint:
+                # La marca de agua pasa al inicio del recorrido solo cuando este termina: si se corta,
+                # la siguiente incremental no se salta lo modificado antes
+                shopify_instance_id.write_with_retry(
+                    shopify_instance_id, 'shopify_product_scan_started', fields.Datetime.now())
+
         if from_date and to_date:
             params.update({
                 "created_at_min": from_date,
                 "created_at_max": to_date,
             })
 
-        all_products = []
-        while True:
-            response = requests.get(url, headers=headers, params=params)
-
-            if response.status_code == 200 and response.content:
-                shopify_products = response.json()
-                products = shopify_products.get('products', [])
-                all_products.extend(products)
-                _logger.info("WSSH All products fetched : %d", len(all_products))
-                link_header = response.headers.get('Link')
-                if link_header:
-                    links = shopify_instance_id._parse_link_header(link_header)
-                    if 'next' in links:
-                        url = links['next']
-                        params = None
-                        continue
-            break
-
-        _logger.info("WSSH Total products fetched from Shopify: %d", len(all_products))
-
-        if all_products:
-            products = self._process_imported_products(
-                all_products,
+        product_list = []
+        fetched = 0
+        status = {}
+        index = ShopifyMappingIndex(self.env, shopify_instance_id)
+        for products in shopify_instance_id.shopify_iter_pages('products.json', 'products', params):
+            fetched += len(products)
+            product_list.extend(self._process_imported_products(
+                products,
                 shopify_instance_id,
                 skip_existing_products,
                 stop_on_first_mapped=stop_on_first_mapped,
+                status=status,
+                index=index,
+            ))
+            _logger.info("WSSH Products processed: %d", fetched)
+            if status.get('stopped'):
+                break
+            if incremental and products and products[-1].get('updated_at'):
+                # Confirma la página junto con la marca de agua para no volver a pedirla
+                shopify_instance_id.write_with_retry(
+                    shopify_instance_id, 'shopify_last_date_product_import',
+                    self._parse_shopify_datetime(products[-1]['updated_at']))
+            elif checkpoint and not incremental and products:
+                # Confirma la página junto con el punto de control para poder reanudar
+                shopify_instance_id.write_with_retry(
+                    shopify_instance_id, 'shopify_last_import_product_id', str(products[-1]['id']))
+
+        if checkpoint and not incremental:
+            self._finish_shopify_product_scan(shopify_instance_id)
+
+        if not fetched:
+            _logger.info("WSSH No products found in Shopify store for instance %s", shopify_instance_id.name)
+        return product_list
+
+    def _finish_shopify_product_scan(self, shopify_instance_id):
+        """Close a completed full scan: its start becomes the watermark and the checkpoint is cleared.
+
+        Each value is committed on its own, in an order that lets a run
+        interrupted in between finish the same scan again.
+        """
+        scan_started = shopify_instance_id.shopify_product_scan_started
+        if scan_started:
+            # Lo actualizado durante el recorrido completo lo recoge la siguiente ejecución incremental
+            shopify_instance_id.write_with_retry(shopify_instance_id, 'shopify_last_date_product_import', scan_started)
+        if shopify_instance_id.shopify_last_import_product_id:
+            shopify_instance_id.write_with_retry(shopify_instance_id, 'shopify_last_import_product_id', False)
+        if scan_started:
+            shopify_instance_id.write_with_retry(shopify_instance_id, 'shopify_product_scan_started', False)
+
+    def _import_shopify_products_bulk(self, shopify_instance_id, skip_existing_products, watermark=False):
+        """Import products through a GraphQL bulk operation instead of REST pages.
+
+        The JSONL result is streamed and handed to
+        :meth:`_process_imported_products` in chunks of 250 products, so
+        memory stays bounded whatever the catalog size. Products without
+        any SKU or barcode cannot be matched and are dropped while parsing.
+        Products come by ascending id and each chunk is committed with
+        ``shopify_last_import_product_id``, so an interrupted run is resumed
+        by the REST engine from the last committed product, as a full scan
+        started when the operation was submitted. On success the watermark
+        moves to that time.
+
+        :param watermark: only products updated since this UTC datetime
+            (incremental run); ``False`` exports the whole catalog
+        """
+        client = shopify_instance_id._get_shopify_client()
+        shopify_instance_id.write_with_retry(
+            shopify_instance_id, 'shopify_product_scan_started', fields.Datetime.now())
+        query = shopify_client.bulk_products_query(fields.Datetime.to_datetime(watermark) if watermark else None)
+        _logger.info("WSSH Importación bulk de productos para %s (%s)", shopify_instance_id.name,
+                     "desde %s" % watermark if watermark else "catálogo completo")
+        operation = client.run_bulk_query(query)
+
+        product_list = []
+        fetched = 0
+        if operation.get('url'):
+            index = ShopifyMappingIndex(self.env, shopify_instance_id)
+            products = (
+                product for product in shopify_client.iter_bulk_products(shopify_client.iter_bulk_lines(operation['url']))
+                if any(v.get('sku') or v.get('barcode') for v in product['variants'])
             )
-            return products
-        else:
+            for page in shopify_client.chunked(products, 250):
+                fetched += len(page)
+                product_list.extend(self._process_imported_products(
+                    page, shopify_instance_id, skip_existing_products, index=index))
+                _logger.info("WSSH Products processed: %d", fetched)
+                # Confirma el bloque junto con el punto de control, como cada página REST
+                shopify_instance_id.write_with_retry(
+                    shopify_instance_id, 'shopify_last_import_product_id', str(page[-1]['id']))
+        self._finish_shopify_product_scan(shopify_instance_id)
+        if not fetched:
             _logger.info("WSSH No products found in Shopify store for instance %s", shopify_instance_id.name)
-            return []
+        return product_list
+
+    @staticmethod
+    def _shopify_datetime(value):
+        """Format an Odoo UTC datetime for Shopify ``*_at_min`` filters."""
+        return fields.Datetime.to_datetime(value).strftime('%Y-%m-%dT%H:%M:%S+00:00')
 
-    def import_shopify_products(self, shopify_instance_ids, skip_existing_products, from_date, to_date, stop_on_first_mapped=False):
+    @staticmethod
+    def _parse_shopify_datetime(value):
+        """Convert a Shopify timestamp (with offset) to a naive UTC datetime."""
+        return parser.isoparse(value).astimezone(utc).replace(tzinfo=None)
+
+    def import_shopify_products(self, shopify_instance_ids, skip_existing_products, from_date, to_date,
+                                stop_on_first_mapped=False, full_scan=False):
         if not shopify_instance_ids:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
-        for shopify_instance_id in shopify_instance_ids:
-            return self.import_shopify_products_sub(
-                shopify_instance_id,
-                skip_existing_products,
-                from_date,
-                to_date,
-                sort_order="asc",
-                stop_on_first_mapped=stop_on_first_mapped,
-            )
+        return shopify_instance_ids._shopify_fan_out(
+            'product.template', 'import_shopify_products_sub',
+            skip_existing_products,
+            from_date,
+            to_date,
+            sort_order="asc",
+            stop_on_first_mapped=stop_on_first_mapped,
+            full_scan=full_scan,
+        )
 
     def _process_imported_products(
         self,
@@ -209,74 +336,59 @@ class ProductTemplate(models.Model):
         shopify_instance_id,
         skip_existing_products,
         stop_on_first_mapped=False,
+        status=None,
+        index=None,
     ):
-        """Process the list of Shopify products fetched for import."""
+        """Process the list of Shopify products fetched for import.
+
+        :param status: optional dict; ``status['stopped']`` is set when
+            ``stop_on_first_mapped`` ends the processing early, so the caller
+            stops fetching further pages.
+        :param index: :class:`ShopifyMappingIndex` of the instance, shared
+            by the pages of one import; built here when not given.
+        """
         product_list = []
+        if index is None:
+            index = ShopifyMappingIndex(self.env, shopify_instance_id)
+        # Cambio: Verificar si la instancia usa split por color
+        split_by_color = shopify_instance_id.split_products_by_color
+        # Candidatos de todas las variantes de la página en una sola consulta
+        resolver = ShopifyVariantResolver(self.env, shopify_instance_id, variant_map=index.variants,
+                                          domain=[('type', '=', 'product')])
+        page_variants = [v for p in shopify_products for v in p.get('variants', [])]
+        resolver.load(
+            variant_ids=[v.get('id') for v in page_variants],
+            skus=[v.get('sku') for v in page_variants],
+            barcodes=[v.get('barcode') for v in page_variants],
+        )
         for shopify_product in shopify_products:
             _logger.info("WSSH Processing Shopify product ID: %s", shopify_product.get('id'))
             shopify_product_id = shopify_product.get('id')
-            
-            # Cambio: Verificar si la instancia usa split por color
-            split_by_color = shopify_instance_id.split_products_by_color
-            
-            if split_by_color:
-                # Buscar si el producto ya existe en Odoo por shopify_product_id en product.template.attribute.value          
-                existing_attribute_value = self.env['product.template.attribute.value'].sudo().search([
-                    ('shopify_product_map_ids.web_product_id', '=', shopify_product_id),
-                    ('shopify_product_map_ids.shopify_instance_id', '=', shopify_instance_id.id),
-                ], limit=1)
-                
-                if existing_attribute_value:
-                    # Si el producto ya existe, no hacer nada
-                    _logger.info(
-                        f"WSSH Product with Shopify ID {shopify_product_id} already exists in Odoo for instance {shopify_instance_id.name}."
-                    )
-                    product_list.append(existing_attribute_value.product_tmpl_id.id)
-                    if stop_on_first_mapped:
-                        return product_list
-                    continue
-            else:
-                # Cambio: Buscar en shopify.product.template.map para modo sin split
-                existing_template_map = self.env['shopify.product.template.map'].sudo().search([
-                    ('web_product_id', '=', shopify_product_id),
-                    ('shopify_instance_id', '=', shopify_instance_id.id),
-                ], limit=1)
-                if existing_template_map:
-                    _logger.info(
-                        f"WSSH Product with Shopify ID {shopify_product_id} already exists in Odoo for instance {shopify_instance_id.name}."
-                    )
-                    product_list.append(existing_template_map.odoo_id.id)
-                    if stop_on_first_mapped:
-                        return product_list
-                    continue
+
+            # Producto ya mapeado: por valor de color en modo split, por plantilla en modo sin split
+            mapped_template_id = index.mapped_template_id(shopify_product_id, split_by_color)
+            if mapped_template_id:
+                _logger.info(
+                    f"WSSH Product with Shopify ID {shopify_product_id} already exists in Odoo for instance {shopify_instance_id.name}."
+                )
+                product_list.append(mapped_template_id)
+                if stop_on_first_mapped:
+                    if status is not None:
+                        status['stopped'] = True
+                    return product_list
+                self._sync_imported_product_images(mapped_template_id, shopify_product, shopify_instance_id)
+                continue
             
             # Si no existe, buscar por las variantes (shopify_variant_id o default_code)
+            unmapped_variants = self.env['product.product']
+            matched_template_id = None
             for variant in shopify_product.get('variants', []):
                 shopify_variant_id = variant.get('id')
-
-                final_search_domain = [('type', '=', 'product')]
-
                 sku_value = variant.get('sku')
                 barcode_value = variant.get('barcode')
-                
-                if sku_value or barcode_value:
-                    final_search_domain.append('|')
-                    
-                final_search_domain.append(('shopify_variant_map_ids.web_variant_id', '=', shopify_variant_id))
-
-                if sku_value and barcode_value:
-                    final_search_domain.append('|')
-                
-                if sku_value:
-                    final_search_domain.append(('default_code', '=', sku_value))
-                    
-                if barcode_value:
-                    final_search_domain.append(('barcode', '=', barcode_value))
-
-                _logger.info(f"WSSH Final search domain for variant ID {shopify_variant_id}: {final_search_domain}")
 
-                # Buscar por las condiciones construidas
-                existing_variant = self.env['product.product'].sudo().search(final_search_domain, limit=1)
+                existing_variant = self.env['product.product'].sudo().browse(
+                    resolver.resolve(shopify_variant_id, sku_value, barcode_value))
                 
                 if existing_variant:
                     if split_by_color:
@@ -285,43 +397,22 @@ class ProductTemplate(models.Model):
                             lambda v: v.attribute_id.name.lower() == 'color'
                         )
                         if color_values:
-                            color_map = color_values.shopify_product_map_ids.filtered(
-                                lambda m: m.shopify_instance_id == shopify_instance_id)
-                            if not color_map:
-                                self.env['shopify.product.map'].create({
-                                    'web_product_id': shopify_product_id,
-                                    'odoo_id': color_values[0].id,
-                                    'shopify_instance_id': shopify_instance_id.id,
-                                })
-                            elif color_map.web_product_id != shopify_product_id:
-                                color_map.write({'web_product_id': shopify_product_id})
+                            index.set_color_value(color_values[0].id, existing_variant.product_tmpl_id.id,
+                                                  shopify_product_id)
                             for template_value in color_values:
                                 _logger.info(f"WSSH Updated color attribute value {template_value.name} with Shopify ID {shopify_product_id} for instance {shopify_instance_id.name}.")                           
                     else:
                         # Cambio: Crear o actualizar mapa para product.template en modo sin split
-                        template_map = self.env['shopify.product.template.map'].sudo().search([
-                            ('odoo_id', '=', existing_variant.product_tmpl_id.id),
-                            ('shopify_instance_id', '=', shopify_instance_id.id),
-                        ], limit=1)
-                        if not template_map:
-                            self.env['shopify.product.template.map'].create({
-                                'web_product_id': shopify_product_id,
-                                'odoo_id': existing_variant.product_tmpl_id.id,
-                                'shopify_instance_id': shopify_instance_id.id,
-                            })
-                        elif template_map.web_product_id != shopify_product_id:
-                            template_map.write({'web_product_id': shopify_product_id})
+                        index.templates.set(existing_variant.product_tmpl_id.id, shopify_product_id)
                     
                     # Verificar si existe el mapping de variante para el producto
-                    variant_map = existing_variant.shopify_variant_map_ids.filtered(
-                        lambda m: m.shopify_instance_id == shopify_instance_id)
-                    if not variant_map:
-                        # Si no existe, aprovechamos el método ya existente para crear tanto
-                        # el mapping de variante como el de stock.
-                        self._update_variant_ids([existing_variant], shopify_product.get('variants', []), shopify_instance_id)
+                    if not index.variants.web_id(existing_variant.id):
+                        # Si no existe, se crea al final del producto junto con el de stock
+                        unmapped_variants |= existing_variant
       
                     _logger.info(f"WSSH Updated existing product template {existing_variant.product_tmpl_id.name} with Shopify ID {shopify_product_id}.")
                     product_list.append(existing_variant.product_tmpl_id.id)
+                    matched_template_id = matched_template_id or existing_variant.product_tmpl_id.id
                 else:
                     _logger.info("WSSH No matching product found for Shopify Variant ID: %s or SKU: %s", shopify_variant_id, sku_value)
             else:
@@ -332,9 +423,23 @@ class ProductTemplate(models.Model):
                     #product_template = self._create_product_from_shopify(shopify_product, shopify_instance_id, split_by_color)
                     #if product_template:
                     #    product_list.append(product_template.id)
+
+            if unmapped_variants:
+                # Aprovechamos el método ya existente para crear en lote tanto
+                # los mappings de variante como los de stock del producto.
+                self._update_variant_ids(unmapped_variants, shopify_product.get('variants', []), shopify_instance_id,
+                                         index=index)
+            # Con los mapeos de variante ya creados, las imágenes de variante encuentran su destino
+            self._sync_imported_product_images(matched_template_id, shopify_product, shopify_instance_id)
         
         return product_list
 
+    def _sync_imported_product_images(self, template_id, shopify_product, shopify_instance_id):
+        """Sync the images of an imported product matched to ``template_id``, if the payload lists them."""
+        images = shopify_product.get('images')
+        if template_id and images:
+            self.sync_product_images(self.sudo().browse(template_id), images, shopify_instance_id)
+
     def _create_product_from_shopify(self, shopify_product, shopify_instance_id, split_by_color=False):  # Cambio: Añadir parámetro split_by_color
         """Crea un producto en Odoo a partir de un producto de Shopify."""
         tags = shopify_product.get('tags')
@@ -396,161 +501,283 @@ class ProductTemplate(models.Model):
         return product_template
 
 
-    def sync_simple_product_images(self, shopify_image_id, url, product_id,position):
-        try:
-            response = requests.get(url, stream=True, verify=True, timeout=90)
-            if response.status_code == 200:
-                image = base64.b64encode(response.content)
-                if position == 1:
-                    product_id.sudo().write({'image_1920': image})
-                shopify_pdt_image = self.env['shopify.product.image'].sudo().search(
-                    [('shopify_image_id', '=', shopify_image_id)], limit=1)
-                image_vals = {
-                    'shopify_image_id': shopify_image_id,
-                    'shopify_image': image,
-                    'shopify_template_id': product_id.id,
-                    'url': url
-                }
-                if not shopify_pdt_image:
-                    shopify_pdt_image = self.env['shopify.product.image'].sudo().create(image_vals)
-                else:
-                    shopify_pdt_image.sudo().write(image_vals)
-        except Exception as error:
-            pass
+    def _download_image(self, url, headers=None):
+        """Download ``url``; return the response or ``None`` (no ORM access).
 
-    def sync_variable_product_images(self, shopify_image_id, url, variant_ids):
+        :param headers: conditional headers (``If-None-Match``,
+            ``If-Modified-Since``) so unchanged images answer 304 without body.
+        """
         try:
-            response = requests.get(url, stream=True, verify=True, timeout=90)
-            if response.status_code == 200:
-                image = base64.b64encode(response.content)
-                for variant_id in variant_ids:
-                    product_id = self.env['product.product'].sudo().search([('shopify_variant_id', '=', variant_id)])
-                    product_id.sudo().write({'image_1920': image})
-                    shopify_pdt_image = self.env['shopify.product.image'].sudo().search(
-                        [('shopify_image_id', '=', shopify_image_id)], limit=1)
-                    image_vals = {
-                        'shopify_image_id': shopify_image_id,
-                        'shopify_image': image,
-                        'shopify_variant_id': product_id.id,
-                        'shopify_template_id': product_id.product_tmpl_id.id,
-                        'url': url
-                    }
-                    if not shopify_pdt_image:
-                        shopify_pdt_image = self.env['shopify.product.image'].sudo().create(image_vals)
-                    else:
-                        shopify_pdt_image.sudo().write(image_vals)
+            return shopify_client.download(url, headers=headers)
         except Exception as error:
-            pass
+            _logger.warning("WSSH Error descargando imagen %s: %s", url, error)
+            return None
+
+    def sync_product_images(self, product_id, shopify_images, shopify_instance_id):
+        """Download all images of a Shopify product concurrently and store them.
+
+        Downloads are conditional on the ETag/Last-Modified stored in
+        ``shopify.product.image`` and a content checksum guards the writes, so
+        an unchanged image costs at most a 304 and never rewrites
+        ``image_1920``. Each variant group is encoded once and written with a
+        single ``write``.
+
+        :param product_id: product.template the images belong to
+        :param shopify_images: ``images`` list of the Shopify product
+        """
+        Image = self.env['shopify.product.image'].sudo()
+        existing = {
+            record.shopify_image_id: record
+            for record in Image.search([('shopify_image_id', 'in', [str(image.get('id')) for image in shopify_images])])
+        }
+        # Variantes de todas las imágenes con una sola consulta a los mapeos de la instancia
+        web_variant_ids = {str(v) for image in shopify_images for v in image.get('variant_ids') or []}
+        variant_by_web = {}
+        if web_variant_ids:
+            for row in self.env['shopify.variant.map'].sudo().search_read([
+                ('shopify_instance_id', '=', shopify_instance_id.id),
+                ('web_variant_id', 'in', list(web_variant_ids)),
+            ], ['web_variant_id', 'odoo_id'], load=None):
+                variant_by_web[row['web_variant_id']] = row['odoo_id']
+
+        downloads = [
+            (image, self._image_conditional_headers(existing.get(str(image.get('id')))))
+            for image in shopify_images
+        ]
+        responses = shopify_instance_id.shopify_map_concurrent(
+            lambda download: self._download_image(download[0].get('src'), headers=download[1]),
+            downloads,
+        )
+        for image, response in zip(shopify_images, responses):
+            if response is None:
+                continue
+            record = existing.get(str(image.get('id')))
+            if response.status_code == 304:
+                _logger.debug("WSSH Imagen %s sin cambios (304)", image.get('src'))
+                continue
+            if response.status_code != 200:
+                _logger.warning("WSSH Error %s descargando imagen %s", response.status_code, image.get('src'))
+                continue
+            try:
+                if image.get('variant_ids'):
+                    variants = self.env['product.product'].sudo().browse([
+                        variant_by_web[str(v)] for v in image['variant_ids'] if str(v) in variant_by_web
+                    ])
+                    if not variants:
+                        _logger.warning("WSSH Imagen %s: ninguna de sus variantes %s está mapeada",
+                                        image.get('id'), image['variant_ids'])
+                        continue
+                    self.sync_variable_product_images(image.get('id'), image.get('src'), variants, response,
+                                                      image_record=record)
+                else:
+                    self.sync_simple_product_images(image.get('id'), image.get('src'), product_id,
+                                                    image.get('position'), response, image_record=record)
+            except Exception as error:
+                _logger.exception("WSSH Error guardando imagen %s de %s: %s", image.get('id'), product_id.name, error)
+
+    @staticmethod
+    def _image_conditional_headers(image_record):
+        headers = {}
+        if image_record and image_record.etag:
+            headers['If-None-Match'] = image_record.etag
+        if image_record and image_record.last_modified:
+            headers['If-Modified-Since'] = image_record.last_modified
+        return headers
+
+    def _store_shopify_image(self, shopify_image_id, url, response, targets, image_record, extra_vals):
+        """Store a downloaded image once and show it on ``targets``.
+
+        The bytes live in one ``ir.attachment`` per checksum, shared by every
+        ``shopify.product.image`` with the same content. ``image_1920`` is only
+        written on the targets not already showing that image, in one write.
+        Only the validators are updated when the content checksum matches the
+        stored one. Returns ``True`` when the image bytes were written.
+        """
+        Image = self.env['shopify.product.image'].sudo()
+        checksum = hashlib.sha1(response.content).hexdigest()
+        image_vals = {
+            'shopify_image_id': str(shopify_image_id),
+            'url': url,
+            'etag': response.headers.get('ETag') or False,
+            'last_modified': response.headers.get('Last-Modified') or False,
+            'checksum': checksum,
+        }
+        image_vals.update(extra_vals)
+        if image_record and image_record.checksum == checksum and image_record.attachment_id:
+            changed = {k: v for k, v in image_vals.items()
+                       if k not in ('shopify_variant_id', 'shopify_template_id') and image_record[k] != v}
+            if changed:
+                image_record.write(changed)
+            return False
+        image_vals['attachment_id'] = Image._get_image_attachment(
+            response.content, checksum, shopify_image_id,
+            mimetype=response.headers.get('Content-Type', '').split(';')[0] or None).id
+        if image_record:
+            image_record.write(image_vals)
+        else:
+            image_record = Image.create(image_vals)
+        if targets and targets._name == 'product.product':
+            targets.filtered(lambda v: v.shopify_image_id != image_record).write({'shopify_image_id': image_record.id})
+        if targets:
+            targets -= Image._unchanged_image_targets(targets, checksum)
+        if targets:
+            # Una sola codificación compartida por todos los destinos
+            targets.write({'image_1920': base64.b64encode(response.content)})
+        return True
+
+    def _image_download(self, url, response):
+        """Return ``response``, downloading ``url`` when it is not given; ``None`` unless it is a 200."""
+        if response is None:
+            response = self._download_image(url)
+        if response is None or response.status_code != 200:
+            return None
+        return response
+
+    def sync_simple_product_images(self, shopify_image_id, url, product_id, position, response=None, image_record=None):
+        """Store a product image; the main one (``position`` 1) is also shown on ``product_id``.
+
+        :param response: download of ``url`` already made by
+            :meth:`sync_product_images`; fetched here when not given
+        """
+        response = self._image_download(url, response)
+        if response is None:
+            return False
+        # Solo la imagen principal pasa a la plantilla
+        targets = product_id.sudo() if position == 1 else None
+        return self._store_shopify_image(shopify_image_id, url, response, targets, image_record, {
+            'shopify_template_id': product_id.id,
+        })
+
+    def sync_variable_product_images(self, shopify_image_id, url, variant_ids, response=None, image_record=None):
+        """Store an image of a group of variants and show it on them.
+
+        :param variant_ids: ``product.product`` records, or the Shopify
+            variant ids of the image, resolved through ``shopify.variant.map``
+        :param response: as in :meth:`sync_simple_product_images`
+        """
+        variants = variant_ids
+        if not isinstance(variants, models.BaseModel):
+            variants = self.env['shopify.variant.map'].sudo().search([
+                ('web_variant_id', 'in', [str(v) for v in variant_ids]),
+            ]).mapped('odoo_id')
+        if not variants:
+            return False
+        response = self._image_download(url, response)
+        if response is None:
+            return False
+        return self._store_shopify_image(shopify_image_id, url, response, variants, image_record, {
+            'shopify_variant_id': variants[0].id,
+            'shopify_template_id': variants[0].product_tmpl_id.id,
+        })
 
     def update_stock(self, shopify_instance_ids):
-        location_ids = self.get_locations()
         if shopify_instance_ids == False:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
-        for shopify_instance_id in shopify_instance_ids:
-            url = self.get_inventory_url(shopify_instance_id, endpoint='inventory_levels.json')
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token,
-            }
+        return shopify_instance_ids._shopify_fan_out('product.template', 'update_stock_sub')
 
-            params = {
-                "limit": 250,  # Adjust the page size as needed
-                "pageInfo": None,
-                "location_ids": location_ids
-            }
-            all_inventory_levels = []
-            while True:
-                response = requests.get(url, headers=headers, params=params)
-                if response.status_code == 200 and response.content:
-                    inv_levels = response.json()
-                    levels = inv_levels.get('inventory_levels', [])
-                    all_inventory_levels.extend(levels)
-                    page_info = inv_levels.get('page_info', {})
-                    if 'has_next_page' in page_info and page_info['has_next_page']:
-                        params['page_info'] = page_info['next_page']
-                    else:
-                        break
-                else:
-                    break
-            if all_inventory_levels:
-                updated_products = self.update_product_stock(all_inventory_levels, shopify_instance_id)
-                return updated_products
-            else:
-                _logger.info("Inventory Levels not found in shopify store")
-                return []
+    def update_stock_sub(self, shopify_instance_id):
+        """Import the inventory levels of one instance's locations into Odoo stock."""
+        params = {
+            "limit": 250,  # Adjust the page size as needed
+            "location_ids": self.get_locations(shopify_instance_id)
+        }
+        updated_products = []
+        processed_products = set()
+        for levels in shopify_instance_id.shopify_iter_pages('inventory_levels.json', 'inventory_levels', params):
+            updated_products.extend(
+                self.update_product_stock(levels, shopify_instance_id, processed_products)
+            )
+        if not updated_products:
+            _logger.info("Inventory Levels not found in shopify store")
+        return updated_products
 
     def get_inventory_url(self, shopify_instance_id, endpoint):
         shop_url = "https://{}.myshopify.com/admin/api/{}/{}".format(shopify_instance_id.shopify_host,
                                                                      shopify_instance_id.shopify_version, endpoint)
         return shop_url
 
-    def update_product_stock(self, levels, shopify_instance_id):
+    def update_product_stock(self, levels, shopify_instance_id, processed_products=None):
+        """Apply one page of Shopify inventory levels to Odoo stock.
+
+        :param processed_products: set of product ids already updated by
+            previous pages of the same run; only the first level found for
+            each product is applied.
+        """
+        if processed_products is None:
+            processed_products = set()
         stock_inventory_obj = self.env["stock.quant"]
         stock_inventory_name_obj = self.env["stock.inventory.adjustment.name"]
         warehouse_id = self.env['stock.warehouse'].sudo().search([('id', '=', 1)], limit=1)
 
         product_list = []
         stock_inventory_array = {}
-        product_ids_list = []
-        for level in levels:
-            end_url = "inventory_items/{}.json".format(level.get('inventory_item_id'))
-            url = self.get_inventory_url(shopify_instance_id, endpoint=end_url)
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token,
-            }
-            params = {
-                "limit": 250,  # Adjust the page size as needed
-            }
-
-            response = requests.get(url, headers=headers, params=params)
-            if response.status_code == 200 and response.content:
-                inv_item = response.json()
-                item = inv_item.get('inventory_item', [])
-                if item.get('sku'):
-                    product = self.env['product.product'].sudo().search(
-                        [('default_code', '=', item.get('sku'))], limit=1)
-                    if product and level.get('available') != None and product not in product_ids_list:
-                        stock_inventory_line = {
-                            product.id: level.get('available'),
-                        }
-                        stock_inventory_array.update(stock_inventory_line)
-                        product_ids_list.append(product)
-                        product_list.append(product.id)
+        client = shopify_instance_id._get_shopify_client()
+        # Un GET de inventory_item por nivel, lanzados en paralelo y devueltos en orden
+        items = shopify_instance_id.shopify_map_concurrent(
+            lambda level: self._fetch_inventory_item(client, level.get('inventory_item_id')),
+            levels,
+        )
+        resolver = ShopifyVariantResolver(self.env, shopify_instance_id)
+        resolver.load(skus=[item.get('sku') for item in items if item])
+        for level, item in zip(levels, items):
+            if item and item.get('sku'):
+                product = self.env['product.product'].sudo().browse(resolver.resolve(sku=item.get('sku')))
+                if product and level.get('available') != None and product.id not in processed_products:
+                    stock_inventory_line = {
+                        product.id: level.get('available'),
+                    }
+                    stock_inventory_array.update(stock_inventory_line)
+                    processed_products.add(product.id)
+                    product_list.append(product.id)
         inventory_name = 'Inventory For Instance "%s"' % (shopify_instance_id.name)
         inventories = stock_inventory_obj.create_inventory_adjustment_ept(stock_inventory_array,
                                                                           warehouse_id.lot_stock_id, True,
                                                                           inventory_name)
         return product_list
 
-    def get_locations(self):
-        locations = self.env['shopify.location'].sudo().search([('is_shopify', '=', True)])
+    def _fetch_inventory_item(self, client, inventory_item_id):
+        """Return the Shopify inventory item dict, or ``None`` (no ORM access)."""
+        response = client.get("inventory_items/{}.json".format(inventory_item_id),
+                              params={'fields': shopify_client.INVENTORY_ITEM_FIELDS})
+        if response.status_code == 200 and response.content:
+            return response.json().get('inventory_item')
+        return None
+
+    def get_locations(self, shopify_instance_id=None):
+        domain = [('is_shopify', '=', True)]
+        if shopify_instance_id:
+            # Solo las ubicaciones de la tienda consultada
+            domain.append(('shopify_instance_id', '=', shopify_instance_id.id))
+        locations = self.env['shopify.location'].sudo().search(domain)
         loc_ids = ','.join(str(loc.shopify_location_id) for loc in locations) if locations else ''
         return loc_ids
 
-    def _iter_export_items(self, products, split_by_color):
-        """Yield (product, color_value) pairs for export.
+    def _iter_export_items(self, products, instance_id):
+        """Yield (product, color_value, prefetch) triples for export.
 
-        If ``split_by_color`` is True and the product contains a color attribute,
-        each color value is returned separately. Otherwise ``color_value`` will be
-        ``None`` and the caller should treat the product as a single item.
+        Products are read in chunks of ``EXPORT_PREFETCH_SIZE``, each with its
+        :class:`ShopifyExportPrefetch`. If the instance splits products by
+        color and the product contains a color attribute, each color value is
+        returned separately. Otherwise ``color_value`` will be ``None`` and the
+        caller should treat the product as a single item.
         """
-        for product in products:
-            if split_by_color:
-                color_line = product.attribute_line_ids.filtered(
-                    lambda l: l.attribute_id.name.lower() == 'color'
-                )
-                if color_line:
-                    for value in color_line.product_template_value_ids:
-                        yield product, value
-                    continue
-            yield product, None
+        for start in range(0, len(products), EXPORT_PREFETCH_SIZE):
+            chunk = products[start:start + EXPORT_PREFETCH_SIZE]
+            prefetch = ShopifyExportPrefetch(self.env, instance_id, chunk)
+            for product in chunk:
+                if instance_id.split_products_by_color:
+                    color_values = prefetch.color_values(product.id)
+                    if color_values:
+                        for value in color_values:
+                            yield product, value, prefetch
+                        continue
+                yield product, None, prefetch
 
-    def _get_option_attr_lines(self, product, instance_id):
-        """Return a mapping of Shopify option positions to attribute lines."""
-        attr_lines = list(product.attribute_line_ids)
-        color_line = next((l for l in attr_lines if l.attribute_id.name.lower() == 'color'), None)
-        size_line = next((l for l in attr_lines if l.attribute_id.name.lower() in ('size', 'talla')), None)
+    def _get_option_attr_lines(self, product, instance_id, prefetch):
+        """Return a mapping of Shopify option positions to attribute ids."""
+        attr_lines = [attribute_id for attribute_id, _value_ids in prefetch.lines[product.id]]
+        color_line = next((l for l in attr_lines if prefetch.attribute_name(l).lower() == 'color'), None)
+        size_line = next((l for l in attr_lines if prefetch.attribute_name(l).lower() in ('size', 'talla')), None)
         other_lines = [l for l in attr_lines if l not in (color_line, size_line)]
 
         pos_map = {}
@@ -567,7 +794,11 @@ class ProductTemplate(models.Model):
     def export_products_to_shopify(self, shopify_instance_ids, update=False, products=None, create_new=True):
         """
         Exporta productos a Shopify, filtrando por aquellos modificados desde la última exportación.
+
+        Cada ejecución toma productos mientras quepan en su presupuesto de tiempo
+        (:class:`RunBudget`); los restantes quedan para la siguiente.
         """
+        run_started = time.monotonic()
         color_attribute = None
         for attr in self.env['product.attribute'].search([]):
             if attr.name and attr.name.lower().find('color') != -1:
@@ -577,7 +808,9 @@ class ProductTemplate(models.Model):
         if not shopify_instance_ids:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
             
-        for instance_id in shopify_instance_ids:
+        for instance_index, instance_id in enumerate(shopify_instance_ids):
+            if not instance_id._shopify_circuit_allows():
+                continue
             # Verificar que el último producto relevante de Shopify esté mapeado
             try:
                 mapping_ok = self._check_last_shopify_product_map(instance_id)
@@ -625,418 +858,468 @@ class ProductTemplate(models.Model):
                 _logger.info("WSSH No products to export for instance %s", instance_id.name)
                 continue
 
-            headers = {
-                "X-Shopify-Access-Token": instance_id.shopify_shared_secret,
-                "Content-Type": "application/json"
-            }
-
-            # Control de tiempo máximo para la exportación
-
-            time_limit = getattr(instance_id, 'product_export_timeout', 300) or 300
-
-            start_time = time.time()
+            client = instance_id._get_shopify_client()
 
+            # El tiempo del worker se reparte entre las instancias que faltan, para que una
+            # instancia con mucha cola no deje sin turno a las siguientes
+            budget = self.env['shopify.sync.state']._get_run_budget(
+                instance_id, 'product_export', instance_id.product_export_timeout, time.monotonic() - run_started,
+                instances_left=len(shopify_instance_ids) - instance_index)
             processed_count = 0
-            max_processed = 100  # Limitar a 100 productos exportados por ejecución
-            last_request_time = time.time() - 1  # Para permitir la primera llamada inmediata
-            timeout_reached = False
-
-            for product, color_value in self._iter_export_items(products_to_export, instance_id.split_products_by_color):
-                # Verificar timeout global de exportación
-                elapsed_global = time.time() - start_time
-                if elapsed_global > time_limit:
-                    _logger.info(
-                        "WSSH Tiempo límite alcanzado (%.1fs de %ss) para instancia %s",
-                        elapsed_global,
-                        time_limit,
-                        instance_id.name,
-                    )
-                    timeout_reached = True
-                    break
+            budget_exhausted = False
+
+            with self.env['shopify.sync.state']._get_checkpoint(instance_id, 'product_export') as checkpoint:
+                stop_export = False
+                export_error = None
+                in_flight = 0
+                templates_seen = set()
+
+                def export_jobs():
+                    # Se construyen en el cursor principal mientras se envían los anteriores
+                    nonlocal budget_exhausted, in_flight
+                    for product, color_value, prefetch in self._iter_export_items(products_to_export, instance_id):
+                        if stop_export:
+                            return
+                        # Solo se corta entre plantillas, para no dejar colores de un producto a medias
+                        if product.id not in templates_seen:
+                            if not budget.allows(in_flight):
+                                _logger.info(
+                                    "WSSH Presupuesto agotado (%.1fs de %.0fs, %.2fs por elemento) para instancia %s",
+                                    budget.elapsed(), budget.seconds, budget.item_seconds, instance_id.name)
+                                budget_exhausted = True
+                                return
+                            templates_seen.add(product.id)
+                        job = self._prepare_shopify_export_job(
+                            product, color_value, prefetch, instance_id, update, create_new, products)
+                        if job:
+                            budget.tick()
+                        else:
+                            # Sin cambios: no cuenta en el coste medio por elemento enviado
+                            budget.skip()
+                        in_flight += 1
+                        # Los elementos sin cambios también pasan, para que el checkpoint avance en orden
+                        yield job or {'product': product, 'method': None}
+
+                # Plantilla en curso: el checkpoint solo avanza cuando todos sus colores se aplicaron
+                current_template_id = None
+                for job, result in instance_id.shopify_pipeline(
+                        lambda job: self._send_shopify_export_job(client, job), export_jobs()):
+                    in_flight -= 1
+                    if job['product'].id != current_template_id:
+                        if current_template_id and not export_error:
+                            checkpoint.advance(current_template_id)
+                        current_template_id = job['product'].id
+                    try:
+                        # Un fallo descarta sus escrituras a medias antes de que el checkpoint haga commit
+                        with self.env.cr.savepoint():
+                            product_processed = self._apply_shopify_export_job(client, instance_id, job, result)
+                    except Exception as e:
+                        # Las respuestas ya en curso se siguen aplicando para no perder sus mapeos,
+                        # pero el checkpoint queda antes del producto que falló
+                        export_error = export_error or e
+                        stop_export = True
+                        continue
 
-                product_processed = False
+                    if product_processed:
+                        processed_count += 1
+
+                if export_error:
+                    raise export_error
+                if current_template_id:
+                    checkpoint.advance(current_template_id)
+                _logger.info("WSSH Exportados %d productos para instancia %s", processed_count, instance_id.name)
+                items_per_template = budget.items / len(templates_seen) if templates_seen else 1
+                checkpoint.report(budget.drain_estimate(
+                    round((product_count - len(templates_seen)) * items_per_template) if budget_exhausted else 0))
+                if not budget_exhausted:
+                    # Se procesaron todos los productos pendientes: actualizar fecha y resetear ID.
+                    # Si la ejecución se cortó, la fecha no cambia y la siguiente sigue desde el ID guardado
+                    checkpoint.finish(export_update_time)
+
+    def _prepare_shopify_export_job(self, product, color_value, prefetch, instance_id, update, create_new, products):
+        """Build the payload of one export item on the ORM cursor.
+
+        Returns the job sent by :meth:`_send_shopify_export_job` and applied
+        by :meth:`_apply_shopify_export_job`, or ``None`` when the item has
+        nothing to send.
+        """
+        if color_value:
+            _logger.info(f"WSSH Exporta color {color_value.name} for product {product.id}")
+        else:
+            _logger.info(f"WSSH Exporta no split v2 para id {product.id}")
 
-                if color_value:
-                    _logger.info(f"WSSH Exporta color {color_value.name} for product {product.id}")
-                else:
-                    _logger.info(f"WSSH Exporta no split v2 para id {product.id}")
+        # Filtrar variantes según corresponda
+        variant_rows = prefetch.export_variants(product.id, color_value.id if color_value else None)
+        variants = self.env['product.product'].browse([row['id'] for row in variant_rows])
 
-                response = None
-                # Filtrar variantes según corresponda
-                variants = product.product_variant_ids.filtered(
-                    lambda v: (color_value in v.product_template_attribute_value_ids if color_value else True)
-                              and v.barcode
-                )
+        if not variants and products is None:
+            name = color_value.name if color_value else 'N/A'
+            _logger.info(f"WSSH No hay variantes con codigo {name}")
+            return None
 
-                if not variants and products is None:
-                    name = color_value.name if color_value else 'N/A'
-                    _logger.info(f"WSSH No hay variantes con codigo {name}")
-                    continue
+        # Verificar si hay nuevas variantes sin mapeo
+        new_variants = variants.browse([row['id'] for row in variant_rows if row['id'] not in prefetch.variant_maps])
 
-                # Verificar si hay nuevas variantes sin mapeo
-                new_variants = variants.filtered(
-                    lambda v: not v.shopify_variant_map_ids.filtered(lambda m: m.shopify_instance_id == instance_id)
-                )
+        # CORREGIDO: Usar el método existente para obtener option_attr_lines correctamente
+        base_option_attr_lines = self._get_option_attr_lines(product, instance_id, prefetch)
 
-                # CORREGIDO: Usar el método existente para obtener option_attr_lines correctamente
-                base_option_attr_lines = self._get_option_attr_lines(product, instance_id)
-
-                # Obtener product_map antes del bucle de variantes
-                product_map = (
-                    color_value.shopify_product_map_ids if color_value else product.shopify_product_map_ids
-                ).filtered(lambda m: m.shopify_instance_id == instance_id)
-
-                # Preparar datos de variantes usando las líneas de atributos correctas
-                variant_data = []
-                for variant in variants:
-                    if variant.default_code:
-                        # CORREGIDO: Cada variante decide individualmente si es update o creación
-                        # basándose en si la variante específica ya existe en Shopify
-                        variant_map = variant.shopify_variant_map_ids.filtered(
-                            lambda m: m.shopify_instance_id == instance_id
-                        )
-                        variant_exists_in_shopify = bool(variant_map and variant_map.web_variant_id)
+        # Obtener product_map antes del bucle de variantes
+        product_map = prefetch.product_map(product.id, color_value.id if color_value else None)
 
-                        variant_result = self._prepare_shopify_variant_data(
-                            variant, instance_id, is_update=variant_exists_in_shopify
-                        )
-                        if variant_result:
-                            variant_data.append(variant_result)
-
-                # Ordenar variantes por talla si existe línea de talla
-                size_pos = instance_id.size_option_position
-                if size_pos in base_option_attr_lines:
-                    variant_data.sort(
-                        key=lambda v: get_size_value(
-                            v.get(f"option{size_pos}", "")
-                        )
-                    )
+        # Preparar datos de variantes usando las líneas de atributos correctas
+        variant_data = []
+        for variant in variant_rows:
+            if variant['default_code']:
+                # CORREGIDO: Cada variante decide individualmente si es update o creación
+                # basándose en si la variante específica ya existe en Shopify
+                variant_exists_in_shopify = bool(prefetch.variant_maps.get(variant['id']))
 
-                for position, variant in enumerate(variant_data, 1):
-                    variant["position"] = position
+                variant_result = self._prepare_shopify_variant_data(
+                    variant, instance_id, prefetch, is_update=variant_exists_in_shopify
+                )
+                if variant_result:
+                    variant_data.append(variant_result)
+
+        # Ordenar variantes por talla si existe línea de talla
+        size_pos = instance_id.size_option_position
+        if size_pos in base_option_attr_lines:
+            variant_data.sort(
+                key=lambda v: get_size_value(
+                    v.get(f"option{size_pos}", "")
+                )
+            )
 
-                if not variant_data:
-                    cname = color_value.name if color_value else 'N/A'
-                    _logger.info("WSSH Skipping Shopify export for product '%s' with color '%s' because no variant has default_code",
-                                 product.name, cname)
-                    continue
+        for position, variant in enumerate(variant_data, 1):
+            variant["position"] = position
 
-                # CORREGIDO: Construir opciones usando directamente option_attr_lines (ya ordenado por posición)
-                options_data = []
+        if not variant_data:
+            cname = color_value.name if color_value else 'N/A'
+            _logger.info("WSSH Skipping Shopify export for product '%s' with color '%s' because no variant has default_code",
+                         product.name, cname)
+            return None
 
-                for position in sorted(base_option_attr_lines):
-                    attr_line = base_option_attr_lines[position]
+        # CORREGIDO: Construir opciones usando directamente option_attr_lines (ya ordenado por posición)
+        options_data = []
 
-                    if position == instance_id.color_option_position:
-                        if color_value:
-                            color_values = [color_value.name]
-                        else:
-                            color_values = sorted(set(v.get(f"option{position}", "") for v in variant_data))
-                        options_data.append({
-                            "name": "Color",
-                            "position": position,
-                            "values": color_values
-                        })
-                    elif position == instance_id.size_option_position:
-                        cname = color_value.name if color_value else 'N/A'
-                        _logger.info("WSSH variant_data antes de construir size_values para producto '%s', color '%s': %s", product.name, cname, variant_data)
-                        # Extraer valores únicos preservando el orden (variant_data ya está ordenado por talla)
-                        size_values = []
-                        seen = set()
-                        for v in variant_data:
-                            _logger.info("WSSH Variante para options: %s", v)
-                            size_val = v.get(f"option{position}", "")
-
-                            _logger.info("WSSH checking talla para variante SKU=%s => '%s'", v.get('sku', ''), size_val)
-                            if not size_val:
-                                _logger.error("WSSH ERROR: Variante con valor de talla vacío en producto '%s', color '%s', variante: %s", product.name, cname, v)
-                                raise UserError(f"Error: Hay al menos una variante con valor de talla vacío para el producto '{product.name}' y color '{cname}'. Corrige los datos antes de exportar.")
-
-                            if size_val not in seen:
-                                size_values.append(size_val)
-                                seen.add(size_val)
-                        _logger.info("WSSH size_values construidos para producto '%s', color '%s': %s", product.name, cname, size_values)
-
-                        if not size_values:
-                            _logger.error("WSSH ERROR: No se detectaron valores válidos de talla para el producto %s y color %s", product.name, cname)
-                            raise UserError(f"Error: No se detectaron valores válidos de talla para el producto '{product.name}' y color '{cname}'.")
-
-                        options_data.append({
-                            "name": "Talla",
-                            "position": position,
-                            "values": size_values
-                        })
-                    else:
-                        # Otros atributos
-                        other_values = sorted(set(v.get(f"option{position}", "") for v in variant_data))
-                        options_data.append({
-                            "name": attr_line.attribute_id.name,
-                            "position": position,
-                            "values": other_values
-                        })
+        for position in sorted(base_option_attr_lines):
+            attribute_id = base_option_attr_lines[position]
 
-                product_data = {
-                    "product": {
-                        "options": options_data,
-                        #"tags": ','.join(tag.name for tag in product.product_tag_ids),
-                        "variants": variant_data
-                    }
-                }
-
-                # Logging para debugging
-                _logger.info(f"WSSH DEBUG - Product options: {[opt['name'] + ':' + str(opt['position']) for opt in options_data]}")
-                _logger.info(f"WSSH DEBUG - First variant options: {[(k, v) for k, v in variant_data[0].items() if k.startswith('option')] if variant_data else 'No variants'}")
-
-                if product_map:
-                    if update or create_new and len(new_variants) > 0:
-                        product_data["product"]["id"] = product_map.web_product_id
-                        url = self.get_products_url(instance_id, f'products/{product_map.web_product_id}.json')
-                        _logger.info(f"WSSH Updating Shopify product {product_map.web_product_id} {instance_id.name}")
-                        # --- LOG DEL PAYLOAD ---
-                        _logger.info("WSSH PAYLOAD FINAL ENVIADO A SHOPIFY:\n%s", json.dumps(product_data, indent=2, ensure_ascii=False))
-
-                        
-                        try:
-                            retries = 0
-                            max_retries = 3
-                            while retries < max_retries:
-                                # Respetar el rate limit de Shopify
-                                elapsed = time.time() - last_request_time
-                                if elapsed < 0.5:
-                                    sleep_time = 0.5 - elapsed
-                                    _logger.info(f"WSSH Esperando {sleep_time}s para respetar rate limits")
-                                    time.sleep(sleep_time)
-
-                                response = requests.put(url, headers=headers, data=json.dumps(product_data))
-                                last_request_time = time.time()
-                                _logger.info(f"WSSH PUT request status: {response.status_code}")
-
-                                if response.ok:
-                                    _logger.info(f"WSSH Response Ok - Updated product {product_map.web_product_id}")
-                                    product_processed = True
-                                    break
-
-                                if response.status_code == 422:
-                                    try:
-                                        err_data = response.json()
-                                        _logger.error(f"WSSH 422 response body: {err_data}")
-                                        variant_errors = err_data.get('errors', {}).get('variants', [])
-                                        missing_ids = []
-                                        removed_variants = self.env['product.product']
-
-                                        for msg in variant_errors:
-                                            # Some Shopify messages include IDs
-                                            # inside brackets, others just list
-                                            # them directly. Extract all digit
-                                            # sequences to cover both cases.
-                                            ids = re.findall(r"\d+", msg)
-                                            if ids:
-                                                missing_ids.extend(ids)
-                                                for vid in ids:
-                                                    maps = self.env['shopify.variant.map'].sudo().search([
-                                                        ('web_variant_id', '=', vid),
-                                                        ('shopify_instance_id', '=', instance_id.id),
-                                                    ])
-                                                    if maps:
-                                                        removed_variants |= maps.mapped('odoo_id')
-                                                        maps.unlink()
-                                                        _logger.warning(
-                                                            f"WSSH Removed mapping for deleted variant {vid} on instance {instance_id.name}")
-                                        if missing_ids:
-                                            # Remove missing variants from payload and local lists
-                                            variant_data[:] = [
-                                                v for v in variant_data if str(v.get('id')) not in missing_ids
-                                            ]
-                                            variants -= removed_variants
-                                            new_variants -= removed_variants
-
-                                            # Si no quedan variantes a actualizar o crear,
-                                            # no tiene sentido enviar un payload vacío
-                                            if not variant_data:
-                                                _logger.warning(
-                                                    f"WSSH All variants removed for product {product_map.web_product_id}; skipping update")
-                                                product_processed = True
-                                                break
-
-                                            product_data['product']['variants'] = variant_data
-                                            retries += 1
-                                            _logger.info(
-                                                f"WSSH Retrying update without variants {missing_ids} ({retries}/{max_retries})")
-                                            continue
-                                        _logger.error("WSSH 422 error without missing variant ids; aborting")
-                                        cname = color_value.name if color_value else 'N/A'
-                                        raise UserError(
-                                            f"WSSH Error updating product {product.name} - {cname}: {response.text}")
-                                    except Exception as parse_e:
-                                        _logger.error(f"WSSH Error processing 422 response: {str(parse_e)}")
-
-                                if response.status_code == 429:
-                                    retry_after = int(response.headers.get('Retry-After', 1))
-                                    _logger.warning(
-                                        f"WSSH Rate limit alcanzado. Esperando {retry_after}s antes de reintentar...")
-                                    time.sleep(retry_after)
-                                    continue
-
-                                if response.status_code == 404:
-                                    # Shopify product no longer exists
-                                    self._handle_missing_shopify_product(product, instance_id, product_map)
-                                    product_processed = True
-                                    break
-
-                                _logger.error(
-                                    f"WSSH Error updating product {product_map.web_product_id}: Status {response.status_code}, Response: {response.text}")
-                                cname = color_value.name if color_value else 'N/A'
-                                raise UserError(
-                                    f"WSSH Error updating product {product.name} - {cname}: {response.text}")
-                            else:
-                                _logger.error(
-                                    f"WSSH Failed to update product {product_map.web_product_id} after {max_retries} attempts")
-                                cname = color_value.name if color_value else 'N/A'
-                                raise UserError(
-                                    f"WSSH Error updating product {product.name} - {cname}: agotados {max_retries} reintentos")
-                            # end while
-
-                        except requests.exceptions.RequestException as e:
-                            _logger.error(f"WSSH Network error updating product {product_map.web_product_id}: {str(e)}")
-                            cname = color_value.name if color_value else 'N/A'
-                            raise UserError(f"WSSH Network error updating product {product.name} - {cname}: {str(e)}")
-                        except Exception as e:
-                            _logger.error(f"WSSH Unexpected error updating product {product_map.web_product_id}: {str(e)}")
-                            cname = color_value.name if color_value else 'N/A'
-                            raise UserError(f"WSSH Unexpected error updating product {product.name} - {cname}: {str(e)}")
-                    else:
-                        _logger.info(f"WSSH Ignorar, por no update, Shopify product {product_map.web_product_id}")
+            if position == instance_id.color_option_position:
+                if color_value:
+                    color_values = [color_value.name]
+                else:
+                    color_values = sorted(set(v.get(f"option{position}", "") for v in variant_data))
+                options_data.append({
+                    "name": "Color",
+                    "position": position,
+                    "values": color_values
+                })
+            elif position == instance_id.size_option_position:
+                cname = color_value.name if color_value else 'N/A'
+                _logger.info("WSSH variant_data antes de construir size_values para producto '%s', color '%s': %s", product.name, cname, variant_data)
+                # Extraer valores únicos preservando el orden (variant_data ya está ordenado por talla)
+                size_values = []
+                seen = set()
+                for v in variant_data:
+                    _logger.info("WSSH Variante para options: %s", v)
+                    size_val = v.get(f"option{position}", "")
+
+                    _logger.info("WSSH checking talla para variante SKU=%s => '%s'", v.get('sku', ''), size_val)
+                    if not size_val:
+                        _logger.error("WSSH ERROR: Variante con valor de talla vacío en producto '%s', color '%s', variante: %s", product.name, cname, v)
+                        raise UserError(f"Error: Hay al menos una variante con valor de talla vacío para el producto '{product.name}' y color '{cname}'. Corrige los datos antes de exportar.")
+
+                    if size_val not in seen:
+                        size_values.append(size_val)
+                        seen.add(size_val)
+                _logger.info("WSSH size_values construidos para producto '%s', color '%s': %s", product.name, cname, size_values)
+
+                if not size_values:
+                    _logger.error("WSSH ERROR: No se detectaron valores válidos de talla para el producto %s y color %s", product.name, cname)
+                    raise UserError(f"Error: No se detectaron valores válidos de talla para el producto '{product.name}' y color '{cname}'.")
+
+                options_data.append({
+                    "name": "Talla",
+                    "position": position,
+                    "values": size_values
+                })
+            else:
+                # Otros atributos
+                other_values = sorted(set(v.get(f"option{position}", "") for v in variant_data))
+                options_data.append({
+                    "name": prefetch.attribute_name(attribute_id),
+                    "position": position,
+                    "values": other_values
+                })
+
+        product_data = {
+            "product": {
+                "options": options_data,
+                #"tags": ','.join(tag.name for tag in product.product_tag_ids),
+                "variants": variant_data
+            }
+        }
 
-                elif create_new:
-                    cname = color_value.name if color_value else ''
-                    _logger.info(f"WSSH creando {product.name}{' - ' + cname if cname else ''}")
-                    product_data["product"]["title"] = f"{product.name}{' - ' + cname if cname else ''}"
-                    product_data["product"]["status"] = 'draft'
-                    if product.description:
-                        product_data["product"]["body_html"] = product.description
+        # Logging para debugging
+        _logger.info(f"WSSH DEBUG - Product options: {[opt['name'] + ':' + str(opt['position']) for opt in options_data]}")
+        _logger.info(f"WSSH DEBUG - First variant options: {[(k, v) for k, v in variant_data[0].items() if k.startswith('option')] if variant_data else 'No variants'}")
+
+        job = {
+            'product': product,
+            'color_value': color_value,
+            'variants': variants,
+            'new_variants': new_variants,
+            'product_map': product_map,
+            'product_data': product_data,
+        }
+        if product_map:
+            if not (update or create_new and len(new_variants) > 0):
+                _logger.info(f"WSSH Ignorar, por no update, Shopify product {product_map.web_product_id}")
+                return None
+            product_data["product"]["id"] = product_map.web_product_id
+            job['endpoint'] = f'products/{product_map.web_product_id}.json'
+            # Cambios de Odoo que no afectan al payload (stock, chatter, recálculos) no generan PUT
+            fingerprint = self._shopify_payload_fingerprint(product_data)
+            change = self._classify_shopify_changes(product_map, product_data, fingerprint, new_variants)
+            if change == 'none':
+                _logger.info(f"WSSH Payload sin cambios, se omite PUT de {product_map.web_product_id} {instance_id.name}")
+                return None
+            if change == 'variants':
+                changed = self._changed_shopify_variants(instance_id, variant_data)
+                if changed is not None:
+                    # Solo precio/SKU/barcode: PUT de las variantes cambiadas en lugar del producto completo
+                    return dict(job, method='variants', fingerprint=fingerprint, changed_variants=changed)
+            self._log_shopify_product_put(product_map, product_data, instance_id)
+            return dict(job, method='put')
+
+        if not create_new:
+            return None
+        cname = color_value.name if color_value else ''
+        _logger.info(f"WSSH creando {product.name}{' - ' + cname if cname else ''}")
+        product_data["product"]["title"] = f"{product.name}{' - ' + cname if cname else ''}"
+        product_data["product"]["status"] = 'draft'
+        if product.description:
+            product_data["product"]["body_html"] = product.description
+        return dict(job, method='post')
+
+    @staticmethod
+    def _log_shopify_product_put(product_map, product_data, instance_id):
+        _logger.info(f"WSSH Updating Shopify product {product_map.web_product_id} {instance_id.name}")
+        # --- LOG DEL PAYLOAD ---
+        _logger.info("WSSH PAYLOAD FINAL ENVIADO A SHOPIFY:\n%s", json.dumps(product_data, indent=2, ensure_ascii=False))
+
+    @staticmethod
+    def _send_shopify_export_job(client, job):
+        """Send the calls of an export job.
+
+        Runs on a pipeline thread, so it only reads the job's plain values
+        and must not touch the ORM. Returns the response (the list of
+        responses for a ``variants`` job) or the network error, which is
+        handled when the job is applied.
+        """
+        if not job['method']:
+            return None
+        try:
+            if job['method'] == 'variants':
+                return [
+                    client.put(f"variants/{body['id']}.json", data=json.dumps({'variant': body}))
+                    for body, _variant_map, _fingerprint in job['changed_variants']
+                ]
+            if job['method'] == 'put':
+                # El limitador del cliente respeta el rate limit de Shopify
+                return client.put(job['endpoint'], data=json.dumps(job['product_data']))
+            return client.post('products.json', data=json.dumps(job['product_data']))
+        except requests.exceptions.RequestException as e:
+            return e
 
-                    url = self.get_products_url(instance_id, 'products.json')
+    def _apply_shopify_export_job(self, client, instance_id, job, result):
+        """Apply the answer to an export job on the ORM cursor.
 
-                    try:
-                        # Respetar el rate limit de Shopify
-                        elapsed = time.time() - last_request_time
-                        if elapsed < 0.5:
-                            sleep_time = 0.5 - elapsed
-                            _logger.info(f"WSSH Esperando {sleep_time}s para respetar rate limits")
-                            time.sleep(sleep_time)
-
-                        response = requests.post(url, headers=headers, data=json.dumps(product_data))
-                        last_request_time = time.time()
-                        _logger.info(f"WSSH POST request status: {response.status_code}")
-
-                        if response.ok:
-                            _logger.info(f"WSSH Response Ok - Created new product")
-                            product_processed = True
-                            shopify_product = response.json().get('product', {})
-                            if shopify_product:
-                                # Crear el mapeo del producto
-                                if color_value:
-                                    self.env['shopify.product.map'].create({
-                                        'web_product_id': shopify_product.get('id'),
-                                        'odoo_id': color_value.id,
-                                        'shopify_instance_id': instance_id.id,
-                                    })
-                                else:
-                                    self.env['shopify.product.template.map'].create({
-                                        'web_product_id': shopify_product.get('id'),
-                                        'odoo_id': product.id,
-                                        'shopify_instance_id': instance_id.id,
-                                    })
-                                _logger.info(f"WSSH Created product map for Shopify product ID: {shopify_product.get('id')}")
-                            else:
-                                _logger.warning(f"WSSH No product data in successful response")
-                        elif response.status_code == 429:
-                            retry_after = int(response.headers.get('Retry-After', 1))
-                            _logger.warning(
-                                f"WSSH Rate limit alcanzado. Esperando {retry_after}s antes de reintentar...")
-                            time.sleep(retry_after)
-                            continue
-                        else:
-                            _logger.error(f"WSSH Error creating product: Status {response.status_code}, Response: {response.text}")
-                            cname = color_value.name if color_value else 'N/A'
-                            raise UserError(f"WSSH Error creating product {product.name} - {cname}: {response.text}")
-
-                    except requests.exceptions.RequestException as e:
-                        _logger.error(f"WSSH Network error creating product: {str(e)}")
-                        cname = color_value.name if color_value else 'N/A'
-                        raise UserError(f"WSSH Network error creating product {product.name} - {cname}: {str(e)}")
-                    except json.JSONDecodeError as e:
-                        _logger.error(f"WSSH JSON decode error in response: {str(e)}, Response text: {response.text if response else 'No response'}")
-                        cname = color_value.name if color_value else 'N/A'
-                        raise UserError(f"WSSH Invalid JSON response from Shopify for product {product.name} - {cname}")
-                    except Exception as e:
-                        _logger.error(f"WSSH Unexpected error creating product: {str(e)}")
-                        cname = color_value.name if color_value else 'N/A'
-                        raise UserError(f"WSSH Unexpected error creating product {product.name} - {cname}: {str(e)}")
-                # Procesar respuesta y actualizar variant IDs si todo fue exitoso
-                if response and response.ok:
-                    try:
-                        shopify_product = response.json().get('product', {})
-                        if shopify_product:
-                            shopify_variants = shopify_product.get('variants', [])
-                            self._update_variant_ids(variants, shopify_variants, instance_id)
-                            cname = color_value.name if color_value else 'N/A'
-                            _logger.info(f"WSSH Updated variant IDs for {len(shopify_variants)} variants for color {cname}")
-                        else:
-                            cname = color_value.name if color_value else 'N/A'
-                            _logger.warning(f"WSSH No product data in response for {cname}")
-                    except json.JSONDecodeError as e:
-                        _logger.error(f"WSSH Error parsing successful response JSON: {str(e)}")
-                    except Exception as e:
-                        _logger.error(f"WSSH Error processing successful response: {str(e)}")
-                elif response:
-                    # Este caso ya se manejó arriba con raise UserError
-                    pass
-                else:
-                    cname = color_value.name if color_value else 'N/A'
-                    _logger.warning(f"WSSH No response object for color {cname} - this should not happen")
+        Jobs are applied in the order they were built. Returns whether the
+        item counts as exported; Shopify errors raise :class:`UserError`.
+        """
+        if not job['method']:
+            return False
+        product, color_value = job['product'], job['color_value']
+        cname = color_value.name if color_value else 'N/A'
+        if job['method'] == 'variants':
+            if self._apply_shopify_variant_updates(job['changed_variants'], result):
+                job['product_map'].sudo().write({'export_fingerprint': job['fingerprint']})
+                return True
+            # Alguna variante falló: se envía el producto completo
+            job['method'] = 'put'
+            self._log_shopify_product_put(job['product_map'], job['product_data'], instance_id)
+            result = self._send_shopify_export_job(client, job)
+
+        action = 'updating' if job['method'] == 'put' else 'creating'
+        try:
+            if isinstance(result, Exception):
+                raise result
+            if job['method'] == 'put':
+                response, product_processed = self._apply_shopify_product_put(client, instance_id, job, result)
+            else:
+                response, product_processed = self._apply_shopify_product_post(instance_id, job, result), True
+        except UserError:
+            raise
+        except requests.exceptions.RequestException as e:
+            _logger.error(f"WSSH Network error {action} product {product.name}: {str(e)}")
+            raise UserError(f"WSSH Network error {action} product {product.name} - {cname}: {str(e)}")
+        except Exception as e:
+            _logger.error(f"WSSH Unexpected error {action} product {product.name}: {str(e)}")
+            raise UserError(f"WSSH Unexpected error {action} product {product.name} - {cname}: {str(e)}")
 
-                # Logging adicional para debugging
-                if response:
-                    cname = color_value.name if color_value else 'N/A'
-                    _logger.info(f"WSSH Final response status for {cname}: {response.status_code}")
+        _logger.info(f"WSSH Final response status for {cname}: {response.status_code}")
+        # Procesar respuesta y actualizar variant IDs si todo fue exitoso
+        if response.ok:
+            try:
+                shopify_product = response.json().get('product', {})
+                if shopify_product:
+                    shopify_variants = shopify_product.get('variants', [])
+                    self._update_variant_ids(job['variants'], shopify_variants, instance_id)
+                    _logger.info(f"WSSH Updated variant IDs for {len(shopify_variants)} variants for color {cname}")
                 else:
-                    cname = color_value.name if color_value else 'N/A'
-                    _logger.warning(f"WSSH No response object created for {cname}")
+                    _logger.warning(f"WSSH No product data in response for {cname}")
+            except json.JSONDecodeError as e:
+                _logger.error(f"WSSH Error parsing successful response JSON: {str(e)}")
+            except Exception as e:
+                _logger.error(f"WSSH Error processing successful response: {str(e)}")
+        return product_processed
+
+    def _apply_shopify_product_put(self, client, instance_id, job, response):
+        """Handle the answer to a product PUT.
+
+        A 422 naming deleted variants is retried here without them, up to
+        three PUTs in total; a 404 unpublishes the product. Returns
+        ``(response, processed)``.
+        """
+        product, color_value, product_map = job['product'], job['color_value'], job['product_map']
+        product_data = job['product_data']
+        cname = color_value.name if color_value else 'N/A'
+        max_retries = 3
+        retries = 0
+        while True:
+            _logger.info(f"WSSH PUT request status: {response.status_code}")
+            if response.ok:
+                _logger.info(f"WSSH Response Ok - Updated product {product_map.web_product_id}")
+                # Huellas del payload finalmente aceptado (sin las variantes eliminadas por 422)
+                self._store_shopify_fingerprints(product_map, product_data, instance_id)
+                return response, True
+            if response.status_code == 404:
+                # Shopify product no longer exists
+                self._handle_missing_shopify_product(product, instance_id, product_map)
+                return response, True
+
+            missing_ids = self._drop_missing_shopify_variants(instance_id, job, response) if response.status_code == 422 else []
+            if not missing_ids:
+                _logger.error(
+                    f"WSSH Error updating product {product_map.web_product_id}: Status {response.status_code}, Response: {response.text}")
+                raise UserError(f"WSSH Error updating product {product.name} - {cname}: {response.text}")
+            # Si no quedan variantes a actualizar o crear, no tiene sentido enviar un payload vacío
+            if not product_data['product']['variants']:
+                _logger.warning(
+                    f"WSSH All variants removed for product {product_map.web_product_id}; skipping update")
+                return response, True
+            retries += 1
+            if retries >= max_retries:
+                _logger.error(
+                    f"WSSH Failed to update product {product_map.web_product_id} after {max_retries} attempts")
+                raise UserError(
+                    f"WSSH Error updating product {product.name} - {cname}: agotados {max_retries} reintentos")
+            _logger.info(f"WSSH Retrying update without variants {missing_ids} ({retries}/{max_retries})")
+            response = client.put(job['endpoint'], data=json.dumps(product_data))
 
-                if product_processed:
-                    processed_count += 1
-                    self.write_with_retry(instance_id, 'last_export_product_id', product.id)
+    def _drop_missing_shopify_variants(self, instance_id, job, response):
+        """Unmap the variants a 422 reports as deleted in Shopify and drop them from the job.
 
-                if processed_count >= max_processed:
-                    _logger.info("WSSH Processed %d products for instance %s. Stopping export for this run.", processed_count, instance_id.name)
+        Returns the Shopify variant ids found in the error messages.
+        """
+        try:
+            err_data = response.json()
+            _logger.error(f"WSSH 422 response body: {err_data}")
+            variant_errors = err_data.get('errors', {}).get('variants', [])
+            missing_ids = []
+            removed_variants = self.env['product.product']
+
+            for msg in variant_errors:
+                # Some Shopify messages include IDs
+                # inside brackets, others just list
+                # them directly. Extract all digit
+                # sequences to cover both cases.
+                ids = re.findall(r"\d+", msg)
+                if ids:
+                    missing_ids.extend(ids)
+                    for vid in ids:
+                        maps = self.env['shopify.variant.map'].sudo().search([
+                            ('web_variant_id', '=', vid),
+                            ('shopify_instance_id', '=', instance_id.id),
+                        ])
+                        if maps:
+                            removed_variants |= maps.mapped('odoo_id')
+                            maps.unlink()
+                            _logger.warning(
+                                f"WSSH Removed mapping for deleted variant {vid} on instance {instance_id.name}")
+        except Exception as parse_e:
+            _logger.error(f"WSSH Error processing 422 response: {str(parse_e)}")
+            return []
+        if missing_ids:
+            # Remove missing variants from payload and local lists
+            variant_data = job['product_data']['product']['variants']
+            variant_data[:] = [v for v in variant_data if str(v.get('id')) not in missing_ids]
+            job['variants'] -= removed_variants
+            job['new_variants'] -= removed_variants
+        else:
+            _logger.error("WSSH 422 error without missing variant ids; aborting")
+        return missing_ids
+
+    def _apply_shopify_product_post(self, instance_id, job, response):
+        """Map the product created by a POST; returns the response."""
+        product, color_value = job['product'], job['color_value']
+        cname = color_value.name if color_value else 'N/A'
+        _logger.info(f"WSSH POST request status: {response.status_code}")
+        if not response.ok:
+            _logger.error(f"WSSH Error creating product: Status {response.status_code}, Response: {response.text}")
+            raise UserError(f"WSSH Error creating product {product.name} - {cname}: {response.text}")
+
+        _logger.info(f"WSSH Response Ok - Created new product")
+        try:
+            shopify_product = response.json().get('product', {})
+        except json.JSONDecodeError as e:
+            _logger.error(f"WSSH JSON decode error in response: {str(e)}, Response text: {response.text}")
+            raise UserError(f"WSSH Invalid JSON response from Shopify for product {product.name} - {cname}")
+        if shopify_product:
+            # Crear el mapeo del producto
+            if color_value:
+                self.env['shopify.product.map'].create({
+                    'web_product_id': shopify_product.get('id'),
+                    'odoo_id': color_value.id,
+                    'shopify_instance_id': instance_id.id,
+                })
+            else:
+                self.env['shopify.product.template.map'].create({
+                    'web_product_id': shopify_product.get('id'),
+                    'odoo_id': product.id,
+                    'shopify_instance_id': instance_id.id,
+                })
+            _logger.info(f"WSSH Created product map for Shopify product ID: {shopify_product.get('id')}")
+        else:
+            _logger.warning(f"WSSH No product data in successful response")
+        return response
 
-                    export_update_time = product.write_date - datetime.timedelta(seconds=1)
-                    break
-            # Corregir lógica de actualización de last_export_product
-            if processed_count > 0:
-                if processed_count < max_processed and not timeout_reached:
-                    # Si se procesaron todos los productos pendientes, actualizar fecha y resetear ID
-                    self.write_with_retry(instance_id, 'last_export_product', export_update_time)
-                    self.write_with_retry(instance_id, 'last_export_product_id', 0)
-                else:
-                    # Si se alcanzó el límite o el timeout, actualizar fecha hasta el último producto procesado
-                    self.write_with_retry(instance_id, 'last_export_product', export_update_time)
 
-            if timeout_reached:
-                _logger.info("WSSH Exportación detenida por tiempo límite en instancia %s", instance_id.name)
-                break
-                               
-            
-    def _update_variant_ids(self, odoo_variants, shopify_variants, instance_id):
+    def _update_variant_ids(self, odoo_variants, shopify_variants, instance_id, index=None):
         """
         Actualiza los IDs de las variantes de Shopify en las variantes de Odoo, 
         y actualiza los mappings de stock basados en la variante y la ubicación en lugar de stock.quant.
+
+        Los mapeos existentes se leen con una consulta por modelo y los nuevos se
+        crean con un único ``create``. Si se pasa ``index`` (:class:`ShopifyMappingIndex`),
+        los mapeos de variante se consultan y actualizan a través de él.
         """
         shopify_location = self.env['shopify.location'].sudo().search([
             ('shopify_instance_id', '=', instance_id.id)
         ], limit=1)
         
+        matches = []
         for odoo_variant in odoo_variants:
             matched_shopi_variant = None
             # Buscar coincidencia en shopify_variants usando SKU o barcode
@@ -1054,50 +1337,55 @@ class ProductTemplate(models.Model):
                     break
     
             if matched_shopi_variant:
-                # Actualizar o crear el mapeo de la variante
-                variant_map = odoo_variant.shopify_variant_map_ids.filtered(
-                    lambda m: m.shopify_instance_id == instance_id
-                )
-                if variant_map:
-                    if variant_map.web_variant_id != matched_shopi_variant.get('id'):
-                        variant_map.write({'web_variant_id': matched_shopi_variant.get('id')})
-                        #_logger.info("Updated variant map for Odoo variant (SKU: %s)", odoo_variant.default_code)
-                else:
-                    self.env['shopify.variant.map'].create({
-                        'web_variant_id': matched_shopi_variant.get('id'),
-                        'odoo_id': odoo_variant.id,
-                        'shopify_instance_id': instance_id.id,
-                    })
-                    #_logger.info("Created variant map for Odoo variant (SKU: %s)", odoo_variant.default_code)
-    
-                # Actualizar o crear el mapeo de stock basado en la variante y la ubicación
-                if shopify_location:
-                    stock_map = self.env['shopify.stock.map'].sudo().search([
-                        ('odoo_id', '=', odoo_variant.id),
-                        ('shopify_instance_id', '=', instance_id.id),
-                        ('shopify_location_id', '=', shopify_location.id)
-                    
-                    ], limit=1)
-                                   
-                    if stock_map:                                                                                                                                        
-                        if stock_map.web_stock_id != matched_shopi_variant.get('inventory_item_id'):
-                            stock_map.write({'web_stock_id': matched_shopi_variant.get('inventory_item_id')})
-                            #_logger.info("Updated stock map for Odoo variant (SKU: %s)", odoo_variant.default_code)                                                                                  
-                    else:
-                        self.env['shopify.stock.map'].create({
-                            'web_stock_id': matched_shopi_variant.get('inventory_item_id'),
-                            'odoo_id': odoo_variant.id,
-                            'shopify_instance_id': instance_id.id,
-                            'shopify_location_id': shopify_location.id,
-                        })
-                        #_logger.info("Created stock map for Odoo variant (SKU: %s)", odoo_variant.default_code)
-                                                                                         
-                else:
-                    _logger.warning("No shopify.location found for instance %s", instance_id.name)
+                matches.append((odoo_variant.id, matched_shopi_variant))
             else:
                 sku = odoo_variant.default_code or 'N/A'
                 _logger.warning(f"WSSH Update var: No matching Shopify variant found for Odoo variant with SKU %s", sku)
 
+        if not matches:
+            return
+
+        # Actualizar o crear los mapeos de las variantes
+        variant_pairs = [(odoo_id, matched.get('id')) for odoo_id, matched in matches]
+        if index is not None:
+            index.variants.set_many(variant_pairs)
+        else:
+            self._apply_map_values('shopify.variant.map', 'web_variant_id', variant_pairs, {
+                'shopify_instance_id': instance_id.id,
+            })
+
+        # Actualizar o crear los mapeos de stock basados en la variante y la ubicación
+        if shopify_location:
+            self._apply_map_values('shopify.stock.map', 'web_stock_id', [
+                (odoo_id, matched.get('inventory_item_id')) for odoo_id, matched in matches
+            ], {
+                'shopify_instance_id': instance_id.id,
+                'shopify_location_id': shopify_location.id,
+            })
+        else:
+            _logger.warning("No shopify.location found for instance %s", instance_id.name)
+
+    def _apply_map_values(self, model, web_field, pairs, scope):
+        """Point the ``model`` maps of each ``(odoo_id, web_id)`` pair to ``web_id``.
+
+        ``scope`` holds the field values identifying the maps besides
+        ``odoo_id`` (instance, location); existing maps are read in one query
+        and the missing ones created in one ``create``.
+        """
+        Map = self.env[model].sudo()
+        domain = [('odoo_id', 'in', [odoo_id for odoo_id, _web_id in pairs])]
+        domain += [(name, '=', value) for name, value in scope.items()]
+        existing = {m.odoo_id.id: m for m in Map.search(domain)}
+        to_create = []
+        for odoo_id, web_id in pairs:
+            web_id = str(web_id) if web_id else web_id
+            current = existing.get(odoo_id)
+            if current is None:
+                to_create.append(dict(scope, odoo_id=odoo_id, **{web_field: web_id}))
+            elif current[web_field] != web_id:
+                current.write({web_field: web_id})
+        if to_create:
+            Map.create(to_create)
 
     def _handle_missing_shopify_product(self, product, instance_id, product_map):
         """Handle a 404 error when trying to update a Shopify product.
@@ -1140,9 +1428,113 @@ class ProductTemplate(models.Model):
             stock_maps.unlink()
 
                 
-    def _prepare_shopify_variant_data(self, variant, instance_id, is_update=False):
+    @staticmethod
+    def _shopify_payload_fingerprint(payload):
+        """Stable hash of a Shopify payload, independent of key order."""
+        return hashlib.sha1(
+            json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str).encode()).hexdigest()
+
+    @classmethod
+    def _shopify_structure_fingerprint(cls, product_data):
+        """Hash of the parts of a product payload only a full PUT can change.
+
+        Every product field (title, description, tags, options...) plus the
+        id, position and option values of each variant; the per-variant
+        fields (price, SKU, barcode) are left out.
+        """
+        product = dict(product_data['product'])
+        product['variants'] = [
+            {k: v for k, v in variant.items() if k in ('id', 'position') or k.startswith('option')}
+            for variant in product.get('variants', [])
+        ]
+        return cls._shopify_payload_fingerprint(product)
+
+    def _classify_shopify_changes(self, product_map, product_data, fingerprint, new_variants):
+        """Classify what changed in a product payload since its last export.
+
+        :return: ``'none'`` when the payload is the one last accepted,
+            ``'variants'`` when only variant fields (price, SKU, barcode)
+            changed, ``'full'`` when a product field changed, options or
+            variants were added, removed or reordered, or no previous
+            export is known.
+        """
+        if new_variants:
+            return 'full'
+        if product_map.export_fingerprint == fingerprint:
+            return 'none'
+        variants = product_data['product'].get('variants', [])
+        if (product_map.export_structure_fingerprint
+                and product_map.export_structure_fingerprint == self._shopify_structure_fingerprint(product_data)
+                and all(v.get('id') for v in variants)):
+            return 'variants'
+        return 'full'
+
+    def _changed_shopify_variants(self, instance_id, variant_data):
+        """Return ``(body, variant_map, fingerprint)`` for each variant whose payload changed.
+
+        ``body`` is the ``variants/{id}.json`` payload of the variant.
+        Returns ``None`` when a variant has no exported fingerprint yet or
+        more than half of them changed (one product PUT is cheaper), so the
+        caller sends the full PUT.
+        """
+        maps = {
+            m.web_variant_id: m for m in self.env['shopify.variant.map'].sudo().search([
+                ('shopify_instance_id', '=', instance_id.id),
+                ('web_variant_id', 'in', [str(v['id']) for v in variant_data]),
+            ])
+        }
+        changed = []
+        for variant in variant_data:
+            variant_map = maps.get(str(variant['id']))
+            if not variant_map or not variant_map.export_fingerprint:
+                return None
+            fingerprint = self._shopify_payload_fingerprint(variant)
+            if variant_map.export_fingerprint != fingerprint:
+                body = {k: variant[k] for k in ('id', 'sku', 'barcode', 'price', 'inventory_management') if k in variant}
+                changed.append((body, variant_map, fingerprint))
+        if len(changed) * 2 > len(variant_data):
+            return None
+        return changed
+
+    def _apply_shopify_variant_updates(self, changed, responses):
+        """Store the fingerprints of the variant PUTs that succeeded; return whether all did."""
+        if isinstance(responses, Exception):
+            _logger.warning("WSSH Error de red actualizando variantes: %s", responses)
+            return False
+        ok = True
+        for (body, variant_map, fingerprint), response in zip(changed, responses):
+            if response.ok:
+                variant_map.write({'export_fingerprint': fingerprint})
+            else:
+                _logger.warning("WSSH Error %s actualizando variante %s: %s",
+                                response.status_code, body['id'], response.text)
+                ok = False
+        _logger.info("WSSH Actualizadas %d variantes sin PUT de producto", len(changed))
+        return ok
+
+    def _store_shopify_fingerprints(self, product_map, product_data, instance_id):
+        """Remember the payload Shopify accepted in a full PUT, product and variants."""
+        product_map.sudo().write({
+            'export_fingerprint': self._shopify_payload_fingerprint(product_data),
+            'export_structure_fingerprint': self._shopify_structure_fingerprint(product_data),
+        })
+        variants = {str(v['id']): v for v in product_data['product'].get('variants', []) if v.get('id')}
+        if not variants:
+            return
+        for variant_map in self.env['shopify.variant.map'].sudo().search([
+            ('shopify_instance_id', '=', instance_id.id),
+            ('web_variant_id', 'in', list(variants)),
+        ]):
+            fingerprint = self._shopify_payload_fingerprint(variants[variant_map.web_variant_id])
+            if variant_map.export_fingerprint != fingerprint:
+                variant_map.write({'export_fingerprint': fingerprint})
+
+    def _prepare_shopify_variant_data(self, variant, instance_id, prefetch, is_update=False):
         """
         Prepara los datos de una variante para Shopify, usando las posiciones configuradas para color y talla.
+
+        ``variant`` es una fila de :class:`ShopifyExportPrefetch` y sus valores de atributo,
+        precio y mapeo se leen de ``prefetch``.
         """
         # Posición de las opciones según configuración de la instancia
         color_pos = instance_id.color_option_position if hasattr(instance_id, 'color_option_position') else 1
@@ -1151,36 +1543,38 @@ class ProductTemplate(models.Model):
         # Extraer valores reales de color y talla desde la variante
         color_val = None
         size_val = None
-        for val in variant.product_template_attribute_value_ids:
-            attr_name = val.attribute_id.name.lower()
+        for value_id in variant['product_template_attribute_value_ids']:
+            val = prefetch.values[value_id]
+            attr_name = prefetch.attribute_name(val['attribute_id']).lower()
             if attr_name == 'color':
-                color_val = val.name
+                color_val = val['name']
             elif attr_name in ('size', 'talla'):
-                size_val = val.name
+                size_val = val['name']
 
         # Comprobación de errores: si falta algún valor requerido, lanzar excepción
         if not color_val:
-            _logger.error("WSSH ERROR: Variante SKU %s no tiene color asignado.", variant.default_code)
-            raise UserError(f"Error: Variante SKU {variant.default_code} no tiene color asignado.")
+            _logger.error("WSSH ERROR: Variante SKU %s no tiene color asignado.", variant['default_code'])
+            raise UserError(f"Error: Variante SKU {variant['default_code']} no tiene color asignado.")
         if not size_val:
-            _logger.error("WSSH ERROR: Variante SKU %s no tiene talla asignada.", variant.default_code)
-            raise UserError(f"Error: Variante SKU {variant.default_code} no tiene talla asignada.")
+            _logger.error("WSSH ERROR: Variante SKU %s no tiene talla asignada.", variant['default_code'])
+            raise UserError(f"Error: Variante SKU {variant['default_code']} no tiene talla asignada.")
 
         # Construir el diccionario resultado para Shopify
+        template = prefetch.templates[variant['product_tmpl_id']]
         price = (
-            variant.product_tmpl_id.wholesale_price
+            template['wholesale_price']
             if not instance_id.prices_include_tax
-            else variant.list_price
+            else template['list_price']
         )
 
         result = {
             'inventory_management': 'shopify',
         }
 
-        if variant.default_code:
-            result['sku'] = variant.default_code
-        if variant.barcode:
-            result['barcode'] = variant.barcode
+        if variant['default_code']:
+            result['sku'] = variant['default_code']
+        if variant['barcode']:
+            result['barcode'] = variant['barcode']
         if price and price != 0:
             result['price'] = price
 
@@ -1189,11 +1583,9 @@ class ProductTemplate(models.Model):
 
         # Si es update y el variant ya existe, incluye su id
         if is_update:
-            variant_map = variant.shopify_variant_map_ids.filtered(
-                lambda m: m.shopify_instance_id == instance_id
-            )
-            if variant_map and variant_map.web_variant_id:
-                result['id'] = str(variant_map.web_variant_id)
+            web_variant_id = prefetch.variant_maps.get(variant['id'])
+            if web_variant_id:
+                result['id'] = str(web_variant_id)
 
         # Si después de limpiar el precio no hay otros datos útiles, omitir
         useful_keys = set(result.keys()) - {'id', 'inventory_management'}
@@ -1218,18 +1610,21 @@ class ProductTemplate(models.Model):
             
     def export_stock_to_shopify(self, shopify_instance_ids, products=None):
         _logger.info("WSSH Exportar stocks")
+        run_started = time.monotonic()
         
         if not shopify_instance_ids:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
        
-        for shopify_instance in shopify_instance_ids: 
-            updated_ids = []
+        updated_ids = []
+        for instance_index, shopify_instance in enumerate(shopify_instance_ids):
+            if not shopify_instance._shopify_circuit_allows():
+                continue
             location = self.env['shopify.location'].sudo().search(
                 [('shopify_instance_id', '=', shopify_instance.id)], limit=1)
             
             if not location:
                 _logger.warning("No shopify.location found for instance %s", shopify_instance.name)
-                return updated_ids
+                continue
             
             # Definir ubicación a usar: específica o la primera interna
             if location.import_stock_warehouse_id:
@@ -1285,75 +1680,73 @@ class ProductTemplate(models.Model):
             
             _logger.info("WSSH Found %s variants para la instancia %s", len(variants), shopify_instance.name)
             
-            # Control de tiempo entre peticiones
-            last_query_time = time.time()
-            iteration_timeout = 250
-            iteration_start_time = time.time()
+            client = shopify_instance._get_shopify_client()
+
+            # Como en la exportación de productos, el tiempo que queda se reparte entre las instancias pendientes
+            budget = self.env['shopify.sync.state']._get_run_budget(
+                shopify_instance, 'stock_export', elapsed=time.monotonic() - run_started,
+                instances_left=len(shopify_instance_ids) - instance_index)
+            budget_exhausted = False
             
-            for variant in variants:
-                stock_map = variant.shopify_stock_map_ids.filtered(lambda m: m.shopify_instance_id == shopify_instance)
-                if not stock_map or not stock_map.web_stock_id:
-                    continue
-                
-                # CORRECCIÓN: Obtener cantidad disponible correctamente
-                if internal_location:
-                    # Calcular stock disponible en la ubicación definida
-                    # (ya sea la específica configurada o la primera interna)
-                    # SUMA todos los quants/lotes de la variante - esto es coherente con el mapa agregado
-                    quant_qty = self.env['stock.quant'].sudo().search([
-                        ('product_id', '=', variant.id),
-                        ('location_id', '=', internal_location.id)
-                    ])
-                    available_qty = sum(q.quantity for q in quant_qty if q.quantity > 0)
-                else:
-                    # Fallback: usar qty_available general pero limitado a stock positivo
-                    available_qty = max(0, variant.qty_available)
-                
-                # CORRECCIÓN ADICIONAL: Asegurar que no se envíen cantidades negativas
-                # Shopify no maneja bien las cantidades negativas
-                available_qty = max(0, available_qty)
+            with self.env['shopify.sync.state']._get_checkpoint(shopify_instance, 'stock_export') as checkpoint:
+                for index, variant in enumerate(variants):
+                    if not budget.allows():
+                        _logger.info("WSSH Presupuesto agotado (%.1fs de %.0fs) en el producto %s para instancia %s",
+                                     budget.elapsed(), budget.seconds, variant.default_code, shopify_instance.name)
+                        checkpoint.report(budget.drain_estimate(len(variants) - index))
+                        budget_exhausted = True
+                        break
+
+                    stock_map = variant.shopify_stock_map_ids.filtered(lambda m: m.shopify_instance_id == shopify_instance)
+                    if not stock_map or not stock_map.web_stock_id:
+                        budget.skip()
+                        continue
                 
-                _logger.info("WSSH Enviando stock para variante %s (SKU: %s): %s a Shopify", 
-                            variant.id, variant.default_code, available_qty)
+                    # CORRECCIÓN: Obtener cantidad disponible correctamente
+                    if internal_location:
+                        # Calcular stock disponible en la ubicación definida
+                        # (ya sea la específica configurada o la primera interna)
+                        # SUMA todos los quants/lotes de la variante - esto es coherente con el mapa agregado
+                        quant_qty = self.env['stock.quant'].sudo().search([
+                            ('product_id', '=', variant.id),
+                            ('location_id', '=', internal_location.id)
+                        ])
+                        available_qty = sum(q.quantity for q in quant_qty if q.quantity > 0)
+                    else:
+                        # Fallback: usar qty_available general pero limitado a stock positivo
+                        available_qty = max(0, variant.qty_available)
                 
-                # Control de tiempo entre peticiones
-                elapsed = time.time() - last_query_time
-                if elapsed < 0.5:
-                    time.sleep(0.5 - elapsed)
-                last_query_time = time.time()
+                    # CORRECCIÓN ADICIONAL: Asegurar que no se envíen cantidades negativas
+                    # Shopify no maneja bien las cantidades negativas
+                    available_qty = max(0, available_qty)
                 
-                # Enviar solicitud a Shopify
-                url = self.get_products_url(shopify_instance, 'inventory_levels/set.json')
-                headers = {
-                    "X-Shopify-Access-Token": shopify_instance.shopify_shared_secret,
-                    "Content-Type": "application/json"
-                }
-                data_payload = {
-                    "location_id": location.shopify_location_id,
-                    "inventory_item_id": stock_map.web_stock_id,
-                    "available": int(available_qty),
-                }
+                    _logger.info("WSSH Enviando stock para variante %s (SKU: %s): %s a Shopify", 
+                                variant.id, variant.default_code, available_qty)
                 
-                response = requests.post(url, headers=headers, json=data_payload)
-                if response.status_code in (200, 201):
-                    updated_ids.append(variant.id)
-                    # Actualizar con el ID de la variante procesada (consistente con el mapa agregado)
-                    self.write_with_retry(shopify_instance, 'last_export_stock_id', variant.id)
-                else:
-                    _logger.warning("WSSH Failed to update stock for product %s (variant %s): %s en instancia %s",
-                                    variant.product_tmpl_id.name, variant.name, response.text, shopify_instance.name)
+                    # Enviar solicitud a Shopify
+                    data_payload = {
+                        "location_id": location.shopify_location_id,
+                        "inventory_item_id": stock_map.web_stock_id,
+                        "available": int(available_qty),
+                    }
                 
-                # Verificar timeout
-                if time.time() - iteration_start_time > iteration_timeout:
-                    _logger.error("WSSH Timeout de iteración alcanzado para el producto %s en instancia %s",
-                                  variant.default_code, shopify_instance.name)
-                    return updated_ids
+                    # Fija una cantidad absoluta: repetirlo no cambia el resultado
+                    response = client.post('inventory_levels/set.json', json=data_payload, idempotent=True)
+                    if response.status_code in (200, 201):
+                        updated_ids.append(variant.id)
+                        # Actualizar con el ID de la variante procesada (consistente con el mapa agregado)
+                        checkpoint.advance(variant.id)
+                    else:
+                        _logger.warning("WSSH Failed to update stock for product %s (variant %s): %s en instancia %s",
+                                        variant.product_tmpl_id.name, variant.name, response.text, shopify_instance.name)
+                    budget.tick()
             
-            # Si se procesan todos los productos, actualizar a la fecha actual y resetear el ID de variante
-            _logger.info("WSSH Update stock final completo para %s", shopify_instance.name)
-            self.write_with_retry(shopify_instance, 'last_export_stock', fields.Datetime.now())
-            self.write_with_retry(shopify_instance, 'last_export_stock_id', 0)
-            return updated_ids
+                if not budget_exhausted:
+                    # Si se procesan todos los productos, actualizar a la fecha actual y resetear el ID de variante
+                    _logger.info("WSSH Update stock final completo para %s", shopify_instance.name)
+                    checkpoint.report(budget.drain_estimate(0))
+                    checkpoint.finish(fields.Datetime.now())
+        return updated_ids
 
     def _check_last_shopify_product_map(self, shopify_instance):
         """
@@ -1367,24 +1760,19 @@ class ProductTemplate(models.Model):
                      shopify_instance.name)
 
         try:
-            # 1. Construir la URL y headers para la llamada a la API de Shopify
-            endpoint = 'products.json'
-            url = self.get_products_url(shopify_instance, endpoint)
-            access_token = shopify_instance.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token,
-                "Content-Type": "application/json" # Aunque es GET, es buena práctica incluirlo a veces
-            }
+            # 1. Obtener el cliente HTTP compartido de la instancia
+            client = shopify_instance._get_shopify_client()
 
             # Parámetros para la solicitud: obtener los últimos N productos creados
             fetch_limit = 10 # Podrías ajustar este número
             params = {
                 'order': 'created_at desc', # Ordenar por fecha de creación descendente
-                'limit': fetch_limit        # Limitar el número de resultados
+                'limit': fetch_limit,       # Limitar el número de resultados
+                'fields': shopify_client.PRODUCT_MATCH_FIELDS,
             }
 
             # 2. Realizar la llamada GET a la API de Shopify
-            response = requests.get(url, headers=headers, params=params)
+            response = client.get('products.json', params=params)
 
             # 3. Manejar la respuesta de la API
             if response.status_code != 200:
@@ -5,9 +5,10 @@ import requests
 import time
 import traceback
 from odoo import api, fields, models, _
-from odoo.exceptions import UserError,ValidationError, UserError, AccessError
+from odoo.exceptions import UserError
 from odoo.tools import config
-from psycopg2 import Error as PostgresError
+
+from . import shopify_client
 
 
 import logging
@@ -97,9 +98,9 @@ class ResPartner(models.Model):
         all_customer_ids = []
 
         for shopify_instance_id in shopify_instance_ids:
-            base_url = self.get_customer_url(shopify_instance_id, endpoint='customers.json')
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {"X-Shopify-Access-Token": access_token}
+            if not shopify_instance_id._shopify_circuit_allows():
+                continue
+            client = shopify_instance_id._get_shopify_client()
 
             params = {"limit": pagina_size}
 
@@ -110,7 +111,7 @@ class ResPartner(models.Model):
             params["since_id"] = shopify_instance_id.shopify_last_import_customer_id or 0
             _logger.info(f"WSSH Consulta con since_id: {params['since_id']} ({'continuando' if shopify_instance_id.shopify_last_import_customer_id else 'desde inicio'})")
 
-            url = base_url
+            url = 'customers.json'
             import_complete = False
             last_customer_id = None
 
@@ -129,7 +130,7 @@ class ResPartner(models.Model):
                     _logger.info(f"WSSH Captura clientes página {url}")
                     _logger.info(f"WSSH Parámetros enviados: {params}")
                     
-                    response = requests.get(url, headers=headers, params=params, timeout=tout_medio)
+                    response = client.get(url, params=params, timeout=tout_medio)
                     response.raise_for_status()
                     shopify_customers = response.json()
                     customers = shopify_customers.get('customers', [])
@@ -143,8 +144,13 @@ class ResPartner(models.Model):
                     _logger.info(f"WSSH IDs recibidos (página {pagina_size}): {customer_ids[:3]}...{customer_ids[-3:] if len(customer_ids) > 3 else customer_ids}")
                     _logger.info(f"WSSH Total clientes en página: {len(customers)} - Rango: {customers[0]['id']} a {customers[-1]['id']}")
 
-                    for customer in customers:
-                        customer['metafields'] = self.get_customer_metafields(customer.get('id'), shopify_instance_id)
+                    # Un GET de metafields por cliente, lanzados en paralelo
+                    metafields_list = shopify_instance_id.shopify_map_concurrent(
+                        lambda customer: self._fetch_customer_metafields(client, customer.get('id')),
+                        customers,
+                    )
+                    for customer, metafields in zip(customers, metafields_list):
+                        customer['metafields'] = metafields
 
                     all_customer_ids = self.create_customers(customers, shopify_instance_id, skip_existing_customer)
                     
@@ -160,73 +166,25 @@ class ResPartner(models.Model):
                         if 'next' in links:
                             url = links['next']
                             params = None
-                            # Delay para respetar rate limits de Shopify
-                            _logger.info("WSSH Esperando 2s antes de siguiente página para respetar rate limits")
-                            time.sleep(2)
                             continue
 
                     import_complete = True
                     break
 
                 except requests.exceptions.HTTPError as e:
-                    if e.response and e.response.status_code == 429:
-                        # Rate limit específico de Shopify
-                        retry_after = int(e.response.headers.get('Retry-After', 10))
-                        _logger.warning(f"WSSH Rate limit alcanzado. Esperando {retry_after}s antes de reintentar...")
-                        time.sleep(retry_after)
-                        # Reintentar la misma página
-                        continue
-                    else:
-                        # Otros errores HTTP - manejar como antes
-                        tb_str = traceback.format_exc()
-                        _logger.error(f"WSSH Traceback completo:\n{tb_str}")
-                        
-                        _logger.warning("Error during customer import (Sin rollback). Last customer ID: %s. Error: %s", 
-                                      last_customer_id or 'N/A', str(e))
-                        
-                        if last_customer_id:
-                            try:
-                                shopify_instance_id.write_with_retry(shopify_instance_id, 'shopify_last_import_customer_id', str(last_customer_id),False)
-                                _logger.info(f"WSSH Progreso guardado tras error HTTP. Último ID: {last_customer_id}")
-                            except Exception as save_error:
-                                _logger.error(f"WSSH Error guardando progreso: {save_error}")
-                        break
-                    # Obtener traceback completo para debugging
+                    # Los 429 y 5xx ya los reintenta el cliente; aquí solo llegan errores definitivos
                     tb_str = traceback.format_exc()
                     _logger.error(f"WSSH Traceback completo:\n{tb_str}")
                     
-                    # Determinar si la excepción permite guardar progreso (no causa rollback)
-                    save_progress_allowed = False
+                    _logger.warning("Error during customer import (Sin rollback). Last customer ID: %s. Error: %s", 
+                                  last_customer_id or 'N/A', str(e))
                     
-                    # Excepciones que NO causan rollback - seguro guardar progreso
-                    if isinstance(e, (requests.exceptions.RequestException, 
-                                    requests.exceptions.Timeout,
-                                    requests.exceptions.ConnectionError,
-                                    ValueError, TypeError, KeyError,
-                                    UnicodeError, AttributeError)) and not isinstance(e, (PostgresError, ValidationError, UserError, AccessError)):
-                        save_progress_allowed = True
-                        error_type = "Sin rollback"
-                    else:
-                        # Excepciones de BD (PostgreSQL), validación de Odoo, etc. - NO guardar progreso
-                        error_type = "Con rollback"
-                        if isinstance(e, PostgresError):
-                            _logger.error(f"WSSH Error PostgreSQL detectado: {type(e).__name__}")
-                        elif isinstance(e, (ValidationError, UserError, AccessError)):
-                            _logger.error(f"WSSH Error Odoo detectado: {type(e).__name__}")
-                    
-                    _logger.warning("Error during customer import (%s). Last customer ID: %s. Error: %s", 
-                                  error_type, last_customer_id or 'N/A', str(e))
-                    
-                    # Solo guardar progreso si la excepción no causa rollback
-                    if save_progress_allowed and last_customer_id:
+                    if last_customer_id:
                         try:
                             shopify_instance_id.write_with_retry(shopify_instance_id, 'shopify_last_import_customer_id', str(last_customer_id),False)
-                            _logger.info(f"WSSH Progreso guardado tras error sin rollback. Último ID: {last_customer_id}")
+                            _logger.info(f"WSSH Progreso guardado tras error HTTP. Último ID: {last_customer_id}")
                         except Exception as save_error:
                             _logger.error(f"WSSH Error guardando progreso: {save_error}")
-                    elif last_customer_id:
-                        _logger.warning(f"WSSH Progreso NO guardado - excepción causa rollback")
-                    
                     break
 
             if import_complete:
@@ -243,13 +201,18 @@ class ResPartner(models.Model):
 
     def get_customer_metafields(self, customer_id, shopify_instance_id):
         """Obtiene los metafields de un cliente específico"""
+        return self._fetch_customer_metafields(shopify_instance_id._get_shopify_client(), customer_id)
+
+    def _fetch_customer_metafields(self, client, customer_id):
+        """Fetch and parse the ``custom`` metafields of a customer.
+
+        Only uses ``client`` (no ORM access), so it can run on worker threads.
+        """
         if not customer_id:
             return {}
-            
-        url = self.get_customer_url(shopify_instance_id, endpoint=f'customers/{customer_id}/metafields.json')
-        headers = {"X-Shopify-Access-Token": shopify_instance_id.shopify_shared_secret}
-        
-        response = requests.get(url, headers=headers)
+
+        response = client.get(f'customers/{customer_id}/metafields.json',
+                              params={'namespace': 'custom', 'fields': shopify_client.METAFIELD_FIELDS})
         if response.status_code == 200 and response.content:
             metafields_data = response.json().get('metafields', [])
             metafields = {}
@@ -450,11 +413,9 @@ class ResPartner(models.Model):
             partner_ids = self.sudo().search(domain)
 
         for instance_id in shopify_instance_ids:
-            url = self.get_customer_url(instance_id, endpoint='customers.json')
-            headers = {
-                "X-Shopify-Access-Token": instance_id.shopify_shared_secret,
-                "Content-Type": "application/json"
-            }
+            if not instance_id._shopify_circuit_allows():
+                continue
+            client = instance_id._get_shopify_client()
 
             for partner in partner_ids:
                 tag_vals = ','.join(tag.name for tag in partner.category_id) if partner.category_id else ''
@@ -479,8 +440,7 @@ class ResPartner(models.Model):
 
                 if mapping and update:
                     data["customer"]["id"] = mapping.shopify_partner_id
-                    url = self.get_customer_url(instance_id, endpoint=f'customers/{mapping.shopify_partner_id}.json')
-                    response = requests.put(url, headers=headers, data=json.dumps(data))
+                    response = client.put(f'customers/{mapping.shopify_partner_id}.json', data=json.dumps(data))
                 else:
                     data["customer"].update({
                         "first_name": partner.name or "",
@@ -488,7 +448,7 @@ class ResPartner(models.Model):
                         "verified_email": True,
                         "send_email_welcome": False
                     })
-                    response = requests.post(url, headers=headers, data=json.dumps(data))
+                    response = client.post('customers.json', data=json.dumps(data))
 
                 if response and response.ok:
                     shopify_customer = response.json().get('customer', {})
@@ -517,10 +477,7 @@ class ResPartner(models.Model):
         if not shopify_customer_id:
             return
             
-        headers = {
-            "X-Shopify-Access-Token": instance_id.shopify_shared_secret,
-            "Content-Type": "application/json"
-        }
+        client = instance_id._get_shopify_client()
         
         metafields = []
         
@@ -544,10 +501,9 @@ class ResPartner(models.Model):
             
         # Exportar metafields
         for metafield in metafields:
-            url = self.get_customer_url(instance_id, endpoint=f'customers/{shopify_customer_id}/metafields.json')
             data = {"metafield": metafield}
             
-            response = requests.post(url, headers=headers, data=json.dumps(data))
+            response = client.post(f'customers/{shopify_customer_id}/metafields.json', data=json.dumps(data))
             if not response or not response.ok:
                 _logger.error("WSSH Metafield export failed: %s - %s", metafield.get('key'), 
                               response.text if response else "No response")
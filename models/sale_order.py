@@ -9,6 +9,8 @@ from odoo.exceptions import UserError
 import logging
 import re
 
+from .shopify_mapping_index import ShopifyVariantResolver
+
 _logger = logging.getLogger(__name__)
 
 class SaleOrder(models.Model):
@@ -24,51 +26,40 @@ class SaleOrder(models.Model):
         # Importa órdenes en borrador desde Shopify a Odoo
         if shopify_instance_ids == False:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
+        order_list = []
         for shopify_instance_id in shopify_instance_ids:
-            url = self.get_order_url(shopify_instance_id, endpoint='draft_orders.json')
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token
-            }
+            if not shopify_instance_id._shopify_circuit_allows():
+                continue
             effective_from_date = from_date or shopify_instance_id.shopify_last_date_order_import          
                 
             # Configurar parámetros para la consulta a Shopify
             params = {
                 "limit": 250,  # Ajusta el tamaño de página según sea necesario
-                "pageInfo": None,
                 "status": "any"
             }
             if effective_from_date:
                 params["created_at_min"] = effective_from_date
             if to_date:
                 params["created_at_max"] = to_date  
-            all_orders = []
-
-            while True:
-                response = requests.get(url, headers=headers, params=params)
-                if response.status_code == 200 and response.content:
-                    draft_orders = response.json()
-                    orders = draft_orders.get('draft_orders', [])
-                    all_orders.extend(orders)
-                    page_info = draft_orders.get('page_info', {})
-                    if 'has_next_page' in page_info and page_info['has_next_page']:
-                        params['page_info'] = page_info['next_page']
-                    else:
-                        break
-                else:
-                    _logger.info("Error: %s", response.status_code)
-                    break
-            if all_orders:
-                orders = self.create_shopify_order(all_orders, shopify_instance_id, skip_existing_order, status='draft')
-                if len(all_orders) >= params.get('limit', 0):
-                    last_dt = parser.isoparse(all_orders[-1].get('created_at'))
-                    shopify_instance_id.shopify_last_date_order_import = last_dt.astimezone(utc)
-                else:
-                    shopify_instance_id.shopify_last_date_order_import = fields.Datetime.now()
-                return orders
+            # Se toma antes de paginar para no perder órdenes creadas durante la importación
+            import_start = fields.Datetime.now()
+
+            instance_orders = []
+            try:
+                for orders in shopify_instance_id.shopify_iter_pages('draft_orders.json', 'draft_orders', params):
+                    instance_orders.extend(self.create_shopify_order(orders, shopify_instance_id, skip_existing_order, status='draft'))
+            except requests.exceptions.RequestException as e:
+                # Una tienda que falla no detiene las demás; su marca no avanza y se reintenta en la siguiente ejecución
+                _logger.error("WSSH Importación de borradores interrumpida para %s: %s", shopify_instance_id.name, e)
+                order_list.extend(instance_orders)
+                continue
+
+            if instance_orders:
+                shopify_instance_id.shopify_last_date_order_import = import_start
+                order_list.extend(instance_orders)
             else:
-                _logger.info("No draft orders found in Shopify.")
-                return []
+                _logger.info("No draft orders found in Shopify for instance %s.", shopify_instance_id.name)
+        return order_list
 
     def create_shopify_order(self, orders, shopify_instance_id, skip_existing_order, status):
         # Crea o actualiza órdenes en Odoo a partir de datos de Shopify
@@ -236,26 +227,28 @@ class SaleOrder(models.Model):
         if shopify_order_id.order_line and not skip_existing_order:
             shopify_order_id.order_line.unlink()
 
+        # Variantes de todas las líneas del pedido resueltas en bloque
+        resolver = ShopifyVariantResolver(self.env, shopify_instance_id)
+        line_skus = [line.get('sku') for line in order.get('line_items')]
+        resolver.load(
+            variant_ids=[line.get('variant_id') for line in order.get('line_items')],
+            skus=line_skus,
+            barcodes=line_skus,
+        )
         for line in order.get('line_items'):
             product_name = line.get('title', '')
             variant_id = line.get('variant_id')
             if re.search(r'recargo', product_name, re.IGNORECASE):
                 continue
             tax_list, tax_rate_total = self._process_tax_lines(line.get('tax_lines'), service=False)
-            product = self.env['product.product'].sudo().search([
-                ('shopify_variant_map_ids.web_variant_id', '=', variant_id),
-                ('shopify_variant_map_ids.shopify_instance_id', '=', shopify_instance_id.id)
-            ], limit=1)
+            product = self.env['product.product'].sudo().browse(resolver.resolve(variant_id))
             if not product:
                 sku = line.get('sku') or ''
                 _logger.info(f"WSSH Importanto orden variante sin mapeo sku: {sku} var_id:{variant_id}")
                 # Intentar buscar por SKU (default_code) antes de usar el genérico
                 if sku:
-                    product_by_sku = self.env['product.product'].sudo().search([
-                        '|',
-                        ('default_code', '=', sku),
-                        ('barcode', '=', sku),
-                    ], limit=1)
+                    product_by_sku = self.env['product.product'].sudo().browse(
+                        resolver.resolve(sku=sku, barcode=sku))
                     if product_by_sku:
                         # Verificar si existe un mapeo para este producto en la instancia actual
                         product_map = product_by_sku.shopify_variant_map_ids.filtered(
@@ -470,54 +463,37 @@ class SaleOrder(models.Model):
         orders_total = []
         
         for shopify_instance_id in shopify_instance_ids:
+            if not shopify_instance_id._shopify_circuit_allows():
+                continue
+            # Leer la marca antes de importar borradores, que la comparten y la avanzan
+            effective_from_date = from_date or shopify_instance_id.shopify_last_date_order_import
             self.import_shopify_draft_orders(shopify_instance_id, skip_existing_order, from_date, to_date)
             # import shopify oders from shopify to odoo
-            # call method to connect to shopify
 
-            all_orders = []
-            url = self.get_order_url(shopify_instance_id, endpoint='orders.json')
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token
-            }
-            
-            effective_from_date = from_date or shopify_instance_id.shopify_last_date_order_import          
-                
             # Configurar parámetros para la consulta a Shopify
             params = {
                 "limit": 250,  # Ajusta el tamaño de página según sea necesario
-                "pageInfo": None,
                 "status": "any"
             }
             if effective_from_date:
                 params["created_at_min"] = effective_from_date
             if to_date:
                 params["created_at_max"] = to_date  
-                
-            while True:
-                response = requests.get(url, headers=headers, params=params)
-                if response.status_code == 200 and response.content:
-                    data = response.json()
-                    orders = data.get('orders', [])
-                    all_orders.extend(orders)
-
-                    page_info = data.get('page_info', {})
-                    if 'has_next_page' in page_info and page_info['has_next_page']:
-                        params['page_info'] = page_info['next_page']
-                    else:
-                        break
-                else:
-                    _logger.info("Error: %s", response.status_code)
-                    break
-            if all_orders:
-                _logger.info(f"WSSH Found {len(all_orders)} para {shopify_instance_id.name}")
-                orders = self.create_shopify_order(all_orders, shopify_instance_id, skip_existing_order, status='open')
-                orders_total.extend(orders)
-                if len(all_orders) >= params.get('limit', 0):
-                    last_dt = parser.isoparse(all_orders[-1].get('created_at'))
-                    shopify_instance_id.shopify_last_date_order_import = last_dt.astimezone(utc)
-                else:
-                    shopify_instance_id.shopify_last_date_order_import = fields.Datetime.now()
+            # Se toma antes de paginar para no perder órdenes creadas durante la importación
+            import_start = fields.Datetime.now()
+
+            found = 0
+            try:
+                for orders in shopify_instance_id.shopify_iter_pages('orders.json', 'orders', params):
+                    found += len(orders)
+                    _logger.info(f"WSSH Found {found} para {shopify_instance_id.name}")
+                    orders_total.extend(self.create_shopify_order(orders, shopify_instance_id, skip_existing_order, status='open'))
+            except requests.exceptions.RequestException as e:
+                _logger.error("WSSH Importación de pedidos interrumpida para %s: %s", shopify_instance_id.name, e)
+                continue
+
+            if found:
+                shopify_instance_id.shopify_last_date_order_import = import_start
             else:
                 _logger.info(f"WSSH No orders found in shopify {shopify_instance_id.name}")
                 
@@ -536,13 +512,9 @@ class SaleOrder(models.Model):
         if shopify_instance_ids == False:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
         for instance_id in shopify_instance_ids:
-            url = self.get_order_url(instance_id, endpoint='draft_orders.json')
-            access_token = instance_id.shopify_shared_secret
-
-            headers = {
-                "X-Shopify-Access-Token": access_token,
-                "Content-Type": "application/json"
-            }
+            if not instance_id._shopify_circuit_allows():
+                continue
+            client = instance_id._get_shopify_client()
 
             response = ""
             for order in order_ids:
@@ -575,7 +547,6 @@ class SaleOrder(models.Model):
                 if map_for_instance and update == True:
                     shopify_map = map_for_instance[0]
                     end = "draft_orders/{}.json".format(shopify_map.shopify_order_id)
-                    url_update = self.get_order_url(instance_id, endpoint=end)
                     payload = {
                         "draft_order": {
                             "id": shopify_map.shopify_order_id,
@@ -586,7 +557,7 @@ class SaleOrder(models.Model):
                             "tax_lines": [],
                         }
                     }
-                    response = requests.put(url_update, headers=headers, data=json.dumps(payload))
+                    response = client.put(end, data=json.dumps(payload))
                     # Actualizar el registro del mapa si es necesario
                     shopify_map.write({
                         'shopify_order_id': payload.get('draft_order', {}).get('id', shopify_map.shopify_order_id),
@@ -604,7 +575,7 @@ class SaleOrder(models.Model):
                             }
                         }
 
-                        response = requests.post(url, headers=headers, data=json.dumps(payload))
+                        response = client.post('draft_orders.json', data=json.dumps(payload))
                         if response and response.content:
                             draft_orders = response.json()
                             draft_order = draft_orders.get('draft_order', [])
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from odoo import api, fields, models
+from odoo.sql_db import db_connect
+
+from . import shopify_client
+
+_logger = logging.getLogger(__name__)
+
+
+class ShopifyApiBudget(models.Model):
+    _name = 'shopify.api.budget'
+    _description = 'Estado compartido del bucket de API de Shopify'
+    _rec_name = 'shopify_instance_id'
+
+    shopify_instance_id = fields.Many2one('shopify.web', string='Shopify Instance', required=True, ondelete='cascade')
+    bucket_capacity = fields.Integer(string='Capacidad del bucket', default=shopify_client.DEFAULT_BUCKET_CAPACITY)
+    bucket_fill = fields.Float(string='Llamadas en el bucket')
+    bucket_updated = fields.Float(string='Última actualización (epoch)')
+    blocked_until = fields.Float(string='Bloqueado hasta (epoch)')
+    circuit_state = fields.Selection([
+        (shopify_client.CIRCUIT_CLOSED, 'Cerrado'),
+        (shopify_client.CIRCUIT_OPEN, 'Abierto'),
+        (shopify_client.CIRCUIT_HALF_OPEN, 'Semiabierto'),
+    ], string='Estado del circuito', default=shopify_client.CIRCUIT_CLOSED)
+    circuit_failures = fields.Integer(string='Fallos consecutivos')
+    circuit_open_until = fields.Float(string='Circuito abierto hasta (epoch)')
+
+    _sql_constraints = [
+        ('shopify_instance_unique',
+         'UNIQUE(shopify_instance_id)',
+         'Solo puede existir un estado de bucket por instancia de Shopify.')
+    ]
+
+    @api.model
+    def _get_limiter(self, shopify_instance):
+        return SharedBucketLimiter(self.env.cr.dbname, shopify_instance.id)
+
+    @api.model
+    def _get_breaker(self, shopify_instance):
+        return SharedCircuitBreaker(self.env.cr.dbname, shopify_instance.id)
+
+
+# Segundos como máximo entre dos sincronizaciones del estado local con la fila compartida
+SHARED_SYNC_INTERVAL = 5.0
+
+
+class SharedBudgetRow:
+    """Share the state of a process with the instance's budget row.
+
+    Subclasses list the ``_columns`` they keep in ``shopify_api_budget`` and
+    implement ``_load(row)``/``_dump()``. Reading or updating the row runs in
+    its own short transaction, so it never interferes with the caller's
+    cursor; the state is only synced every ``sync_interval`` seconds or on
+    the events that other workers must see at once. If the table cannot be
+    used the local state is used alone.
+    """
+
+    _columns = ()
+    sync_interval = SHARED_SYNC_INTERVAL
+
+    def _init_shared(self, dbname, instance_id):
+        self.dbname = dbname
+        self.instance_id = instance_id
+        self.synced_at = None
+
+    def _sync_due(self, now):
+        return self.synced_at is None or now - self.synced_at >= self.sync_interval
+
+    def _lock_row(self, cr):
+        cr.execute("""
+            INSERT INTO shopify_api_budget (shopify_instance_id)
+                 VALUES (%s)
+            ON CONFLICT (shopify_instance_id) DO NOTHING
+        """, (self.instance_id,))
+        cr.execute("""
+            SELECT {}
+              FROM shopify_api_budget
+             WHERE shopify_instance_id = %s
+               FOR UPDATE
+        """.format(', '.join(self._columns)), (self.instance_id,))
+        return cr.fetchone()
+
+    def _update_row(self, update):
+        """Call ``update(row)`` under the row lock and save ``_dump()``; return False if the table failed."""
+        try:
+            with db_connect(self.dbname).cursor() as cr:
+                update(self._lock_row(cr))
+                cr.execute("""
+                    UPDATE shopify_api_budget
+                       SET {}
+                     WHERE shopify_instance_id = %s
+                """.format(', '.join('%s = %%s' % column for column in self._columns)),
+                    self._dump() + (self.instance_id,))
+            return True
+        except Exception as e:
+            _logger.warning("WSSH Estado compartido no disponible para instancia %s, usando estado local: %s",
+                            self.instance_id, e)
+            return False
+
+
+class SharedBucketLimiter(SharedBudgetRow, shopify_client.LeakyBucketLimiter):
+    """Leaky-bucket limiter whose state is shared by every Odoo worker.
+
+    Reservations and headers update the bucket in process, as the plain
+    limiter does. Every ``sync_interval`` seconds, and right after a 429,
+    the bucket is merged with the one in ``shopify_api_budget``: the row
+    gets the calls this process made since the last sync and the process
+    gets those of the other workers, so concurrent crons and wizards
+    hitting the same shop pace on one budget without a database round trip
+    per call.
+    """
+
+    clock = staticmethod(time.time)
+    _columns = ('bucket_capacity', 'bucket_fill', 'bucket_updated', 'blocked_until')
+
+    def __init__(self, dbname, instance_id, **kwargs):
+        super().__init__(**kwargs)
+        self._init_shared(dbname, instance_id)
+        # Llamadas reservadas por este proceso desde la última sincronización
+        self.unsynced = 0
+        self.capacity_known = False
+
+    def _merge(self, row, now):
+        capacity, fill, updated, blocked_until = row
+        if capacity and not self.capacity_known:
+            self._set_capacity(capacity)
+        self._drain(now)
+        shared = max(0.0, (fill or 0.0) - (now - (updated or now)) * self.leak_rate)
+        # Las cabeceras de la última respuesta ya pueden incluir las llamadas de los demás
+        self.fill = min(float(self.capacity), max(self.fill, shared + self.unsynced))
+        self.blocked_until = max(self.blocked_until, blocked_until or 0.0)
+        self.unsynced = 0
+
+    def _dump(self):
+        return (self.capacity, self.fill, self.updated, self.blocked_until)
+
+    def _sync(self, now):
+        self.synced_at = now
+        self._update_row(lambda row: self._merge(row, now))
+
+    def _local(self, operation, publish=False):
+        """Run ``operation(now)`` on the local bucket, syncing first when due or after it if ``publish``."""
+        with self._lock:
+            now = self.clock()
+            if self._sync_due(now) and not publish:
+                self._sync(now)
+            result = operation(now)
+            if publish:
+                self._sync(now)
+            return result
+
+    def _reserve_call(self, now):
+        self.unsynced += 1
+        return self._reserve_slot(now)
+
+    def _release_call(self, now):
+        self.unsynced -= 1
+        self._release_slot(now)
+
+    def reserve(self):
+        return self._local(self._reserve_call)
+
+    def release(self):
+        self._local(self._release_call)
+
+    def observe(self, response):
+        call_limit = shopify_client.parse_call_limit(response.headers.get(shopify_client.CALL_LIMIT_HEADER))
+        retry_after = shopify_client.parse_retry_after(response.headers.get('Retry-After'))
+        if call_limit:
+            self.capacity_known = True
+        # Un 429 bloquea a todos los workers: se publica sin esperar a la siguiente sincronización
+        self._local(lambda now: self._apply_headers(now, response.status_code, call_limit, retry_after),
+                    publish=response.status_code == 429)
+
+
+class SharedCircuitBreaker(SharedBudgetRow, shopify_client.CircuitBreaker):
+    """Circuit breaker whose state is shared by every Odoo worker.
+
+    While the circuit is closed and no failure is pending, calls only read
+    the row, at most every ``sync_interval`` seconds and without locking
+    it; transitions read and update the row under its lock.
+    """
+
+    clock = staticmethod(time.time)
+    _columns = ('circuit_state', 'circuit_failures', 'circuit_open_until')
+
+    def __init__(self, dbname, instance_id, **kwargs):
+        super().__init__(**kwargs)
+        self._init_shared(dbname, instance_id)
+
+    def _load(self, row):
+        state, failures, open_until = row
+        self.state = state or shopify_client.CIRCUIT_CLOSED
+        self.failures = failures or 0
+        self.open_until = open_until or 0.0
+
+    def _dump(self):
+        return (self.state, self.failures, self.open_until)
+
+    def _shared(self, operation):
+        with self._lock:
+            now = self.clock()
+            result = []
+
+            def update(row):
+                self._load(row)
+                result.append(operation(now))
+
+            self.synced_at = now
+            if not self._update_row(update) and not result:
+                result.append(operation(now))
+            return result[0]
+
+    def _peek(self):
+        with self._lock:
+            now = self.clock()
+            if not self._sync_due(now):
+                return
+            self.synced_at = now
+        try:
+            with db_connect(self.dbname).cursor() as cr:
+                cr.execute("""
+                    SELECT {}
+                      FROM shopify_api_budget
+                     WHERE shopify_instance_id = %s
+                """.format(', '.join(self._columns)), (self.instance_id,))
+                row = cr.fetchone()
+        except Exception as e:
+            _logger.warning("WSSH Estado del circuito no disponible para instancia %s: %s", self.instance_id, e)
+            return
+        with self._lock:
+            self._load(row or (None, None, None))
+
+    def is_open(self):
+        self._peek()
+        return super().is_open()
+
+    def allow(self):
+        self._peek()
+        if self.state == shopify_client.CIRCUIT_CLOSED:
+            return True
+        return self._shared(self._allow)
+
+    def record(self, success):
+        if success and self.state == shopify_client.CIRCUIT_CLOSED and not self.failures:
+            return
+        self._shared(lambda now: self._record(now, success))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime, timedelta
+
+from odoo import api, fields, models, tools
+from odoo.sql_db import db_connect
+
+from . import shopify_client
+
+_logger = logging.getLogger(__name__)
+
+# Columnas del histograma, en el orden de shopify_client.LATENCY_BINS_MS
+LATENCY_BIN_FIELDS = ['latency_le_%d' % bound for bound in shopify_client.LATENCY_BINS_MS] + [
+    'latency_gt_%d' % shopify_client.LATENCY_BINS_MS[-1]]
+
+
+class ShopifyApiMetric(models.Model):
+    _name = 'shopify.api.metric'
+    _description = 'Métricas de llamadas a la API de Shopify por minuto'
+    _order = 'bucket_start desc, endpoint'
+    _rec_name = 'endpoint'
+
+    shopify_instance_id = fields.Many2one('shopify.web', string='Shopify Instance', required=True,
+                                          ondelete='cascade', index=True)
+    bucket_start = fields.Datetime(string='Minuto', required=True, index=True)
+    endpoint = fields.Char(string='Endpoint', required=True)
+    method = fields.Char(string='Método', required=True)
+    status = fields.Integer(string='Estado HTTP', help='0 si la llamada falló sin respuesta (timeout, conexión).')
+    call_count = fields.Integer(string='Llamadas')
+    retry_count = fields.Integer(string='Reintentos')
+    throttled_count = fields.Integer(string='Respuestas 429')
+    latency_sum_ms = fields.Float(string='Latencia total (ms)')
+    latency_max_ms = fields.Float(string='Latencia máxima (ms)')
+    response_bytes = fields.Integer(string='Bytes recibidos')
+    call_limit_max = fields.Integer(string='Uso máximo del bucket')
+    latency_le_100 = fields.Integer(string='≤ 100 ms')
+    latency_le_250 = fields.Integer(string='≤ 250 ms')
+    latency_le_500 = fields.Integer(string='≤ 500 ms')
+    latency_le_1000 = fields.Integer(string='≤ 1 s')
+    latency_le_2500 = fields.Integer(string='≤ 2,5 s')
+    latency_le_5000 = fields.Integer(string='≤ 5 s')
+    latency_gt_5000 = fields.Integer(string='> 5 s')
+
+    _sql_constraints = [
+        ('bucket_unique',
+         'UNIQUE(shopify_instance_id, bucket_start, endpoint, method, status)',
+         'Solo puede existir una fila de métricas por minuto, endpoint, método y estado.')
+    ]
+
+    @api.model
+    def _get_recorder(self, shopify_instance):
+        return MetricRecorder(self.env.cr.dbname, shopify_instance.id)
+
+    @api.model
+    def _purge_old_metrics(self, days=7):
+        """Delete metrics older than ``days``; called by the daily cron."""
+        limit = fields.Datetime.now() - timedelta(days=days)
+        self.env.cr.execute("DELETE FROM shopify_api_metric WHERE bucket_start < %s", (limit,))
+        _logger.info("WSSH Purgadas %s filas de métricas de API anteriores a %s", self.env.cr.rowcount, limit)
+
+
+class MetricRecorder(shopify_client.MetricsBuffer):
+    """Metrics buffer that upserts its rows into ``shopify_api_metric``.
+
+    Rows are written in their own transaction, so flushing never commits
+    or rolls back the work of the sync that made the calls.
+    """
+
+    def __init__(self, dbname, instance_id, **kwargs):
+        super().__init__(**kwargs)
+        self.dbname = dbname
+        self.instance_id = instance_id
+
+    def _write(self, rows):
+        query = """
+            INSERT INTO shopify_api_metric (shopify_instance_id, bucket_start, endpoint, method, status,
+                                            call_count, retry_count, throttled_count, latency_sum_ms,
+                                            latency_max_ms, response_bytes, call_limit_max, {bins})
+                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, {placeholders})
+            ON CONFLICT (shopify_instance_id, bucket_start, endpoint, method, status) DO UPDATE
+                    SET call_count = shopify_api_metric.call_count + EXCLUDED.call_count,
+                        retry_count = shopify_api_metric.retry_count + EXCLUDED.retry_count,
+                        throttled_count = shopify_api_metric.throttled_count + EXCLUDED.throttled_count,
+                        latency_sum_ms = shopify_api_metric.latency_sum_ms + EXCLUDED.latency_sum_ms,
+                        latency_max_ms = GREATEST(shopify_api_metric.latency_max_ms, EXCLUDED.latency_max_ms),
+                        response_bytes = shopify_api_metric.response_bytes + EXCLUDED.response_bytes,
+                        call_limit_max = GREATEST(shopify_api_metric.call_limit_max, EXCLUDED.call_limit_max),
+                        {bin_updates}
+        """.format(
+            bins=', '.join(LATENCY_BIN_FIELDS),
+            placeholders=', '.join(['%s'] * len(LATENCY_BIN_FIELDS)),
+            bin_updates=', '.join('{0} = shopify_api_metric.{0} + EXCLUDED.{0}'.format(name)
+                                  for name in LATENCY_BIN_FIELDS),
+        )
+        with db_connect(self.dbname).cursor() as cr:
+            for (bucket, endpoint, method, status), row in rows.items():
+                cr.execute(query, (
+                    self.instance_id, datetime.utcfromtimestamp(bucket), endpoint, method, status,
+                    row['count'], row['retries'], row['throttled'], row['latency_sum'],
+                    row['latency_max'], row['bytes'], row['call_limit_max'], *row['bins'],
+                ))
+
+
+class ShopifyApiMetricSummary(models.Model):
+    _name = 'shopify.api.metric.summary'
+    _description = 'Resumen de métricas de la API de Shopify por operación'
+    _auto = False
+    _order = 'call_count desc'
+    _rec_name = 'endpoint'
+
+    shopify_instance_id = fields.Many2one('shopify.web', string='Shopify Instance', readonly=True)
+    endpoint = fields.Char(string='Endpoint', readonly=True)
+    method = fields.Char(string='Método', readonly=True)
+    call_count = fields.Integer(string='Llamadas', readonly=True)
+    retry_count = fields.Integer(string='Reintentos', readonly=True)
+    throttled_count = fields.Integer(string='Respuestas 429', readonly=True)
+    error_count = fields.Integer(string='Errores (5xx/red)', readonly=True)
+    latency_sum_ms = fields.Float(string='Latencia total (ms)', readonly=True)
+    latency_max_ms = fields.Float(string='Latencia máxima (ms)', readonly=True)
+    response_bytes = fields.Float(string='Bytes recibidos', readonly=True)
+    call_limit_max = fields.Integer(string='Uso máximo del bucket', readonly=True)
+    last_call = fields.Datetime(string='Último minuto con llamadas', readonly=True)
+    latency_le_100 = fields.Integer(readonly=True)
+    latency_le_250 = fields.Integer(readonly=True)
+    latency_le_500 = fields.Integer(readonly=True)
+    latency_le_1000 = fields.Integer(readonly=True)
+    latency_le_2500 = fields.Integer(readonly=True)
+    latency_le_5000 = fields.Integer(readonly=True)
+    latency_gt_5000 = fields.Integer(readonly=True)
+
+    latency_avg_ms = fields.Float(string='Latencia media (ms)', compute='_compute_latency_stats')
+    latency_p50_ms = fields.Float(string='p50 (ms)', compute='_compute_latency_stats')
+    latency_p95_ms = fields.Float(string='p95 (ms)', compute='_compute_latency_stats')
+    throttle_rate = fields.Float(string='Tasa de 429 (%)', compute='_compute_latency_stats',
+                                help='Respuestas 429 sobre el total de intentos enviados, reintentos incluidos.')
+
+    def _compute_latency_stats(self):
+        for summary in self:
+            bins = [summary[name] for name in LATENCY_BIN_FIELDS]
+            summary.latency_avg_ms = summary.latency_sum_ms / summary.call_count if summary.call_count else 0.0
+            summary.latency_p50_ms = shopify_client.latency_percentile(bins, 0.5, summary.latency_max_ms)
+            summary.latency_p95_ms = shopify_client.latency_percentile(bins, 0.95, summary.latency_max_ms)
+            attempts = summary.call_count + summary.retry_count
+            summary.throttle_rate = 100.0 * summary.throttled_count / attempts if attempts else 0.0
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("""
+            CREATE OR REPLACE VIEW {} AS (
+                SELECT MIN(id) AS id,
+                       shopify_instance_id,
+                       endpoint,
+                       method,
+                       SUM(call_count) AS call_count,
+                       SUM(retry_count) AS retry_count,
+                       SUM(throttled_count) AS throttled_count,
+                       SUM(CASE WHEN status = 0 OR status >= 500 THEN call_count ELSE 0 END) AS error_count,
+                       SUM(latency_sum_ms) AS latency_sum_ms,
+                       MAX(latency_max_ms) AS latency_max_ms,
+                       SUM(response_bytes) AS response_bytes,
+                       MAX(call_limit_max) AS call_limit_max,
+                       MAX(bucket_start) AS last_call,
+                       {}
+                  FROM shopify_api_metric
+              GROUP BY shopify_instance_id, endpoint, method
+            )
+        """.format(self._table, ', '.join('SUM({0}) AS {0}'.format(name) for name in LATENCY_BIN_FIELDS)))
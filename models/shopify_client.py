@@ -0,0 +1,863 @@
+# -*- coding: utf-8 -*-
+"""HTTP client shared by every Shopify sync path.
+
+This module only depends on ``requests`` so it can be used from worker
+threads without touching the ORM.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+_logger = logging.getLogger(__name__)
+
+# (connect, read) en segundos
+DEFAULT_TIMEOUT = (10, 60)
+DOWNLOAD_TIMEOUT = (10, 90)
+POOL_MAXSIZE = 10
+DEFAULT_MAX_WORKERS = 4
+
+CALL_LIMIT_HEADER = 'X-Shopify-Shop-Api-Call-Limit'
+# Shopify vacía el bucket a capacidad/20 llamadas por segundo (40 -> 2/s, 80 -> 4/s)
+DEFAULT_BUCKET_CAPACITY = 40
+BUCKET_LEAK_DIVISOR = 20.0
+BUCKET_HEADROOM = 2
+
+# 429 lo rechaza Shopify antes de procesar; 5xx pueden haber aplicado el cambio
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60.0
+
+
+# Campos pedidos a Shopify (parámetro fields=) según lo que lee cada caso de uso
+PRODUCT_MATCH_FIELDS = 'id,variants'
+PRODUCT_IMPORT_FIELDS = 'id,updated_at,variants,images'
+LOCATION_FIELDS = 'id,name'
+INVENTORY_ITEM_FIELDS = 'id,sku'
+METAFIELD_FIELDS = 'namespace,key,value'
+PAYOUT_FIELDS = 'id,amount'
+GIFT_CARD_FIELDS = 'id,name,initial_value'
+
+METRIC_BUCKET_SECONDS = 60
+METRIC_FLUSH_INTERVAL = 30.0
+# Límites superiores (ms) del histograma de latencias; el último tramo no tiene límite
+LATENCY_BINS_MS = (100, 250, 500, 1000, 2500, 5000)
+
+# Operaciones bulk de GraphQL: sondeo del estado y límite de espera (s)
+BULK_POLL_INTERVAL = 5.0
+BULK_TIMEOUT = 3600.0
+BULK_PENDING_STATUSES = frozenset(('CREATED', 'RUNNING'))
+BULK_PRODUCTS_QUERY = """
+{
+  products%(filter)s {
+    edges {
+      node {
+        id
+        updatedAt
+        variants {
+          edges {
+            node {
+              id
+              sku
+              barcode
+              inventoryItem { id }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+BULK_RUN_MUTATION = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+BULK_CURRENT_QUERY = """
+{
+  currentBulkOperation {
+    id
+    status
+    errorCode
+    query
+    objectCount
+    url
+  }
+}
+"""
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a shop whose circuit breaker is open."""
+
+
+class BulkOperationError(Exception):
+    """Raised when a GraphQL bulk operation is rejected, fails or times out."""
+
+
+def build_base_url(host, version):
+    """Return the Admin REST base URL for ``host`` and API ``version``.
+
+    ``host`` is normally the shop subdomain. A full URL such as
+    ``http://127.0.0.1:8765`` is used as-is, which lets an instance point
+    at a local stand-in server (see ``benchmarks/shopify_stub.py``).
+    """
+    if '://' in host:
+        return "{}/admin/api/{}".format(host.rstrip('/'), version)
+    return "https://{}.myshopify.com/admin/api/{}".format(host, version)
+
+
+_clients_lock = threading.Lock()
+
+
+def _pooled_session(pool_maxsize=POOL_MAXSIZE):
+    session = requests.Session()
+    # Los reintentos los gestiona el cliente, no urllib3
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def parse_link_header(link_header):
+    """Return a ``{rel: url}`` dict from a ``Link`` header."""
+    # Busca patrones del tipo: <URL>; rel="next", <URL>; rel="previous"
+    return {rel: url for url, rel in re.findall(r'<([^>]+)>;\s*rel="(\w+)"', link_header or '')}
+
+
+def parse_call_limit(value):
+    """Parse ``'32/40'`` into ``(32, 40)``; return ``None`` if malformed."""
+    try:
+        used, capacity = value.split('/')
+        return int(used), int(capacity)
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def run_concurrent(fn, items, max_workers):
+    """Apply ``fn`` to every item on at most ``max_workers`` threads.
+
+    Results are returned in the order of ``items``; an exception raised by
+    ``fn`` is re-raised when its result is collected. ``fn`` runs outside
+    the ORM thread, so it must only do I/O (no ``env`` access).
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix='shopify') as executor:
+        return list(executor.map(fn, items))
+
+
+def run_pipelined(fn, items, max_workers, depth=None):
+    """Yield ``(item, fn(item))`` in the order of ``items`` while the next items are produced.
+
+    ``items`` is consumed lazily on the calling thread, so it may build its
+    items with the ORM while ``fn`` (I/O only) runs on up to
+    ``max_workers`` threads for at most ``depth`` items (twice the workers
+    by default). Results are yielded on the calling thread. An exception
+    raised by ``fn`` is re-raised when its item is yielded; one raised by
+    ``items`` only after the items already submitted have been yielded.
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield item, fn(item)
+        return
+    depth = depth or 2 * max_workers
+    pending = deque()
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shopify-pipeline') as executor:
+        while True:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            except Exception:
+                while pending:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+                raise
+            pending.append((item, executor.submit(fn, item)))
+            if len(pending) >= depth:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter bounded by a per-call deadline.
+
+    A request is replayed when Shopify answers with one of
+    :data:`RETRY_STATUSES` or the connection fails. Non-idempotent requests
+    (POST by default) are only replayed when they certainly did not reach
+    the shop: a 429, a connect timeout or a refused connection.
+    ``Retry-After`` is honoured by the limiter, which blocks the next slot
+    until it expires; calls without a limiter sleep it themselves, or the
+    backoff when the header is missing.
+    """
+
+    def __init__(self, max_attempts=5, backoff_base=0.5, backoff_max=30.0, deadline=120.0):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+
+    def backoff(self, attempt):
+        """Seconds to sleep before retry number ``attempt`` (1-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def should_retry_status(self, status_code, idempotent):
+        if status_code not in RETRY_STATUSES:
+            return False
+        return idempotent or status_code == 429
+
+    def should_retry_error(self, error, idempotent):
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        # Conexión rechazada: la petición no llegó a enviarse
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        if isinstance(reason, NewConnectionError):
+            return True
+        return idempotent and isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def send_with_retry(send, method, url, policy=DEFAULT_RETRY_POLICY, limiter=None, idempotent=None, deadline=None):
+    """Call ``send()`` until it succeeds or ``policy`` gives up.
+
+    ``send`` performs one HTTP attempt and returns the response. The last
+    response is returned once retries are exhausted (the caller decides how
+    to handle the status); the last connection error is re-raised. The
+    number of replays is stored in ``response.shopify_retries`` and the
+    number of 429 answers received in ``response.shopify_throttled``.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    clock = time.monotonic
+    give_up_at = clock() + (deadline if deadline is not None else policy.deadline)
+    attempt = 0
+    throttled = 0
+    while True:
+        attempt += 1
+        if limiter:
+            limiter.acquire()
+        try:
+            response = send()
+        except requests.exceptions.RequestException as e:
+            if limiter:
+                limiter.release()
+            if attempt >= policy.max_attempts or not policy.should_retry_error(e, idempotent):
+                raise
+            wait = policy.backoff(attempt)
+            if clock() + wait > give_up_at:
+                raise
+            _logger.warning("WSSH %s %s falló (%s), reintento %s en %.2fs", method, url, e, attempt, wait)
+        else:
+            if limiter:
+                limiter.observe(response)
+            if response.status_code == 429:
+                throttled += 1
+            response.shopify_retries = attempt - 1
+            response.shopify_throttled = throttled
+            if (attempt >= policy.max_attempts
+                    or not policy.should_retry_status(response.status_code, idempotent)):
+                return response
+            wait = policy.backoff(attempt)
+            if response.status_code == 429:
+                # Con limitador, este ya espera el Retry-After antes del siguiente hueco;
+                # sin él (descargas de CDN o de resultados bulk) se espera aquí
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                wait = 0.0 if limiter else (retry_after if retry_after is not None else wait)
+            if clock() + wait > give_up_at:
+                return response
+            _logger.warning("WSSH %s %s respondió %s, reintento %s en %.2fs",
+                            method, url, response.status_code, attempt, wait)
+            response.close()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class LeakyBucketLimiter:
+    """Client-side mirror of the leaky bucket Shopify keeps for one shop.
+
+    Every call reserves a slot with :meth:`acquire`, which only sleeps when
+    the estimated fill would exceed the capacity (minus a small headroom).
+    :meth:`observe` resynchronises the estimate with the
+    ``X-Shopify-Shop-Api-Call-Limit`` and ``Retry-After`` headers, so the
+    leak rate and capacity follow the shop's real plan.
+
+    The state lives in this object, so it is shared by the threads of one
+    process. Subclasses can keep it elsewhere by overriding :meth:`reserve`,
+    :meth:`release` and :meth:`observe` around the ``_reserve_slot``,
+    ``_release_slot`` and ``_apply_headers`` arithmetic.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, capacity=DEFAULT_BUCKET_CAPACITY, headroom=BUCKET_HEADROOM):
+        self.headroom = headroom
+        self._set_capacity(capacity)
+        self.fill = 0.0
+        self.updated = self.clock()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _set_capacity(self, capacity):
+        self.capacity = capacity
+        self.leak_rate = capacity / BUCKET_LEAK_DIVISOR
+
+    def _drain(self, now):
+        self.fill = max(0.0, self.fill - (now - self.updated) * self.leak_rate)
+        self.updated = now
+
+    def _reserve_slot(self, now):
+        self._drain(now)
+        wait = max(0.0, self.blocked_until - now)
+        overflow = self.fill + 1 - (self.capacity - self.headroom)
+        if overflow > 0:
+            wait = max(wait, overflow / self.leak_rate)
+        self.fill += 1
+        return wait
+
+    def _apply_headers(self, now, status_code, call_limit, retry_after):
+        self._drain(now)
+        if call_limit:
+            used, capacity = call_limit
+            if capacity and capacity != self.capacity:
+                self._set_capacity(capacity)
+            self.fill = float(used)
+        if status_code == 429:
+            self.fill = float(self.capacity)
+            self.blocked_until = max(self.blocked_until, now + (retry_after if retry_after is not None else 1.0))
+
+    def reserve(self):
+        """Reserve one call slot and return the seconds to wait before sending it."""
+        with self._lock:
+            return self._reserve_slot(self.clock())
+
+    def _release_slot(self, now):
+        self._drain(now)
+        self.fill = max(0.0, self.fill - 1)
+
+    def release(self):
+        """Give back a slot reserved for a call that got no response."""
+        with self._lock:
+            self._release_slot(self.clock())
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            _logger.debug("WSSH Bucket lleno, esperando %.2fs", wait)
+            time.sleep(wait)
+        return wait
+
+    def observe(self, response):
+        """Update the bucket estimate from the headers of ``response``."""
+        call_limit = parse_call_limit(response.headers.get(CALL_LIMIT_HEADER))
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        with self._lock:
+            self._apply_headers(self.clock(), response.status_code, call_limit, retry_after)
+
+
+class CircuitBreaker:
+    """Stop calling a shop that keeps failing with 5xx or timeouts.
+
+    After ``failure_threshold`` consecutive failed calls the circuit opens
+    and :meth:`allow` refuses calls for ``reset_timeout`` seconds. Then a
+    single probe is let through (half-open): its success closes the circuit,
+    its failure opens it again. Like :class:`LeakyBucketLimiter`, subclasses
+    can share the state by overriding the public methods around the
+    ``_allow``/``_record`` transitions.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_failure(response=None, error=None):
+        """Tell whether a call outcome means the shop is degraded."""
+        if error is not None:
+            return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+        return response is not None and response.status_code >= 500
+
+    def _is_open(self, now):
+        return self.state != CIRCUIT_CLOSED and now < self.open_until
+
+    def _allow(self, now):
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if now < self.open_until:
+            # Abierto, o con la sonda de half-open todavía en curso
+            return False
+        self.state = CIRCUIT_HALF_OPEN
+        self.open_until = now + self.reset_timeout
+        return True
+
+    def _record(self, now, success):
+        if success:
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+            self.open_until = 0.0
+            return
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                _logger.warning("WSSH Circuito abierto tras %s fallos; sin llamadas durante %ss",
+                                self.failures, self.reset_timeout)
+            self.state = CIRCUIT_OPEN
+            self.open_until = now + self.reset_timeout
+
+    def is_open(self):
+        """Return True while calls are being refused, without taking the probe."""
+        with self._lock:
+            return self._is_open(self.clock())
+
+    def allow(self):
+        with self._lock:
+            return self._allow(self.clock())
+
+    def record(self, success):
+        with self._lock:
+            self._record(self.clock(), success)
+
+
+def normalize_endpoint(url):
+    """Return the endpoint of ``url`` without query, API prefix nor ids.
+
+    ``https://x.myshopify.com/admin/api/2024-01/products/123/variants.json?limit=5``
+    becomes ``products/{id}/variants.json``, so metrics aggregate per operation.
+    """
+    path = urlsplit(url).path
+    path = re.sub(r'^.*?/admin/api/[^/]+/', '', path)
+    return re.sub(r'(?<=/)\d+(?=/|\.json|$)', '{id}', path).lstrip('/')
+
+
+def latency_percentile(bins, quantile, maximum=0.0):
+    """Estimate a latency percentile (ms) from the counts of :data:`LATENCY_BINS_MS`.
+
+    The upper bound of the bin holding the percentile is returned, or
+    ``maximum`` when it falls in the open-ended last bin.
+    """
+    total = sum(bins)
+    if not total:
+        return 0.0
+    target = quantile * total
+    seen = 0
+    for bound, count in zip(LATENCY_BINS_MS, bins):
+        seen += count
+        if seen >= target:
+            return float(min(bound, maximum) if maximum else bound)
+    return float(maximum or LATENCY_BINS_MS[-1])
+
+
+class MetricsBuffer:
+    """Aggregate per-call metrics in memory and flush them periodically.
+
+    Calls are grouped per minute, endpoint, method and status, so the cost
+    of recording is a dict update; :meth:`flush` hands the aggregated rows to
+    :meth:`_write` at most every ``flush_interval`` seconds. The base class
+    only logs them; subclasses persist them.
+    """
+
+    def __init__(self, flush_interval=METRIC_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, method, endpoint, status, latency, size=0, call_limit_used=0, retries=0, throttled=0):
+        """Add one call; ``latency`` in seconds, ``status`` 0 for network errors."""
+        bucket = int(time.time() // METRIC_BUCKET_SECONDS) * METRIC_BUCKET_SECONDS
+        latency_ms = latency * 1000.0
+        bin_index = next((i for i, bound in enumerate(LATENCY_BINS_MS) if latency_ms <= bound),
+                         len(LATENCY_BINS_MS))
+        with self._lock:
+            row = self._rows.get((bucket, endpoint, method, status))
+            if row is None:
+                row = self._rows[(bucket, endpoint, method, status)] = {
+                    'count': 0, 'retries': 0, 'throttled': 0, 'latency_sum': 0.0, 'latency_max': 0.0,
+                    'bytes': 0, 'call_limit_max': 0, 'bins': [0] * (len(LATENCY_BINS_MS) + 1),
+                }
+            row['count'] += 1
+            row['retries'] += retries
+            row['throttled'] += throttled
+            row['latency_sum'] += latency_ms
+            row['latency_max'] = max(row['latency_max'], latency_ms)
+            row['bytes'] += size
+            row['call_limit_max'] = max(row['call_limit_max'], call_limit_used)
+            row['bins'][bin_index] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, {}
+            self._last_flush = time.monotonic()
+        if not rows:
+            return
+        try:
+            self._write(rows)
+        except Exception as e:
+            _logger.warning("WSSH No se pudieron guardar %s filas de métricas de API: %s", len(rows), e)
+
+    def _write(self, rows):
+        for (bucket, endpoint, method, status), row in rows.items():
+            _logger.debug("WSSH API %s %s %s: %s llamadas, %.0f ms de media",
+                          method, endpoint, status, row['count'], row['latency_sum'] / row['count'])
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(shop):
+    """Return the process-wide limiter tracking the bucket of ``shop``."""
+    with _limiters_lock:
+        limiter = _limiters.get(shop)
+        if limiter is None:
+            limiter = _limiters[shop] = LeakyBucketLimiter()
+        return limiter
+
+
+class ShopifyClient:
+    """Keep-alive client for the Admin REST API of one Shopify instance.
+
+    The client owns a pooled :class:`requests.Session`, so consecutive calls
+    reuse the TCP/TLS connection instead of doing a new handshake each time.
+    Calls are paced by the shop's :class:`LeakyBucketLimiter`, which also
+    bounds the throughput of :meth:`map_concurrent`.
+    Endpoints can be given relative to the versioned base URL
+    (``'products.json'``) or as absolute URLs (``Link`` pagination).
+    Every call goes through :func:`send_with_retry` with ``retry_policy``
+    and is refused with :class:`CircuitOpenError` while ``breaker`` is open.
+    When ``metrics`` is given, each call is recorded in that :class:`MetricsBuffer`.
+    """
+
+    def __init__(self, host, version, access_token, timeout=DEFAULT_TIMEOUT, pool_maxsize=POOL_MAXSIZE,
+                 limiter=None, max_workers=DEFAULT_MAX_WORKERS, retry_policy=None, breaker=None, metrics=None):
+        self.host = host
+        self.version = version
+        self.base_url = build_base_url(host, version)
+        self.timeout = timeout
+        self.limiter = limiter or get_limiter(host)
+        self.max_workers = max(1, max_workers or 1)
+        self.retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics
+        self.session = _pooled_session(max(pool_maxsize, self.max_workers))
+        self.session.headers.update({
+            "X-Shopify-Access-Token": access_token or '',
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+            "Content-Type": "application/json",
+        })
+
+    def url(self, endpoint):
+        if endpoint.startswith(('http://', 'https://')):
+            return endpoint
+        return "{}/{}".format(self.base_url, endpoint.lstrip('/'))
+
+    def request(self, method, endpoint, idempotent=None, deadline=None, **kwargs):
+        """Send one logical call, replaying it according to ``retry_policy``.
+
+        :param idempotent: force whether the call may be replayed after a
+            possible delivery (e.g. ``True`` for ``inventory_levels/set``);
+            defaults to the HTTP semantics of ``method``
+        :param deadline: seconds after which no further attempt is started
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.url(endpoint)
+        if method.upper() == 'POST':
+            # La misma clave en todos los intentos de una misma operación
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.setdefault('Idempotency-Key', uuid.uuid4().hex)
+            kwargs['headers'] = headers
+        if not self.breaker.allow():
+            raise CircuitOpenError("WSSH Circuito abierto para {}, no se llama a {}".format(self.host, url))
+        started = time.monotonic()
+        try:
+            response = send_with_retry(
+                lambda: self.session.request(method, url, **kwargs), method, url,
+                policy=self.retry_policy, limiter=self.limiter, idempotent=idempotent, deadline=deadline)
+        except requests.exceptions.RequestException as e:
+            if self.breaker.is_failure(error=e):
+                self.breaker.record(False)
+            self._record_metric(method, url, None, started)
+            raise
+        self.breaker.record(not self.breaker.is_failure(response=response))
+        self._record_metric(method, url, response, started, stream=kwargs.get('stream'))
+        return response
+
+    def _record_metric(self, method, url, response, started, stream=False):
+        if self.metrics is None:
+            return
+        latency = time.monotonic() - started
+        if response is None:
+            self.metrics.record(method, normalize_endpoint(url), 0, latency)
+            return
+        if stream:
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            size = len(response.content or b'')
+        call_limit = parse_call_limit(response.headers.get(CALL_LIMIT_HEADER))
+        self.metrics.record(
+            method, normalize_endpoint(url), response.status_code, latency, size=size,
+            call_limit_used=call_limit[0] if call_limit else 0,
+            retries=getattr(response, 'shopify_retries', 0),
+            throttled=getattr(response, 'shopify_throttled', 0))
+
+    def get(self, endpoint, **kwargs):
+        return self.request('GET', endpoint, **kwargs)
+
+    def post(self, endpoint, **kwargs):
+        return self.request('POST', endpoint, **kwargs)
+
+    def put(self, endpoint, **kwargs):
+        return self.request('PUT', endpoint, **kwargs)
+
+    def delete(self, endpoint, **kwargs):
+        return self.request('DELETE', endpoint, **kwargs)
+
+    def iter_pages(self, endpoint, root_key, params=None, **kwargs):
+        """Yield the ``root_key`` list of every page of a list endpoint.
+
+        Pages are fetched lazily by following ``Link: rel="next"``, so the
+        caller can process each one before the next request is sent.
+        HTTP errors are raised as :class:`requests.HTTPError`.
+        """
+        url = endpoint
+        while url:
+            response = self.get(url, params=params, **kwargs)
+            response.raise_for_status()
+            if not response.content:
+                return
+            yield response.json().get(root_key, [])
+            url = parse_link_header(response.headers.get('Link')).get('next')
+            # La URL de la siguiente página ya incluye page_info y limit
+            params = None
+
+    def graphql(self, query, variables=None, idempotent=None):
+        """Send a GraphQL Admin API call; return its ``data`` or raise :class:`BulkOperationError`."""
+        response = self.post('graphql.json', json={'query': query, 'variables': variables or {}},
+                             idempotent=idempotent)
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get('errors'):
+            raise BulkOperationError("WSSH Error GraphQL en {}: {}".format(self.host, payload['errors']))
+        return payload.get('data') or {}
+
+    def current_bulk_operation(self):
+        return self.graphql(BULK_CURRENT_QUERY, idempotent=True).get('currentBulkOperation')
+
+    def run_bulk_query(self, query, poll_interval=BULK_POLL_INTERVAL, timeout=BULK_TIMEOUT, sleep=time.sleep):
+        """Run a bulk export ``query`` and wait for it; return the finished operation.
+
+        Shopify runs one bulk query per shop at a time: a pending operation
+        with the same query (e.g. left by an interrupted cron) is adopted,
+        any other one is waited for before submitting. The returned dict has
+        the ``url`` of the JSONL result, ``None`` when nothing matched.
+        """
+        deadline = time.monotonic() + timeout
+
+        def wait(operation):
+            while operation and operation['status'] in BULK_PENDING_STATUSES:
+                if time.monotonic() > deadline:
+                    raise BulkOperationError("WSSH Operación bulk {} sin terminar tras {:.0f}s".format(
+                        operation['id'], timeout))
+                sleep(poll_interval)
+                operation = self.current_bulk_operation()
+            return operation
+
+        current = self.current_bulk_operation()
+        if current and current['status'] in BULK_PENDING_STATUSES:
+            if _normalize_query(current.get('query')) == _normalize_query(query):
+                _logger.info("WSSH Retomando operación bulk en curso %s en %s", current['id'], self.host)
+                return self._check_bulk_result(wait(current))
+            _logger.info("WSSH Esperando a la operación bulk %s en %s", current['id'], self.host)
+            wait(current)
+        result = self.graphql(BULK_RUN_MUTATION, {'query': query}).get('bulkOperationRunQuery') or {}
+        if result.get('userErrors'):
+            raise BulkOperationError("WSSH Operación bulk rechazada en {}: {}".format(self.host, result['userErrors']))
+        operation = result.get('bulkOperation')
+        _logger.info("WSSH Operación bulk %s lanzada en %s", operation['id'], self.host)
+        return self._check_bulk_result(wait(operation))
+
+    @staticmethod
+    def _check_bulk_result(operation):
+        if not operation or operation['status'] != 'COMPLETED':
+            raise BulkOperationError("WSSH Operación bulk terminada sin éxito: {}".format(operation))
+        return operation
+
+    def map_concurrent(self, fn, items):
+        """Run independent calls ``fn(item)`` with the concurrency of this shop."""
+        return run_concurrent(fn, items, self.max_workers)
+
+    def pipeline(self, fn, items):
+        """Overlap producing ``items`` with the calls ``fn(item)``; see :func:`run_pipelined`."""
+        return run_pipelined(fn, items, self.max_workers)
+
+    def close(self):
+        if self.metrics is not None:
+            self.metrics.flush()
+        self.session.close()
+
+
+_clients = {}
+
+
+def get_client(key, host, version, access_token, limiter_factory=None, max_workers=DEFAULT_MAX_WORKERS,
+               breaker_factory=None, metrics_factory=None):
+    """Return the cached client for ``key``, rebuilding it if credentials changed.
+
+    :param key: hashable identifying the instance, e.g. ``(dbname, instance_id)``
+    :param limiter_factory: optional callable returning the limiter of a new
+        client; the per-process :func:`get_limiter` is used otherwise
+    :param breaker_factory: optional callable returning the circuit breaker
+        of a new client; a local :class:`CircuitBreaker` is used otherwise
+    :param metrics_factory: optional callable returning the :class:`MetricsBuffer`
+        of a new client; no metrics are recorded otherwise
+    :param max_workers: concurrent calls allowed by :meth:`ShopifyClient.map_concurrent`
+    """
+    signature = (host, version, access_token, max_workers)
+    with _clients_lock:
+        cached = _clients.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        if cached:
+            cached[1].close()
+        limiter = limiter_factory() if limiter_factory else None
+        breaker = breaker_factory() if breaker_factory else None
+        metrics = metrics_factory() if metrics_factory else None
+        client = ShopifyClient(host, version, access_token, limiter=limiter, max_workers=max_workers,
+                               breaker=breaker, metrics=metrics)
+        _clients[key] = (signature, client)
+        return client
+
+
+_download_session = None
+
+
+def download(url, **kwargs):
+    """GET an external resource (e.g. CDN images) through a pooled session.
+
+    A dedicated session is used so the shop access token is never sent to
+    third-party hosts.
+    """
+    global _download_session
+    if _download_session is None:
+        with _clients_lock:
+            if _download_session is None:
+                _download_session = _pooled_session()
+    kwargs.setdefault('timeout', DOWNLOAD_TIMEOUT)
+    return send_with_retry(lambda: _download_session.get(url, **kwargs), 'GET', url)
+
+
+def _normalize_query(query):
+    return ' '.join((query or '').split())
+
+
+def legacy_id(gid):
+    """Return the numeric REST id of a GraphQL global id (``gid://shopify/Product/1``)."""
+    return int(gid.rsplit('/', 1)[-1]) if gid else None
+
+
+def bulk_products_query(updated_since=None):
+    """Bulk export query of the product/variant fields used by the import, by ascending id.
+
+    :param updated_since: naive UTC datetime; only the products updated
+        since then are exported
+    """
+    arguments = ['sortKey: ID']
+    if updated_since:
+        # La sintaxis de búsqueda de Shopify espera la fecha en UTC con sufijo Z
+        arguments.insert(0, 'query: "updated_at:>=\'{}\'"'.format(updated_since.strftime('%Y-%m-%dT%H:%M:%SZ')))
+    return BULK_PRODUCTS_QUERY % {'filter': '({})'.format(', '.join(arguments))}
+
+
+def iter_bulk_lines(url, **kwargs):
+    """Yield the objects of a bulk operation JSONL result, one line at a time."""
+    response = download(url, stream=True, **kwargs)
+    try:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+    finally:
+        response.close()
+
+
+def iter_bulk_products(objects):
+    """Rebuild REST-shaped products (``id``, ``updated_at``, ``variants``) from bulk objects.
+
+    Bulk results list each product followed by its variants, which carry
+    ``__parentId``; only the product being assembled is kept in memory.
+    """
+    product = None
+    for obj in objects:
+        if obj.get('__parentId'):
+            if product is None or legacy_id(obj['__parentId']) != product['id']:
+                _logger.warning("WSSH Variante %s fuera de su producto en el resultado bulk", obj.get('id'))
+                continue
+            item = obj.get('inventoryItem') or {}
+            product['variants'].append({
+                'id': legacy_id(obj['id']),
+                'product_id': product['id'],
+                'sku': obj.get('sku') or '',
+                'barcode': obj.get('barcode'),
+                'inventory_item_id': legacy_id(item.get('id')),
+            })
+            continue
+        if product is not None:
+            yield product
+        product = {'id': legacy_id(obj['id']), 'updated_at': obj.get('updatedAt'), 'variants': []}
+    if product is not None:
+        yield product
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,8 +1,9 @@
 # create a model for shopify instance
-import requests
 from odoo import api, fields, models, _
 import logging
 
+from . import shopify_client
+
 _logger = logging.getLogger(__name__)
 
 
@@ -27,38 +28,21 @@ class ShopifyLocation(models.Model):
     def import_shopify_locations(self, shopify_instance_ids):
         if shopify_instance_ids == False:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active','=',True)])
-        for shopify_instance_id in shopify_instance_ids:
-            url = self.get_location_url(shopify_instance_id, endpoint='locations.json')
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token,
-            }
-            params = {
-                "limit": 250,  # Adjust the page size as needed
-                "page_info": None
-            }
+        return shopify_instance_ids._shopify_fan_out('shopify.location', 'import_shopify_locations_sub')
 
-            all_locations = []
-            while True:
-                response = requests.get(url, headers=headers, params=params)
-                if response.status_code == 200 and response.content:
-                    shopify_locations = response.json()
-                    locations = shopify_locations.get('locations', [])
-                    all_locations.extend(locations)
-                    page_info = shopify_locations.get('page_info', {})
-                    if 'has_next_page' in page_info and page_info['has_next_page']:
-                        params['page_info'] = page_info['next_page']
-                    else:
-                        break
-                else:
-                    break
+    def import_shopify_locations_sub(self, shopify_instance_id):
+        params = {
+            "limit": 250,  # Adjust the page size as needed
+            "fields": shopify_client.LOCATION_FIELDS,
+        }
+
+        location_list = []
+        for locations in shopify_instance_id.shopify_iter_pages('locations.json', 'locations', params):
+            location_list.extend(self.create_locations(locations, shopify_instance_id))
 
-            if all_locations:
-                locations = self.create_locations(all_locations, shopify_instance_id)
-                return locations
-            else:
-                _logger.info("Locations not found in shopify store")
-                return []
+        if not location_list:
+            _logger.info("Locations not found in shopify store")
+        return location_list
 
     def get_location_url(self, shopify_instance_id, endpoint):
         shop_url = "https://{}.myshopify.com/admin/api/{}/{}".format(shopify_instance_id.shopify_host,
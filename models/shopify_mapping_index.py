@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""In-memory indexes of the product mappings of one Shopify instance.
+
+Imports look up thousands of Shopify ids; loading each mapping model once
+(or each page of candidates in bulk) and answering from dicts replaces one
+ORM search per product or variant. The export does the same for the
+variants and attribute values of each chunk of templates it sends.
+"""
+import logging
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+
+class MapTable:
+    """Both directions of one mapping model restricted to an instance.
+
+    ``by_web`` maps the Shopify id (always as ``str``) to the Odoo id and
+    ``by_odoo`` maps the Odoo id to ``(map_id, web_id)``.
+    """
+
+    def __init__(self, env, model, web_field, instance):
+        self.env = env
+        self.model = model
+        self.web_field = web_field
+        self.instance = instance
+        self.by_web = {}
+        self.by_odoo = {}
+        rows = env[model].sudo().search_read(
+            [('shopify_instance_id', '=', instance.id)], [web_field, 'odoo_id'], load=None)
+        for row in rows:
+            web_id = str(row[web_field])
+            self.by_web[web_id] = row['odoo_id']
+            self.by_odoo[row['odoo_id']] = (row['id'], web_id)
+
+    def odoo_id(self, web_id):
+        return self.by_web.get(str(web_id)) if web_id else None
+
+    def web_id(self, odoo_id):
+        entry = self.by_odoo.get(odoo_id)
+        return entry[1] if entry else None
+
+    def set(self, odoo_id, web_id):
+        """Create or update the mapping of ``odoo_id`` so it points to ``web_id``."""
+        self.set_many([(odoo_id, web_id)])
+
+    def set_many(self, pairs):
+        """Apply ``(odoo_id, web_id)`` pairs; new mappings are created in one ``create``."""
+        Map = self.env[self.model].sudo()
+        to_create = {}
+        for odoo_id, web_id in pairs:
+            web_id = str(web_id)
+            entry = self.by_odoo.get(odoo_id)
+            if entry is None:
+                to_create[odoo_id] = web_id
+                continue
+            if entry[1] == web_id:
+                continue
+            Map.browse(entry[0]).write({self.web_field: web_id})
+            if self.by_web.get(entry[1]) == odoo_id:
+                del self.by_web[entry[1]]
+            self.by_odoo[odoo_id] = (entry[0], web_id)
+            self.by_web[web_id] = odoo_id
+        if not to_create:
+            return
+        maps = Map.create([{
+            self.web_field: web_id,
+            'odoo_id': odoo_id,
+            'shopify_instance_id': self.instance.id,
+        } for odoo_id, web_id in to_create.items()])
+        for map_id, (odoo_id, web_id) in zip(maps.ids, to_create.items()):
+            self.by_odoo[odoo_id] = (map_id, web_id)
+            self.by_web[web_id] = odoo_id
+
+
+class ShopifyMappingIndex:
+    """Template, color-value and variant mappings of an instance, loaded once.
+
+    Built with one ``search_read`` per mapping model and kept up to date by
+    :meth:`MapTable.set`, so it stays valid across the pages of a run.
+    """
+
+    def __init__(self, env, instance):
+        self.env = env
+        self.instance = instance
+        self.templates = MapTable(env, 'shopify.product.template.map', 'web_product_id', instance)
+        self.color_values = MapTable(env, 'shopify.product.map', 'web_product_id', instance)
+        self.variants = MapTable(env, 'shopify.variant.map', 'web_variant_id', instance)
+        # Plantilla de cada valor de color mapeado, para no leerla producto a producto
+        ptav_ids = list(self.color_values.by_odoo)
+        self.color_value_templates = {
+            row['id']: row['product_tmpl_id']
+            for row in env['product.template.attribute.value'].sudo().browse(ptav_ids).exists().read(
+                ['product_tmpl_id'], load=None)
+        } if ptav_ids else {}
+        _logger.info("WSSH Índice de mapeos cargado para %s: %d plantillas, %d colores, %d variantes",
+                     instance.name, len(self.templates.by_web), len(self.color_values.by_web),
+                     len(self.variants.by_web))
+
+    def mapped_template_id(self, web_product_id, split_by_color):
+        """Return the template already mapped to a Shopify product, or ``None``."""
+        if split_by_color:
+            ptav_id = self.color_values.odoo_id(web_product_id)
+            return self.color_value_templates.get(ptav_id) if ptav_id else None
+        return self.templates.odoo_id(web_product_id)
+
+    def set_color_value(self, ptav_id, template_id, web_product_id):
+        self.color_values.set(ptav_id, web_product_id)
+        self.color_value_templates[ptav_id] = template_id
+
+
+class ShopifyVariantResolver:
+    """Resolve Shopify variants to ``product.product`` ids a page at a time.
+
+    :meth:`load` reads the candidates of a whole page with one query on
+    the variant maps (skipped when a :class:`MapTable` is given) and one on
+    ``product.product`` by id, ``default_code`` and ``barcode``;
+    :meth:`resolve` then answers from memory with the priority the
+    per-variant searches had: variant map, then SKU, then barcode.
+    """
+
+    def __init__(self, env, instance, variant_map=None, domain=None):
+        self.env = env
+        self.instance = instance
+        self.variant_map = variant_map
+        self.domain = domain or []
+        self.mapped = {}
+        self.products = set()
+        self.by_sku = {}
+        self.by_barcode = {}
+
+    def load(self, variant_ids=(), skus=(), barcodes=()):
+        """Bulk-load the candidates of one page; the values already loaded are kept."""
+        web_ids = {str(v) for v in variant_ids if v} - set(self.mapped)
+        skus = {s for s in skus if s} - set(self.by_sku)
+        barcodes = {b for b in barcodes if b} - set(self.by_barcode)
+        if web_ids:
+            if self.variant_map is not None:
+                for web_id in web_ids:
+                    self.mapped[web_id] = self.variant_map.odoo_id(web_id)
+            else:
+                rows = self.env['shopify.variant.map'].sudo().search_read([
+                    ('shopify_instance_id', '=', self.instance.id),
+                    ('web_variant_id', 'in', list(web_ids)),
+                ], ['web_variant_id', 'odoo_id'], load=None)
+                found = {row['web_variant_id']: row['odoo_id'] for row in rows}
+                for web_id in web_ids:
+                    self.mapped[web_id] = found.get(web_id)
+        mapped_ids = {self.mapped[web_id] for web_id in web_ids if self.mapped[web_id]}
+        if not (mapped_ids or skus or barcodes):
+            return
+        keys = []
+        if mapped_ids:
+            keys.append(('id', 'in', list(mapped_ids)))
+        if skus:
+            keys.append(('default_code', 'in', list(skus)))
+        if barcodes:
+            keys.append(('barcode', 'in', list(barcodes)))
+        domain = ['|'] * (len(keys) - 1) + keys + self.domain
+        # El orden por defecto del modelo decide, como en las búsquedas con limit=1
+        for row in self.env['product.product'].sudo().search_read(domain, ['default_code', 'barcode'], load=None):
+            self.products.add(row['id'])
+            if row['default_code'] in skus:
+                self.by_sku.setdefault(row['default_code'], row['id'])
+            if row['barcode'] in barcodes:
+                self.by_barcode.setdefault(row['barcode'], row['id'])
+        for sku in skus:
+            self.by_sku.setdefault(sku, None)
+        for barcode in barcodes:
+            self.by_barcode.setdefault(barcode, None)
+
+    def resolve(self, variant_id=None, sku=None, barcode=None):
+        """Return the ``product.product`` id of a loaded variant, or ``None``."""
+        if variant_id:
+            web_id = str(variant_id)
+            odoo_id = self.mapped.get(web_id)
+            if odoo_id is None and self.variant_map is not None:
+                # Mapas creados después de cargar la página
+                odoo_id = self.variant_map.odoo_id(web_id)
+            if odoo_id in self.products:
+                return odoo_id
+        return (sku and self.by_sku.get(sku)) or (barcode and self.by_barcode.get(barcode)) or None
+
+
+class ShopifyExportPrefetch:
+    """Variants, attribute values and mappings of a chunk of templates.
+
+    Loaded with one query per model for the whole chunk, so the export
+    payload builders read dicts instead of walking ``product_variant_ids``,
+    ``product_template_attribute_value_ids`` and the mapping one2manys of
+    every product. Variant rows keep the order of ``product_variant_ids``
+    and attribute lines the order of ``attribute_line_ids``.
+    """
+
+    def __init__(self, env, instance, templates):
+        self.env = env
+        self.instance = instance
+        tmpl_ids = templates.ids
+        self.templates = {
+            row['id']: row for row in templates.read(['list_price', 'wholesale_price'], load=None)
+        }
+        # tmpl_id -> [(attribute_id, [ptav ids])]
+        self.lines = defaultdict(list)
+        for row in env['product.template.attribute.line'].search_read(
+                [('product_tmpl_id', 'in', tmpl_ids)],
+                ['product_tmpl_id', 'attribute_id', 'product_template_value_ids'], load=None):
+            self.lines[row['product_tmpl_id']].append((row['attribute_id'], row['product_template_value_ids']))
+        # tmpl_id -> [{'id', 'default_code', 'barcode', 'product_template_attribute_value_ids'}]
+        self.variants = defaultdict(list)
+        for row in env['product.product'].search_read(
+                [('product_tmpl_id', 'in', tmpl_ids)],
+                ['product_tmpl_id', 'default_code', 'barcode', 'product_template_attribute_value_ids'], load=None):
+            self.variants[row['product_tmpl_id']].append(row)
+        variant_ids = [row['id'] for rows in self.variants.values() for row in rows]
+
+        ptav_ids = {value_id for lines in self.lines.values() for _attribute_id, value_ids in lines
+                    for value_id in value_ids}
+        ptav_ids.update(value_id for rows in self.variants.values() for row in rows
+                        for value_id in row['product_template_attribute_value_ids'])
+        values = env['product.template.attribute.value'].browse(list(ptav_ids))
+        self.values = {row['id']: row for row in values.read(['name', 'attribute_id'], load=None)}
+        # Registros del mismo recordset: comparten caché y prefetch al usarlos como color_value
+        self.value_records = {value.id: value for value in values}
+        attribute_ids = {attribute_id for lines in self.lines.values() for attribute_id, _value_ids in lines}
+        attribute_ids.update(row['attribute_id'] for row in self.values.values())
+        self.attribute_names = {
+            row['id']: row['name'] or ''
+            for row in env['product.attribute'].browse(list(attribute_ids)).read(['name'], load=None)
+        }
+
+        self.variant_maps = {
+            row['odoo_id']: row['web_variant_id']
+            for row in env['shopify.variant.map'].sudo().search_read([
+                ('shopify_instance_id', '=', instance.id),
+                ('odoo_id', 'in', variant_ids),
+            ], ['odoo_id', 'web_variant_id'], load=None)
+        }
+        self.template_maps = {
+            m.odoo_id.id: m for m in env['shopify.product.template.map'].search([
+                ('shopify_instance_id', '=', instance.id),
+                ('odoo_id', 'in', tmpl_ids),
+            ])
+        }
+        self.color_maps = {
+            m.odoo_id.id: m for m in env['shopify.product.map'].search([
+                ('shopify_instance_id', '=', instance.id),
+                ('odoo_id', 'in', list(ptav_ids)),
+            ])
+        }
+
+    def attribute_name(self, attribute_id):
+        return self.attribute_names.get(attribute_id, '')
+
+    def color_values(self, tmpl_id):
+        """Return the values of the template's color line, or ``None`` without one."""
+        for attribute_id, value_ids in self.lines[tmpl_id]:
+            if self.attribute_name(attribute_id).lower() == 'color':
+                return [self.value_records[value_id] for value_id in value_ids]
+        return None
+
+    def export_variants(self, tmpl_id, color_value_id=None):
+        """Variant rows of a template with a barcode, restricted to a color value if given."""
+        return [
+            row for row in self.variants[tmpl_id]
+            if row['barcode'] and (not color_value_id or color_value_id in row['product_template_attribute_value_ids'])
+        ]
+
+    def product_map(self, tmpl_id, color_value_id=None):
+        """Return the product map of a template or color value; empty recordset if unmapped."""
+        if color_value_id:
+            return self.color_maps.get(color_value_id, self.env['shopify.product.map'])
+        return self.template_maps.get(tmpl_id, self.env['shopify.product.template.map'])
@@ -1,10 +1,11 @@
 # create a class for gift card from shopify
-import requests
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 
 import logging
 
+from . import shopify_client
+
 _logger = logging.getLogger(__name__)
 
 
@@ -30,38 +31,21 @@ class ShopifyPayout(models.Model):
     def import_payouts(self, shopify_instance_ids):
         if shopify_instance_ids == False:
             shopify_instance_ids = self.env['shopify.web'].sudo().search([('shopify_active', '=', True)])
-        for shopify_instance_id in shopify_instance_ids:
-            url = self.get_payout_url(shopify_instance_id, endpoint='shopify_payments/payouts.json')
-            access_token = shopify_instance_id.shopify_shared_secret
-            headers = {
-                "X-Shopify-Access-Token": access_token,
-            }
-            params = {
-                "limit": 250,  # Adjust the page size as needed
-                "page_info": None,
-            }
+        return shopify_instance_ids._shopify_fan_out('shopify.payout', 'import_payouts_sub')
 
-            all_payouts = []
-            while True:
-                response = requests.get(url, headers=headers, params=params)
-                if response.status_code == 200 and response.content:
-                    payouts = response.json()
-                    cards = payouts.get('payouts', [])
-                    all_payouts.extend(cards)
-                    page_info = payouts.get('page_info', {})
-                    if 'has_next_page' in page_info and page_info['has_next_page']:
-                        params['page_info'] = page_info['next_page']
-                    else:
-                        break
-                else:
-                    break
+    def import_payouts_sub(self, shopify_instance_id):
+        params = {
+            "limit": 250,  # Adjust the page size as needed
+            "fields": shopify_client.PAYOUT_FIELDS,
+        }
 
-            if all_payouts:
-                payouts = self.create_payouts(all_payouts, shopify_instance_id)
-                return payouts
-            else:
-                _logger.info("Payouts not found in shopify store")
-                return []
+        payout_list = []
+        for payouts in shopify_instance_id.shopify_iter_pages('shopify_payments/payouts.json', 'payouts', params):
+            payout_list.extend(self.create_payouts(payouts, shopify_instance_id))
+
+        if not payout_list:
+            _logger.info("Payouts not found in shopify store")
+        return payout_list
 
     def get_payout_url(self, shopify_instance_id, endpoint):
         shop_url = "https://{}.myshopify.com/admin/api/{}/{}".format(shopify_instance_id.shopify_host,
@@ -2,7 +2,7 @@
 # See LICENSE file for full copyright and licensing details.
 
 import logging
-from odoo import models, fields
+from odoo import api, models, fields
 
 _logger = logging.getLogger("Shopify Image")
 
@@ -17,10 +17,67 @@ class ShopifyProductImage(models.Model):
     shopify_variant_id = fields.Many2one("product.product")
     shopify_template_id = fields.Many2one("product.template")
     url = fields.Char(string="URL", help="External URL of image")
-    shopify_image = fields.Binary(string="Shopify Image", help="Image of product in Shopify")
-    image = fields.Image()
+    attachment_id = fields.Many2one("ir.attachment", string="Attachment", ondelete="set null",
+                                    help="Stored image bytes, shared by every image record with the same checksum.")
+    shopify_image = fields.Binary(string="Shopify Image", compute="_compute_shopify_image",
+                                  help="Image of product in Shopify")
+    image_url = fields.Char(string="Image URL", compute="_compute_shopify_image",
+                            help="Local URL of the image; sizes are generated on request by /web/image.")
+    etag = fields.Char(string="ETag", help="ETag returned by the image host, sent back as If-None-Match.")
+    last_modified = fields.Char(string="Last Modified",
+                                help="Last-Modified returned by the image host, sent back as If-Modified-Since.")
+    checksum = fields.Char(string="Checksum", help="SHA-1 of the stored image bytes.")
 
+    @api.depends("attachment_id")
+    def _compute_shopify_image(self):
+        for record in self:
+            attachment = record.attachment_id.sudo()
+            record.shopify_image = attachment.datas if attachment else False
+            record.image_url = "/web/image/ir.attachment/%s/datas" % attachment.id if attachment else False
 
+    @api.model
+    def _get_image_attachment(self, content, checksum, shopify_image_id, mimetype=None):
+        """Return the attachment holding ``content``, creating it only for new checksums."""
+        Attachment = self.env["ir.attachment"].sudo()
+        attachment = Attachment.search([
+            ("res_model", "=", self._name),
+            ("checksum", "=", checksum),
+        ], limit=1)
+        if not attachment:
+            vals = {
+                "name": "shopify_image_%s" % shopify_image_id,
+                "res_model": self._name,
+                "raw": content,
+            }
+            if mimetype:
+                vals["mimetype"] = mimetype
+            attachment = Attachment.create(vals)
+        return attachment
 
+    @api.model
+    def _image_checksums(self, records, field_name):
+        """Map ``records`` ids to the checksum of their ``field_name`` image (one query)."""
+        if not records:
+            return {}
+        rows = self.env["ir.attachment"].sudo().search_read([
+            ("res_model", "=", records._name),
+            ("res_field", "=", field_name),
+            ("res_id", "in", records.ids),
+        ], ["res_id", "checksum"])
+        return {row["res_id"]: row["checksum"] for row in rows}
 
+    @api.model
+    def _unchanged_image_targets(self, targets, checksum):
+        """Return the subset of ``targets`` already showing the image ``checksum``.
+
+        Variants without their own image show the template's, so a group
+        image equal to the template image needs no copy on the variants.
+        """
+        if targets._name == "product.template":
+            current = self._image_checksums(targets, "image_1920")
+            return targets.filtered(lambda t: current.get(t.id) == checksum)
+        own = self._image_checksums(targets, "image_variant_1920")
+        templates = self._image_checksums(targets.product_tmpl_id, "image_1920")
+        return targets.filtered(
+            lambda v: own.get(v.id, templates.get(v.product_tmpl_id.id)) == checksum)
 
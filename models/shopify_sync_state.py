@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import time
+from datetime import timedelta
+
+from odoo import api, fields, models, tools
+from odoo.sql_db import db_connect
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Un checkpoint se escribe cada CHECKPOINT_EVERY elementos o CHECKPOINT_INTERVAL segundos
+CHECKPOINT_EVERY = 25
+CHECKPOINT_INTERVAL = 10.0
+
+# Parte del límite de tiempo real del worker que puede usar una ejecución; el resto es margen
+RUN_BUDGET_SHARE = 0.8
+# Duración de una ejecución cuando el servidor no tiene límite de tiempo real
+DEFAULT_RUN_SECONDS = 300
+# Peso de la última medida en la media móvil del coste por elemento
+EWMA_ALPHA = 0.2
+
+# Tarea programada del módulo que lanza cada sincronización, para estimar cuándo se vacía la cola;
+# la exportación de stock no tiene tarea propia
+SYNC_CRON_XMLIDS = {
+    'product_export': 'ws_shopify.cron_export_products_from_shopify',
+}
+
+CRON_INTERVAL_SECONDS = {'minutes': 60, 'hours': 3600, 'days': 86400, 'weeks': 604800, 'months': 2592000}
+
+# Campos de shopify.web que se leen y escriben en el estado de sincronización: (sync_key, columna)
+SYNC_STATE_FIELDS = {
+    'last_export_product': ('product_export', 'last_date'),
+    'last_export_product_id': ('product_export', 'last_id'),
+    'last_export_stock': ('stock_export', 'last_date'),
+    'last_export_stock_id': ('stock_export', 'last_id'),
+}
+# Campos de shopify.web de solo lectura con la estimación de la cola pendiente
+SYNC_REPORT_FIELDS = {
+    'product_export_pending': ('product_export', 'pending_items'),
+    'product_export_drain_eta': ('product_export', 'drain_eta'),
+    'stock_export_pending': ('stock_export', 'pending_items'),
+    'stock_export_drain_eta': ('stock_export', 'drain_eta'),
+}
+
+
+class ShopifySyncState(models.Model):
+    _name = 'shopify.sync.state'
+    _description = 'Progreso de las sincronizaciones de Shopify'
+    _rec_name = 'sync_key'
+
+    shopify_instance_id = fields.Many2one('shopify.web', string='Shopify Instance', required=True,
+                                          ondelete='cascade', index=True)
+    sync_key = fields.Selection([
+        ('product_export', 'Exportación de productos'),
+        ('stock_export', 'Exportación de stock'),
+    ], string='Sincronización', required=True)
+    last_id = fields.Integer(string='Último ID procesado', default=0,
+                             help='Registro de Odoo hasta el que llegó la ejecución en curso; 0 si terminó.')
+    last_date = fields.Datetime(string='Fecha de referencia',
+                                help='Los registros modificados desde esta fecha se envían en la siguiente ejecución.')
+    item_seconds = fields.Float(string='Segundos por elemento',
+                                help='Media móvil del tiempo por elemento medido en las últimas ejecuciones.')
+    pending_items = fields.Integer(string='Elementos pendientes', help='Cola que quedó al terminar la última ejecución.')
+    drain_runs = fields.Integer(string='Ejecuciones para vaciar la cola')
+    drain_eta = fields.Datetime(string='Cola vacía hacia',
+                                help='Estimación según el coste por elemento, el tiempo de cada ejecución y el '
+                                     'intervalo de la tarea programada.')
+
+    _sql_constraints = [
+        ('sync_key_unique',
+         'UNIQUE(shopify_instance_id, sync_key)',
+         'Solo puede existir un estado por instancia y sincronización.')
+    ]
+
+    def init(self):
+        # Los checkpoints vivían en columnas de shopify_web; se conservan al actualizar el módulo
+        for sync_key, id_column, date_column in (
+                ('product_export', 'last_export_product_id', 'last_export_product'),
+                ('stock_export', 'last_export_stock_id', 'last_export_stock')):
+            if not tools.column_exists(self.env.cr, 'shopify_web', id_column):
+                continue
+            self.env.cr.execute("""
+                INSERT INTO shopify_sync_state (shopify_instance_id, sync_key, last_id, last_date)
+                     SELECT id, %s, COALESCE({}, 0), {}
+                       FROM shopify_web
+                ON CONFLICT (shopify_instance_id, sync_key) DO NOTHING
+            """.format(id_column, date_column), (sync_key,))
+
+    @api.model
+    def _get_checkpoint(self, shopify_instance, sync_key):
+        return SyncCheckpoint(self.env.cr, shopify_instance.id, sync_key)
+
+    @api.model
+    def _get_run_budget(self, shopify_instance, sync_key, max_seconds=0, elapsed=0.0, instances_left=1):
+        """Return the :class:`RunBudget` of a run that started ``elapsed`` seconds ago.
+
+        The run may use the configured ``max_seconds`` (if any) and never
+        more than :data:`RUN_BUDGET_SHARE` of the worker's real-time limit
+        left, split evenly among the ``instances_left`` instances the run
+        still has to sync; the cost per item starts from the one measured
+        in previous runs.
+        """
+        limit = config.get('limit_time_real_cron')
+        if limit is None or limit < 0:
+            limit = config.get('limit_time_real')
+        seconds = [(limit * RUN_BUDGET_SHARE - elapsed) / max(1, instances_left)] if limit and limit > 0 else []
+        if max_seconds and max_seconds > 0:
+            seconds.append(max_seconds)
+        state = self._read_states(shopify_instance).get((shopify_instance.id, sync_key))
+        cron = SYNC_CRON_XMLIDS.get(sync_key) and self.sudo().env.ref(SYNC_CRON_XMLIDS[sync_key],
+                                                                    raise_if_not_found=False)
+        interval = (cron.interval_number * CRON_INTERVAL_SECONDS.get(cron.interval_type, 0)
+                    if cron and cron.active else 0)
+        return RunBudget(max(0.0, min(seconds)) if seconds else DEFAULT_RUN_SECONDS,
+                         item_seconds=state['item_seconds'] if state else 0.0, interval=interval)
+
+    @api.model
+    def _read_states(self, shopify_instances):
+        """Return ``{(instance_id, sync_key): row}`` for the given instances."""
+        rows = self.sudo().search_read(
+            [('shopify_instance_id', 'in', shopify_instances.ids)],
+            ['shopify_instance_id', 'sync_key', 'last_id', 'last_date', 'item_seconds', 'pending_items', 'drain_eta'],
+            load=None)
+        return {(row['shopify_instance_id'], row['sync_key']): row for row in rows}
+
+    @api.model
+    def _write_state(self, shopify_instance, sync_key, vals):
+        state = self.sudo().search([
+            ('shopify_instance_id', '=', shopify_instance.id),
+            ('sync_key', '=', sync_key),
+        ])
+        if state:
+            state.write(vals)
+        else:
+            self.sudo().create(dict(vals, shopify_instance_id=shopify_instance.id, sync_key=sync_key))
+
+
+class SyncCheckpoint:
+    """Buffer the progress of a sync and save it every few items or seconds.
+
+    :meth:`advance` records the last item done; every ``every`` items or
+    ``interval`` seconds the caller's transaction is committed, so the maps
+    of the items already sent persist, and the progress is upserted into
+    ``shopify_sync_state`` in its own short transaction, without touching
+    the ``shopify.web`` row users edit. Used as a context manager, the
+    caller's transaction is committed and the pending progress saved on
+    exit, also when the sync fails, so the work of each item must be
+    atomic (e.g. run in a savepoint).
+    """
+
+    def __init__(self, cr, instance_id, sync_key, every=CHECKPOINT_EVERY, interval=CHECKPOINT_INTERVAL,
+                 clock=time.monotonic):
+        self.cr = cr
+        self.instance_id = instance_id
+        self.sync_key = sync_key
+        self.every = every
+        self.interval = interval
+        self.clock = clock
+        self.pending = {}
+        self.count = 0
+        self.flushed_at = clock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.pending:
+                self.flush()
+            else:
+                # Sin progreso pendiente (p. ej. justo tras un guardado) también se confirman
+                # los mapeos de lo ya enviado, para no repetirlo en la siguiente ejecución
+                self.commit()
+        except Exception as e:
+            if exc_type is None:
+                raise
+            _logger.warning("WSSH No se pudo guardar el checkpoint %s de la instancia %s: %s",
+                            self.sync_key, self.instance_id, e)
+        return False
+
+    def advance(self, last_id):
+        self.pending['last_id'] = last_id
+        self.count += 1
+        if self.count >= self.every or self.clock() - self.flushed_at >= self.interval:
+            self.flush()
+
+    def report(self, vals):
+        """Add the run's statistics (see :meth:`RunBudget.drain_estimate`) to the next save."""
+        self.pending.update(vals)
+
+    def finish(self, last_date, complete=True):
+        """Save the end of a run; a ``complete`` run also resets the last id."""
+        self.pending['last_date'] = last_date
+        if complete:
+            self.pending['last_id'] = 0
+        self.flush()
+
+    def commit(self):
+        """Commit the caller's transaction: the work of the items done so far."""
+        self.cr.commit()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.commit()
+        vals = self.pending
+        columns = sorted(vals)
+        with db_connect(self.cr.dbname).cursor() as cr:
+            cr.execute("""
+                INSERT INTO shopify_sync_state (shopify_instance_id, sync_key, {columns}, write_date)
+                     VALUES (%s, %s, {placeholders}, (now() at time zone 'UTC'))
+                ON CONFLICT (shopify_instance_id, sync_key) DO UPDATE
+                        SET {updates}, write_date = EXCLUDED.write_date
+            """.format(
+                columns=', '.join(columns),
+                placeholders=', '.join(['%s'] * len(columns)),
+                updates=', '.join('{0} = EXCLUDED.{0}'.format(column) for column in columns),
+            ), [self.instance_id, self.sync_key] + [vals[column] for column in columns])
+        _logger.info("WSSH Checkpoint %s de la instancia %s: %s (%d elementos)",
+                     self.sync_key, self.instance_id, vals, self.count)
+        self.pending = {}
+        self.count = 0
+        self.flushed_at = self.clock()
+
+
+class RunBudget:
+    """Size a sync run to the time it may use, from the measured cost per item.
+
+    :meth:`tick` after each item updates an exponentially weighted moving
+    average of the seconds per item, seeded with the previous runs'; the
+    run takes a new item only while :meth:`allows` says that the elapsed
+    time plus the expected cost of that item and of those still in flight
+    fits in ``seconds``.
+    """
+
+    def __init__(self, seconds, item_seconds=0.0, interval=0, alpha=EWMA_ALPHA, clock=time.monotonic):
+        self.seconds = seconds
+        self.item_seconds = item_seconds or 0.0
+        self.interval = interval
+        self.alpha = alpha
+        self.clock = clock
+        self.started = self.last_tick = clock()
+        self.items = 0
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def allows(self, in_flight=0):
+        return self.elapsed() + self.item_seconds * (in_flight + 1) <= self.seconds
+
+    def skip(self):
+        """Start the next sample now, leaving out an item that needed no request."""
+        self.last_tick = self.clock()
+
+    def tick(self):
+        now = self.clock()
+        sample = now - self.last_tick
+        self.last_tick = now
+        self.items += 1
+        if self.item_seconds:
+            self.item_seconds += self.alpha * (sample - self.item_seconds)
+        else:
+            self.item_seconds = sample
+
+    def drain_estimate(self, pending_items):
+        """Return the sync state values estimating when ``pending_items`` will be done."""
+        runs = max(1, math.ceil(pending_items * self.item_seconds / self.seconds)) if pending_items and self.seconds else 0
+        eta = fields.Datetime.now() + timedelta(seconds=runs * self.interval) if runs and self.interval else False
+        _logger.info("WSSH %d elementos en %.1fs (%.3fs por elemento); pendientes %d, %d ejecuciones más%s",
+                     self.items, self.elapsed(), self.item_seconds, pending_items, runs,
+                     ', vacía hacia %s' % eta if eta else '')
+        return {
+            'item_seconds': self.item_seconds,
+            'pending_items': pending_items,
+            'drain_runs': runs,
+            'drain_eta': eta,
+        }
@@ -3,11 +3,20 @@
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 import logging
-import requests,re
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from . import shopify_client
+from .shopify_sync_state import SYNC_REPORT_FIELDS, SYNC_STATE_FIELDS
 
 _logger = logging.getLogger(__name__)
 
+# Instancias sincronizadas a la vez por _shopify_fan_out (cada una con su cursor)
+SHOPIFY_FAN_OUT_WORKERS = 4
+
 class ShopifyInstance(models.Model):
     _name = 'shopify.web'
     _description = 'Shopify Instance'
@@ -23,27 +32,75 @@ class ShopifyInstance(models.Model):
     shopify_company_id = fields.Many2one('res.company', string='Company')
     shopify_last_date_customer_import = fields.Datetime('Last Date Customer Import')
     shopify_last_date_update_stock = fields.Datetime('Last Date Update Stock')
-    shopify_last_date_product_import = fields.Datetime('Last Date Product Import')
+    shopify_last_date_product_import = fields.Datetime(
+        'Last Date Product Import',
+        help="Marca de agua de la importación incremental: se piden los productos con updated_at posterior. "
+             "Vaciarla fuerza un recorrido completo del catálogo en la siguiente importación.",
+    )
     shopify_last_date_order_import = fields.Datetime('Last Date Order Import')
     shopify_last_date_draftorder_import = fields.Datetime('Last Date Draft Order Import')
     payout_last_import_date = fields.Datetime('Last Date Payout Import')
     
     last_export_customer = fields.Datetime(string="Última exportación de clientes")
-    last_export_product = fields.Datetime(string="Última exportación de productos")
-    last_export_stock = fields.Datetime(string="Última actualización de stock")
+    # Progreso de las exportaciones, guardado en shopify.sync.state para no bloquear esta fila
+    last_export_product = fields.Datetime(string="Última exportación de productos",
+                                          compute='_compute_sync_state', inverse='_inverse_sync_state')
+    last_export_stock = fields.Datetime(string="Última actualización de stock",
+                                        compute='_compute_sync_state', inverse='_inverse_sync_state')
     split_products_by_color = fields.Boolean(string="Split Products by Color", default=False)
     color_option_position = fields.Integer(string="Color Option Position", default=1, help="Define en qué opción de Shopify se mapeará el color (por defecto, en la opción 1).")
     size_option_position = fields.Integer(string="Size Option Position", default=2, help="Define en qué opción de Shopify se mapeará la talla (por defecto, en la opción 2).")
 
+    shopify_api_concurrency = fields.Integer(
+        string="Concurrent API Calls",
+        default=4,
+        help="Número máximo de llamadas independientes (metafields, inventory items, imágenes) que se lanzan en paralelo contra la tienda. El rate limiter sigue acotando el ritmo total.",
+    )
+
+    shopify_circuit_state = fields.Selection(
+        [(shopify_client.CIRCUIT_CLOSED, 'Cerrado'),
+         (shopify_client.CIRCUIT_OPEN, 'Abierto'),
+         (shopify_client.CIRCUIT_HALF_OPEN, 'Semiabierto')],
+        string="API Circuit", compute='_compute_shopify_circuit',
+        help="Abierto: la tienda ha fallado (5xx o timeouts) repetidamente y no se le envían llamadas hasta la próxima prueba.",
+    )
+    shopify_circuit_failures = fields.Integer(string="Consecutive API Failures", compute='_compute_shopify_circuit')
+    shopify_circuit_open_until = fields.Datetime(string="Circuit Open Until", compute='_compute_shopify_circuit')
+
     product_export_timeout = fields.Integer(
         string="Product Export Timeout (s)",
         default=300,
-        help="Tiempo máximo, en segundos, que se empleará en la exportación de productos antes de detener el proceso.",
+        help="Tiempo máximo, en segundos, que se empleará en la exportación de productos antes de detener el proceso. "
+             "Cada ejecución se ajusta además al límite de tiempo real de los workers según el coste medido por producto.",
     )
+    product_export_pending = fields.Integer(string="Pending Product Export", compute='_compute_sync_state',
+                                            help="Productos que quedaron por exportar al terminar la última ejecución.")
+    product_export_drain_eta = fields.Datetime(string="Product Export Drained By", compute='_compute_sync_state')
+    stock_export_pending = fields.Integer(string="Pending Stock Export", compute='_compute_sync_state',
+                                          help="Variantes que quedaron por exportar al terminar la última ejecución.")
+    stock_export_drain_eta = fields.Datetime(string="Stock Export Drained By", compute='_compute_sync_state')
     
-    last_export_stock_id = fields.Integer(string="Último ID Stock exportado", default=0, help="ID del último stock exportado")
-    last_export_product_id = fields.Integer(string="Último ID Producto exportado", default=0, help="ID del último producto exportado")
+    last_export_stock_id = fields.Integer(string="Último ID Stock exportado", help="ID del último stock exportado",
+                                          compute='_compute_sync_state', inverse='_inverse_sync_state')
+    last_export_product_id = fields.Integer(string="Último ID Producto exportado", help="ID del último producto exportado",
+                                            compute='_compute_sync_state', inverse='_inverse_sync_state')
     shopify_last_import_customer_id = fields.Char(string="Último ID Cliente importado", help="ID del último Cliente importado")
+    shopify_product_import_engine = fields.Selection(
+        [('rest', 'REST (paginado)'), ('bulk', 'Bulk operation (GraphQL)')],
+        string="Product Import Engine",
+        default='rest',
+        help="Bulk: las importaciones completas e incrementales de productos se piden a Shopify como una operación "
+             "bulk de GraphQL y se procesan leyendo el fichero JSONL resultante línea a línea, en lugar de paginar la API REST.",
+    )
+    shopify_last_import_product_id = fields.Char(
+        string="Último ID Producto importado",
+        help="ID del último producto de Shopify confirmado en una importación en curso; la siguiente ejecución continúa desde él. Se vacía al completar la importación.",
+    )
+    shopify_product_scan_started = fields.Datetime(
+        string="Inicio del recorrido de productos",
+        help="Inicio del recorrido completo en curso, que se conserva al reanudarlo. Al terminar pasa a ser la marca "
+             "de agua de la importación incremental, que no avanza si el recorrido se interrumpe.",
+    )
     salesperson_id = fields.Many2one(
         'res.users', 
         string='Salesperson', 
@@ -62,6 +119,111 @@ class ShopifyInstance(models.Model):
         help='Clonar el partner cuando se detecten cambios en la dirección para generar un nuevo ID.'
     )
 
+    def _compute_sync_state(self):
+        states = self.env['shopify.sync.state']._read_states(self)
+        for instance in self:
+            for field_name, (sync_key, column) in dict(SYNC_STATE_FIELDS, **SYNC_REPORT_FIELDS).items():
+                state = states.get((instance.id, sync_key))
+                instance[field_name] = state[column] if state else False
+
+    def _inverse_sync_state(self):
+        for instance in self:
+            for sync_key in {sync_key for sync_key, _column in SYNC_STATE_FIELDS.values()}:
+                self.env['shopify.sync.state']._write_state(instance, sync_key, {
+                    column: instance[field_name] or (0 if column == 'last_id' else False)
+                    for field_name, (key, column) in SYNC_STATE_FIELDS.items() if key == sync_key
+                })
+
+    def _compute_shopify_circuit(self):
+        budgets = self.env['shopify.api.budget'].sudo().search([('shopify_instance_id', 'in', self.ids)])
+        by_instance = {budget.shopify_instance_id.id: budget for budget in budgets}
+        for instance in self:
+            budget = by_instance.get(instance.id)
+            instance.shopify_circuit_state = (budget and budget.circuit_state) or shopify_client.CIRCUIT_CLOSED
+            instance.shopify_circuit_failures = budget.circuit_failures if budget else 0
+            open_until = budget.circuit_open_until if budget else 0.0
+            instance.shopify_circuit_open_until = (
+                datetime.utcfromtimestamp(open_until) if open_until and instance.shopify_circuit_state != shopify_client.CIRCUIT_CLOSED
+                else False
+            )
+
+    def action_reset_shopify_circuit(self):
+        """Close the circuit breaker of the instances by hand."""
+        budgets = self.env['shopify.api.budget'].sudo().search([('shopify_instance_id', 'in', self.ids)])
+        budgets.write({
+            'circuit_state': shopify_client.CIRCUIT_CLOSED,
+            'circuit_failures': 0,
+            'circuit_open_until': 0.0,
+        })
+        return True
+
+    def action_view_shopify_api_metrics(self):
+        self.ensure_one()
+        return {
+            'name': _('API Metrics'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'shopify.api.metric.summary',
+            'view_mode': 'tree',
+            'domain': [('shopify_instance_id', '=', self.id)],
+            'context': {'default_shopify_instance_id': self.id},
+        }
+
+    def _shopify_circuit_allows(self):
+        """Return False, logging it, while the circuit breaker of the instance is open.
+
+        Cron loops use it to skip a degraded shop instead of waiting out the
+        timeouts of each call.
+        """
+        self.ensure_one()
+        breaker = self._get_shopify_client().breaker
+        if breaker.is_open():
+            _logger.warning("WSSH Instancia %s omitida: circuito abierto tras %s fallos",
+                            self.name, breaker.failures)
+            return False
+        return True
+
+    def _shopify_fan_out(self, model_name, method_name, *args, **kwargs):
+        """Call ``env[model_name].<method_name>(instance, *args, **kwargs)`` for each instance.
+
+        Instances whose circuit is open are skipped. A single instance runs
+        in the caller's transaction (wizards); several run concurrently, each
+        in its own cursor and transaction, so a slow or failing shop neither
+        delays nor rolls back the others. Returns the concatenated result
+        lists of the instances that succeeded.
+        """
+        instances = self.filtered(lambda instance: instance._shopify_circuit_allows())
+        if not instances:
+            return []
+        if len(instances) == 1:
+            return getattr(self.env[model_name], method_name)(instances, *args, **kwargs) or []
+
+        registry, uid, context, su = self.pool, self.env.uid, self.env.context, self.env.su
+        dbname = self.env.cr.dbname
+
+        def run(instance_id):
+            threading.current_thread().dbname = dbname
+            try:
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, uid, context, su=su)
+                    instance = env['shopify.web'].browse(instance_id)
+                    return list(getattr(env[model_name], method_name)(instance, *args, **kwargs) or []), None
+            except Exception as e:
+                _logger.exception("WSSH %s.%s falló para la instancia %s", model_name, method_name, instance_id)
+                return [], e
+
+        workers = min(len(instances), SHOPIFY_FAN_OUT_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shopify-fan-out') as executor:
+            outcomes = list(executor.map(run, instances.ids))
+
+        results = []
+        for instance, (result, error) in zip(instances, outcomes):
+            if error is None:
+                _logger.info("WSSH %s.%s en %s: %d registros", model_name, method_name, instance.name, len(result))
+                results.extend(result)
+            else:
+                _logger.error("WSSH %s.%s en %s terminó con error: %s", model_name, method_name, instance.name, error)
+        return results
+
     # create a method to authenticate with shopify instance
     def shopify_authenticate(self, vals=False):
         # authenticate with shopify instance
@@ -92,23 +254,20 @@ class ShopifyInstance(models.Model):
             shopify_version = self.shopify_version
             shopify_shared_secret = self.shopify_shared_secret
 
-        # shop_url = self.prepare_shopify_shop_url(shopify_host, api_key, password, shopify_version)
-
-        # Create a session
-        session = requests.Session()
-        session.auth = (api_key, password)
-        headers = {
-            "Content-Type": "application/json",
-            "X-Shopify-Access-Token": shopify_shared_secret
-        }
-
-        endpoint = f"https://{shopify_host}.myshopify.com/admin/api/{shopify_version}/shop.json"
-
-        response = session.get(endpoint, headers=headers)
-        if response.status_code == 200:
-            connection = True
+        if vals:
+            client = shopify_client.ShopifyClient(shopify_host, shopify_version, shopify_shared_secret)
         else:
+            client = self._get_shopify_client()
+
+        try:
+            response = client.get('shop.json')
+            connection = response.status_code == 200
+        except Exception as e:
+            _logger.error("WSSH Error while connecting to shopify instance: %s", e)
             connection = False
+        finally:
+            if vals:
+                client.close()
         # try:
         #     session = shopify.Session(shop_url,shopify_version)
         #     print("Session------------------",session)
@@ -127,20 +286,71 @@ class ShopifyInstance(models.Model):
         return connection
 
 
+    def _get_shopify_client(self):
+        """Return the pooled :class:`ShopifyClient` shared by every sync of this instance.
+
+        Its rate limiter and circuit breaker keep their state in
+        ``shopify.api.budget``, so every worker calling this shop shares the
+        same API budget and sees the same circuit. Each call is aggregated
+        into ``shopify.api.metric``.
+        """
+        self.ensure_one()
+        budget_model = self.env['shopify.api.budget']
+        return shopify_client.get_client(
+            (self.env.cr.dbname, self.id),
+            self.shopify_host,
+            self.shopify_version,
+            self.shopify_shared_secret,
+            limiter_factory=lambda: budget_model._get_limiter(self),
+            max_workers=self.shopify_api_concurrency or 1,
+            breaker_factory=lambda: budget_model._get_breaker(self),
+            metrics_factory=lambda: self.env['shopify.api.metric']._get_recorder(self),
+        )
+
     def prepare_shopify_shop_url(self, host, api_key, password,version):
         shop_url = "https://{}:{}@{}.myshopify.com/admin/api/{}".format(api_key,password,host,version)
         return shop_url
 
     def _parse_link_header(self,link_header):
-        # Busca patrones del tipo:
-        # <URL>; rel="next", <URL>; rel="previous", etc.
-        pattern = r'<([^>]+)>;\s*rel="(\w+)"'
-        matches = re.findall(pattern, link_header)
-        # matches será lista de tuplas [(url, rel), (url, rel), ...]
-        links = {}
-        for url, rel in matches:
-            links[rel] = url
-        return links    
+        return shopify_client.parse_link_header(link_header)
+
+    def shopify_iter_pages(self, endpoint, root_key, params=None):
+        """Yield each page of a Shopify list endpoint as soon as it is fetched.
+
+        Follows the ``Link: rel="next"`` cursor header, so every page of the
+        endpoint is visited without holding the whole result set in memory.
+
+        :param endpoint: endpoint relative to the API base URL, e.g. ``'orders.json'``
+        :param root_key: key of the record list in the JSON body, e.g. ``'orders'``
+        :param params: query parameters of the first request
+        """
+        self.ensure_one()
+        return self._get_shopify_client().iter_pages(endpoint, root_key, params=params)
+
+    def shopify_map_concurrent(self, fn, items):
+        """Run ``fn(item)`` for each item on this shop's bounded thread pool.
+
+        Meant for independent calls (one GET per customer, inventory item or
+        image). Results come back in input order to the calling (ORM) thread;
+        ``fn`` must not access ``self.env``.
+        """
+        self.ensure_one()
+        return self._get_shopify_client().map_concurrent(fn, items)
+
+    def shopify_pipeline(self, fn, items):
+        """Send ``fn(item)`` on this shop's thread pool while ``items`` are still being built.
+
+        ``items`` is consumed lazily in the calling (ORM) thread and
+        ``(item, result)`` pairs come back to it in input order, with a
+        bounded number of calls in flight; ``fn`` must not access ``self.env``.
+        """
+        self.ensure_one()
+        return self._get_shopify_client().pipeline(fn, items)
+
+    def shopify_iter_records(self, endpoint, root_key, params=None):
+        """Yield the records of every page returned by :meth:`shopify_iter_pages`."""
+        for page in self.shopify_iter_pages(endpoint, root_key, params=params):
+            yield from page
         
     def clean_string(self,text):
         """
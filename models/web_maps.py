@@ -8,6 +8,14 @@ class ShopifyProductMap(models.Model): #TODO refactorizar a ShopifyProductColorV
     web_product_id = fields.Char(string="ID del producto en la web", required=True)
     odoo_id = fields.Many2one('product.template.attribute.value', string="Producto en Odoo", required=True)
     shopify_instance_id = fields.Many2one('shopify.web', string='Shopify Instance')
+    export_fingerprint = fields.Char(
+        string="Huella de exportación",
+        help="Hash del último payload aceptado por Shopify en una actualización; si el siguiente es idéntico no se envía. "
+             "Vaciarlo fuerza el próximo PUT.")
+    export_structure_fingerprint = fields.Char(
+        string="Huella de estructura",
+        help="Hash del último PUT completo sin los campos propios de cada variante (precio, SKU, barcode). Mientras "
+             "no cambie, esos cambios se envían variante a variante.")
     
     _sql_constraints = [
         ('product_id_shopify_instance_unique', 
@@ -22,6 +30,14 @@ class ShopifyProductTemplateMap(models.Model):
     web_product_id = fields.Char(string="ID del producto en la web", required=True)
     odoo_id = fields.Many2one('product.template', string="Product Template en Odoo", required=True, ondelete='cascade')
     shopify_instance_id = fields.Many2one('shopify.web', string='Shopify Instance')
+    export_fingerprint = fields.Char(
+        string="Huella de exportación",
+        help="Hash del último payload aceptado por Shopify en una actualización; si el siguiente es idéntico no se envía. "
+             "Vaciarlo fuerza el próximo PUT.")
+    export_structure_fingerprint = fields.Char(
+        string="Huella de estructura",
+        help="Hash del último PUT completo sin los campos propios de cada variante (precio, SKU, barcode). Mientras "
+             "no cambie, esos cambios se envían variante a variante.")
     
     _sql_constraints = [
         ('product_template_id_shopify_instance_unique', 
@@ -36,6 +52,9 @@ class ShopifyVariantMap(models.Model):
     web_variant_id = fields.Char(string="ID de la variante en la web", required=True)
     odoo_id = fields.Many2one('product.product', string="Variante en Odoo", required=True)
     shopify_instance_id = fields.Many2one('shopify.web', string='Shopify Instance')
+    export_fingerprint = fields.Char(
+        string="Huella de exportación",
+        help="Hash del último payload de la variante aceptado por Shopify.")
     _sql_constraints = [
         ('variant_id_shopify_instance_unique', 
          'UNIQUE(odoo_id, shopify_instance_id)', 
@@ -57,20 +76,26 @@ class ShopifyStockMapping(models.Model):
          'La combinación de Quant en Odoo y Shopify Location debe ser única.')
     ]    
     
-    @api.model
-    def create(self, vals):
-        # Crear el registro de shopify.stock.map
-        record = super(ShopifyStockMapping, self).create(vals)
-        # Obtener el stock.quant asociado al product_id (odoo_id) y la ubicación
-        if record.odoo_id:
-            quant_domain = [('product_id', '=', record.odoo_id.id)]
-            if record.shopify_location_id.import_stock_warehouse_id:
-                quant_domain.append(('location_id', '=', record.shopify_location_id.import_stock_warehouse_id.id))
-            quants = self.env['stock.quant'].search(quant_domain)
-            if quants:
-                # Forzar recálculo de effective_export_date
-                quants._compute_effective_export_date()
-        return record
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Crear los registros de shopify.stock.map
+        records = super(ShopifyStockMapping, self).create(vals_list)
+        # Obtener los stock.quant asociados a los product_id (odoo_id) y la ubicación,
+        # con una búsqueda por almacén de importación en lugar de una por mapa
+        products_by_location = {}
+        for record in records.filtered('odoo_id'):
+            location = record.shopify_location_id.import_stock_warehouse_id
+            products_by_location.setdefault(location.id, set()).add(record.odoo_id.id)
+        quants = self.env['stock.quant']
+        for location_id, product_ids in products_by_location.items():
+            quant_domain = [('product_id', 'in', list(product_ids))]
+            if location_id:
+                quant_domain.append(('location_id', '=', location_id))
+            quants |= self.env['stock.quant'].search(quant_domain)
+        if quants:
+            # Forzar recálculo de effective_export_date
+            quants._compute_effective_export_date()
+        return records
         
 class ShopifyPartnerMap(models.Model):
     _name = 'shopify.partner.map'
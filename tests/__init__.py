@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from . import test_shopify_client
+from . import test_sync_state
+from . import test_mapping_index
+from . import test_product_export
+from . import test_stock_export
+from . import test_api_budget
+from . import test_order_import
+from . import test_product_import
+from . import test_migration
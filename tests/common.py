@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by the tests: the local Shopify stub and fake clocks/responses."""
+import base64
+import importlib.util
+import os
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.ws_shopify.models import shopify_client
+from odoo.addons.ws_shopify.models.shopify_sync_state import CHECKPOINT_EVERY, SyncCheckpoint
+
+# PNG de 1x1 píxel para las pruebas de imágenes
+PIXEL = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=')
+
+STUB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'shopify_stub.py')
+
+
+def _load_stub():
+    # benchmarks/ no es un paquete: se carga el módulo desde su ruta
+    spec = importlib.util.spec_from_file_location('ws_shopify_benchmarks_stub', STUB_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+shopify_stub = _load_stub()
+
+
+def start_stub(test, fixtures=None, **kwargs):
+    """Serve a fresh :class:`StubShop` for ``test``; return ``(shop, base_url)``.
+
+    Throttling is off unless ``leak_rate`` is given; the server is shut
+    down when the test ends.
+    """
+    kwargs.setdefault('leak_rate', 0)
+    shop = shopify_stub.StubShop(fixtures or {}, **kwargs)
+    server, base_url = shopify_stub.start_server(shop)
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return shop, base_url
+
+
+def stub_client(test, base_url, max_workers=1):
+    """Return a :class:`ShopifyClient` on the stub with its own limiter and breaker."""
+    client = shopify_client.ShopifyClient(
+        base_url, '2024-01', 'token', limiter=shopify_client.LeakyBucketLimiter(),
+        breaker=shopify_client.CircuitBreaker(), max_workers=max_workers)
+    test.addCleanup(client.close)
+    return client
+
+
+class ManualClock:
+    """Clock for the time-based classes that only moves when told to."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeResponse:
+    """Just what the retry, limiter and image code read from a response."""
+
+    def __init__(self, status_code=200, headers=None, content=b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+        self.closed = False
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def close(self):
+        self.closed = True
+
+
+class RecordingCheckpoint(SyncCheckpoint):
+    """Checkpoint that keeps what it would save instead of committing it.
+
+    The real one commits the test cursor and writes from another
+    connection, which a test transaction cannot do; each commit calls
+    ``on_commit`` instead.
+    """
+
+    def __init__(self, *args, on_commit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_commit = on_commit
+        self.saved = {}
+        self.flushes = 0
+
+    def commit(self):
+        if self.on_commit:
+            self.on_commit()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.commit()
+        self.saved.update(self.pending)
+        self.flushes += 1
+        self.pending = {}
+        self.count = 0
+        self.flushed_at = self.clock()
+
+
+class ShopifyStubCase(TransactionCase):
+    """Instance whose client calls a :class:`StubShop` started for each test.
+
+    ``commit_snapshot`` runs on every checkpoint commit and its results
+    are kept in ``self.commits``.
+    """
+
+    checkpoint_every = CHECKPOINT_EVERY
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.instance = cls.env['shopify.web'].create({
+            'name': 'Test stub',
+            'shopify_api_key': 'test',
+            'shopify_password': 'test',
+            'shopify_shared_secret': 'test',
+            'shopify_host': 'http://127.0.0.1',
+            'shopify_version': '2024-01',
+            'shopify_active': True,
+        })
+
+    def setUp(self):
+        super().setUp()
+        self.shop, base_url = start_stub(self, self.stub_fixtures())
+        self.client = stub_client(self, base_url, max_workers=self.instance.shopify_api_concurrency)
+        client = self.client
+        # El cliente real guarda bucket, circuito y métricas desde otra conexión
+        self.patch(type(self.env['shopify.web']), '_get_shopify_client', lambda instance: client)
+        self.checkpoints = []
+        self.commits = []
+
+        def get_checkpoint(model, shopify_instance, sync_key):
+            checkpoint = RecordingCheckpoint(
+                model.env.cr, shopify_instance.id, sync_key, every=self.checkpoint_every,
+                on_commit=lambda: self.commits.append(self.commit_snapshot()))
+            self.checkpoints.append(checkpoint)
+            return checkpoint
+
+        self.patch(type(self.env['shopify.sync.state']), '_get_checkpoint', get_checkpoint)
+
+    def stub_fixtures(self):
+        """Records the stub shop starts with."""
+        return {}
+
+    def commit_snapshot(self):
+        """What a checkpoint commit would make durable; nothing by default."""
+        return None
+
+    def calls(self, endpoint):
+        """Calls the stub received for ``'METHOD path'`` since the test started."""
+        return self.shop.stats()['by_endpoint'].get(endpoint, 0)
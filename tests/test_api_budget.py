@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from odoo.addons.ws_shopify.models import shopify_api_budget
+from odoo.addons.ws_shopify.models.shopify_api_budget import SharedBucketLimiter, SharedCircuitBreaker
+
+from .common import FakeResponse, ManualClock
+
+
+class FakeBudgetTable:
+    """Stands in for ``db_connect`` with a single ``shopify_api_budget`` row; counts transactions."""
+
+    def __init__(self, **row):
+        self.row = row
+        self.transactions = 0
+        self.columns = ()
+
+    def __call__(self, dbname):
+        return self
+
+    def cursor(self):
+        self.transactions += 1
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def execute(self, query, params):
+        query = ' '.join(query.split())
+        if query.startswith('SELECT'):
+            self.columns = query[len('SELECT '):query.index(' FROM')].split(', ')
+        elif query.startswith('UPDATE'):
+            columns = [part.split(' = ')[0] for part in query[query.index('SET ') + 4:query.index(' WHERE')].split(', ')]
+            self.row.update(zip(columns, params))
+
+    def fetchone(self):
+        return tuple(self.row.get(column) for column in self.columns)
+
+
+@tagged('post_install', '-at_install')
+class TestSharedBucketLimiter(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = ManualClock()
+        self.table = FakeBudgetTable(bucket_capacity=40, bucket_fill=0.0, bucket_updated=self.clock.now)
+        self.patch(shopify_api_budget, 'db_connect', self.table)
+        self.limiter = self.limiter_for_worker()
+
+    def limiter_for_worker(self):
+        limiter = SharedBucketLimiter('test', 1)
+        limiter.clock = self.clock
+        limiter.updated = self.clock.now
+        return limiter
+
+    def test_syncs_at_most_every_interval(self):
+        for _call in range(10):
+            self.limiter.reserve()
+            self.limiter.observe(FakeResponse(200))
+        self.assertEqual(self.table.transactions, 1)
+        self.clock.advance(shopify_api_budget.SHARED_SYNC_INTERVAL)
+        self.limiter.reserve()
+        self.assertEqual(self.table.transactions, 2)
+
+    def test_throttled_response_is_published_at_once(self):
+        self.limiter.reserve()
+        self.limiter.observe(FakeResponse(429, {'Retry-After': '3'}))
+        self.assertEqual(self.table.transactions, 2)
+        self.assertAlmostEqual(self.table.row['blocked_until'], self.clock.now + 3.0)
+        # Otro worker ve el bloqueo en su primera llamada
+        self.assertAlmostEqual(self.limiter_for_worker().reserve(), 3.0)
+
+    def test_merges_the_calls_of_other_workers(self):
+        other = self.limiter_for_worker()
+        for _call in range(5):
+            other.reserve()
+        self.clock.advance(shopify_api_budget.SHARED_SYNC_INTERVAL)
+        other.reserve()
+        # La fila tiene las llamadas que el otro worker publicó al sincronizar
+        shared = self.table.row['bucket_fill']
+        self.limiter.reserve()
+        self.assertAlmostEqual(self.limiter.fill, shared + 1)
+        self.assertEqual(self.limiter.unsynced, 1)
+
+
+@tagged('post_install', '-at_install')
+class TestSharedCircuitBreaker(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = ManualClock()
+        self.table = FakeBudgetTable(circuit_state='closed', circuit_failures=0, circuit_open_until=0.0)
+        self.patch(shopify_api_budget, 'db_connect', self.table)
+        self.breaker = SharedCircuitBreaker('test', 1, failure_threshold=2, reset_timeout=60)
+        self.breaker.clock = self.clock
+
+    def test_closed_circuit_reads_the_row_every_interval(self):
+        for _call in range(10):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(True)
+        self.assertEqual(self.table.transactions, 1)
+
+    def test_failures_are_shared(self):
+        self.breaker.allow()
+        self.breaker.record(False)
+        self.breaker.record(False)
+        self.assertEqual(self.table.row['circuit_state'], 'open')
+        other = SharedCircuitBreaker('test', 1)
+        other.clock = self.clock
+        self.assertTrue(other.is_open())
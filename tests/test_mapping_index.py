@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.ws_shopify.models.shopify_mapping_index import MapTable, ShopifyVariantResolver
+
+
+@tagged('post_install', '-at_install')
+class TestMappingIndex(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.instance, cls.other_instance = cls.env['shopify.web'].create([{
+            'name': name,
+            'shopify_api_key': 'test',
+            'shopify_password': 'test',
+            'shopify_shared_secret': 'test',
+            'shopify_host': 'test',
+        } for name in ('Test mapping index', 'Other mapping index')])
+        cls.products = cls.env['product.product'].create([{
+            'name': 'Mapped {}'.format(n),
+            'default_code': 'MAP-{}'.format(n),
+            'barcode': '77{:011d}'.format(n),
+        } for n in range(3)])
+        VariantMap = cls.env['shopify.variant.map']
+        VariantMap.create({
+            'web_variant_id': '1001', 'odoo_id': cls.products[0].id, 'shopify_instance_id': cls.instance.id})
+        VariantMap.create({
+            'web_variant_id': '2001', 'odoo_id': cls.products[1].id, 'shopify_instance_id': cls.other_instance.id})
+
+    def variant_table(self):
+        return MapTable(self.env, 'shopify.variant.map', 'web_variant_id', self.instance)
+
+    def test_map_table_loads_only_the_instance(self):
+        table = self.variant_table()
+        self.assertEqual(table.odoo_id(1001), self.products[0].id)
+        self.assertEqual(table.web_id(self.products[0].id), '1001')
+        self.assertIsNone(table.odoo_id('2001'))
+        self.assertIsNone(table.odoo_id(None))
+
+    def test_map_table_set_many_creates_and_repoints(self):
+        table = self.variant_table()
+        table.set_many([(self.products[0].id, 1002), (self.products[2].id, 3001)])
+        self.assertIsNone(table.odoo_id('1001'))
+        self.assertEqual(table.odoo_id('1002'), self.products[0].id)
+        self.assertEqual(table.odoo_id('3001'), self.products[2].id)
+        maps = self.env['shopify.variant.map'].search([('shopify_instance_id', '=', self.instance.id)])
+        self.assertEqual(
+            {m.odoo_id.id: m.web_variant_id for m in maps},
+            {self.products[0].id: '1002', self.products[2].id: '3001'})
+        # Una tabla nueva lee lo que se guardó
+        self.assertEqual(self.variant_table().odoo_id('3001'), self.products[2].id)
+
+    def test_resolver_priority(self):
+        resolver = ShopifyVariantResolver(self.env, self.instance, variant_map=self.variant_table())
+        resolver.load(variant_ids=[1001], skus=['MAP-1', 'MAP-2'], barcodes=['77{:011d}'.format(2), 'NONE'])
+        # El mapa de variante manda sobre el SKU
+        self.assertEqual(resolver.resolve(variant_id=1001, sku='MAP-1'), self.products[0].id)
+        self.assertEqual(resolver.resolve(variant_id=9999, sku='MAP-1'), self.products[1].id)
+        self.assertEqual(resolver.resolve(sku='UNKNOWN', barcode='77{:011d}'.format(2)), self.products[2].id)
+        self.assertIsNone(resolver.resolve(sku='UNKNOWN', barcode='NONE'))
+
+    def test_resolver_reads_maps_without_a_table(self):
+        resolver = ShopifyVariantResolver(self.env, self.instance)
+        resolver.load(variant_ids=['1001', '2001'])
+        self.assertEqual(resolver.resolve(variant_id='1001'), self.products[0].id)
+        # 2001 es de otra instancia
+        self.assertIsNone(resolver.resolve(variant_id='2001'))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import importlib.util
+import os
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from .common import PIXEL
+
+MIGRATION_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'migrations', '16.0.02', 'post-migration.py')
+
+
+def _load_migration():
+    # El nombre de la carpeta y del fichero no son identificadores: se carga desde su ruta
+    spec = importlib.util.spec_from_file_location('ws_shopify_migration_16_0_02', MIGRATION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@tagged('post_install', '-at_install')
+class TestImageMigration(TransactionCase):
+
+    def old_image(self, shopify_image_id):
+        """Image record with its bytes in the attachment of the old stored binary."""
+        record = self.env['shopify.product.image'].create({'shopify_image_id': shopify_image_id})
+        self.env['ir.attachment'].create({
+            'name': 'shopify_image',
+            'res_model': record._name,
+            'res_field': 'shopify_image',
+            'res_id': record.id,
+            'raw': PIXEL,
+        })
+        return record
+
+    def test_old_binaries_move_to_shared_attachments(self):
+        records = self.old_image('1') | self.old_image('2')
+        _load_migration().migrate(self.env.cr, '16.0.01')
+        records.invalidate_recordset()
+        self.assertEqual(len(records.attachment_id), 1)
+        self.assertEqual(records.attachment_id.raw, PIXEL)
+        self.assertEqual(set(records.mapped('checksum')), {records.attachment_id.checksum})
+        self.assertFalse(self.env['ir.attachment'].search([
+            ('res_model', '=', 'shopify.product.image'), ('res_field', '=', 'shopify_image')]))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import requests
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+
+@tagged('post_install', '-at_install')
+class TestOrderImport(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.failing, cls.healthy = cls.env['shopify.web'].create([{
+            'name': name,
+            'shopify_api_key': 'test',
+            'shopify_password': 'test',
+            'shopify_shared_secret': 'test',
+            'shopify_host': 'test',
+            'shopify_active': True,
+        } for name in ('Tienda caída', 'Tienda sana')])
+
+    def setUp(self):
+        super().setUp()
+        ShopifyWeb = type(self.env['shopify.web'])
+        failing = self.failing
+
+        def iter_pages(instance, endpoint, root_key, params=None):
+            if instance == failing:
+                raise requests.exceptions.HTTPError('503 Server Error')
+            yield [{'id': 1}]
+
+        self.patch(ShopifyWeb, '_shopify_circuit_allows', lambda instance: True)
+        self.patch(ShopifyWeb, 'shopify_iter_pages', iter_pages)
+        self.patch(type(self.env['sale.order']), 'create_shopify_order',
+                   lambda model, orders, instance, skip_existing_order, status: [(instance.id, status)])
+
+    def test_failing_instance_does_not_stop_the_others(self):
+        instances = self.failing | self.healthy
+        with self.assertLogs('odoo.addons.ws_shopify.models.sale_order', 'ERROR') as logs:
+            orders = self.env['sale.order'].import_shopify_orders(instances, True, False, False)
+        self.assertEqual(orders, [(self.healthy.id, 'open')])
+        self.assertEqual(len(logs.records), 2)
+        self.assertTrue(self.healthy.shopify_last_date_order_import)
+        # La tienda que falló no avanza su marca y se reintenta en la siguiente ejecución
+        self.assertFalse(self.failing.shopify_last_date_order_import)
+
+    def test_failing_instance_does_not_stop_the_draft_orders_of_others(self):
+        with self.assertLogs('odoo.addons.ws_shopify.models.sale_order', 'ERROR'):
+            orders = self.env['sale.order'].import_shopify_draft_orders(
+                self.failing | self.healthy, True, False, False)
+        self.assertEqual(orders, [(self.healthy.id, 'draft')])
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import copy
+from types import SimpleNamespace
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from .common import ShopifyStubCase
+
+
+@tagged('post_install', '-at_install')
+class TestExportFingerprint(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ProductTemplate = self.env['product.template']
+        self.data = {'product': {
+            'id': '500',
+            'options': [{'name': 'Color', 'position': 1, 'values': ['Rojo']},
+                        {'name': 'Talla', 'position': 2, 'values': ['S', 'M']}],
+            'variants': [
+                {'id': '1', 'position': 1, 'option1': 'Rojo', 'option2': 'S', 'sku': 'A-S', 'price': 10.0},
+                {'id': '2', 'position': 2, 'option1': 'Rojo', 'option2': 'M', 'sku': 'A-M', 'price': 10.0},
+            ],
+        }}
+        self.product_map = SimpleNamespace(
+            export_fingerprint=self.ProductTemplate._shopify_payload_fingerprint(self.data),
+            export_structure_fingerprint=self.ProductTemplate._shopify_structure_fingerprint(self.data),
+        )
+
+    def classify(self, data, new_variants=None):
+        fingerprint = self.ProductTemplate._shopify_payload_fingerprint(data)
+        return self.ProductTemplate._classify_shopify_changes(self.product_map, data, fingerprint, new_variants)
+
+    def test_fingerprint_ignores_key_order(self):
+        reordered = {'product': dict(reversed(list(self.data['product'].items())))}
+        self.assertEqual(self.ProductTemplate._shopify_payload_fingerprint(reordered),
+                         self.product_map.export_fingerprint)
+
+    def test_unchanged_payload(self):
+        self.assertEqual(self.classify(copy.deepcopy(self.data)), 'none')
+
+    def test_variant_fields_only(self):
+        data = copy.deepcopy(self.data)
+        data['product']['variants'][0]['price'] = 12.0
+        self.assertEqual(self.classify(data), 'variants')
+
+    def test_product_field_needs_a_full_put(self):
+        data = copy.deepcopy(self.data)
+        data['product']['title'] = 'Otro nombre'
+        data['product']['variants'][0]['price'] = 12.0
+        self.assertEqual(self.classify(data), 'full')
+
+    def test_reordered_variants_need_a_full_put(self):
+        data = copy.deepcopy(self.data)
+        data['product']['variants'][0]['position'], data['product']['variants'][1]['position'] = 2, 1
+        self.assertEqual(self.classify(data), 'full')
+
+    def test_new_variants_need_a_full_put(self):
+        self.assertEqual(self.classify(copy.deepcopy(self.data), new_variants=[object()]), 'full')
+
+    def test_unknown_structure_needs_a_full_put(self):
+        self.product_map.export_structure_fingerprint = False
+        data = copy.deepcopy(self.data)
+        data['product']['variants'][0]['price'] = 12.0
+        self.assertEqual(self.classify(data), 'full')
+
+
+@tagged('post_install', '-at_install')
+class TestProductExport(ShopifyStubCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Attribute = cls.env['product.attribute']
+        color = Attribute.create({'name': 'Color', 'value_ids': [(0, 0, {'name': 'Rojo'})]})
+        size = Attribute.create({'name': 'Talla', 'value_ids': [(0, 0, {'name': 'S'}), (0, 0, {'name': 'M'})]})
+        cls.templates = cls.env['product.template'].create([{
+            'name': 'Camiseta {}'.format(n),
+            'list_price': 19.9,
+            'attribute_line_ids': [
+                (0, 0, {'attribute_id': color.id, 'value_ids': [(6, 0, color.value_ids.ids)]}),
+                (0, 0, {'attribute_id': size.id, 'value_ids': [(6, 0, size.value_ids.ids)]}),
+            ],
+        } for n in range(3)])
+        number = 0
+        for template in cls.templates:
+            for variant in template.product_variant_ids.sorted('id'):
+                variant.write({'default_code': 'EXP-{}'.format(number), 'barcode': '55{:011d}'.format(number)})
+                number += 1
+
+    def export(self, templates=None):
+        self.env['product.template'].export_products_to_shopify(
+            self.instance, update=True, products=self.templates if templates is None else templates)
+        return self.checkpoints[-1].saved
+
+    def template_map(self, template):
+        return self.env['shopify.product.template.map'].search([
+            ('odoo_id', '=', template.id),
+            ('shopify_instance_id', '=', self.instance.id),
+        ])
+
+    def test_export_creates_and_maps_products(self):
+        saved = self.export()
+        self.assertEqual(self.calls('POST products.json'), 3)
+        self.assertEqual(len(self.shop.data['products']), 3)
+        for template in self.templates:
+            self.assertTrue(self.template_map(template))
+        variant_maps = self.env['shopify.variant.map'].search([('shopify_instance_id', '=', self.instance.id)])
+        self.assertEqual(variant_maps.odoo_id, self.templates.product_variant_ids)
+        # Ejecución completa: fecha nueva y sin ID pendiente
+        self.assertEqual(saved['last_id'], 0)
+        self.assertTrue(saved['last_date'])
+        self.assertEqual(saved['pending_items'], 0)
+
+    def test_unchanged_products_are_not_sent_again(self):
+        self.export()
+        # La primera actualización guarda las huellas del payload aceptado
+        self.export()
+        self.assertEqual(self.calls('PUT products/{id}.json'), 3)
+        self.shop.reset_stats()
+        self.export()
+        self.assertEqual(self.shop.stats()['calls'], 1)  # solo la comprobación inicial de mapeos
+
+    def test_variant_change_sends_only_that_variant(self):
+        self.export()
+        self.export()
+        self.templates[0].product_variant_ids.sorted('id')[0].barcode = '5599999999999'
+        self.shop.reset_stats()
+        self.export()
+        self.assertEqual(self.calls('PUT variants/{id}.json'), 1)
+        self.assertEqual(self.calls('PUT products/{id}.json'), 0)
+        barcodes = {v['barcode'] for p in self.shop.data['products'].values() for v in p['variants']}
+        self.assertIn('5599999999999', barcodes)
+
+    def test_failed_product_is_retried_by_the_next_run(self):
+        ProductTemplate = type(self.env['product.template'])
+        original_post = ProductTemplate._apply_shopify_product_post
+        failing = self.templates[1]
+        fail = [True]
+
+        def apply_post(model, instance_id, job, response):
+            result = original_post(model, instance_id, job, response)
+            if fail[0] and job['product'] == failing:
+                # Falla después de crear el mapeo: la escritura no debe quedar
+                raise UserError('Rechazado')
+            return result
+
+        self.patch(ProductTemplate, '_apply_shopify_product_post', apply_post)
+        # El producto huérfano en Shopify dispararía la recuperación de mapeos, que aquí no se prueba
+        self.patch(ProductTemplate, '_check_last_shopify_product_map', lambda model, instance: True)
+
+        with self.assertRaises(UserError):
+            self.export()
+        saved = self.checkpoints[-1].saved
+        self.assertEqual(saved['last_id'], self.templates[0].id)
+        self.assertNotIn('last_date', saved)
+        self.assertTrue(self.template_map(self.templates[0]))
+        self.assertFalse(self.template_map(failing))
+
+        # La siguiente ejecución parte del checkpoint (id > last_id) y la plantilla fallida entra de nuevo
+        fail[0] = False
+        saved = self.export(self.templates.filtered(lambda t: t.id > saved['last_id']))
+        self.assertTrue(self.template_map(failing))
+        self.assertEqual(saved['last_id'], 0)
+
+    def test_failure_right_after_a_flush_keeps_the_applied_maps(self):
+        ProductTemplate = type(self.env['product.template'])
+        original_post = ProductTemplate._apply_shopify_product_post
+        failing = self.templates[1]
+
+        def apply_post(model, instance_id, job, response):
+            if job['product'] == failing:
+                # Falla antes de crear su mapeo, con el checkpoint recién guardado
+                raise UserError('Rechazado')
+            return original_post(model, instance_id, job, response)
+
+        self.patch(ProductTemplate, '_apply_shopify_product_post', apply_post)
+        self.patch(ProductTemplate, '_check_last_shopify_product_map', lambda model, instance: True)
+        self.checkpoint_every = 1
+        self.commit_snapshot = lambda: self.env['shopify.product.template.map'].search([
+            ('shopify_instance_id', '=', self.instance.id)]).odoo_id
+
+        with self.assertRaises(UserError):
+            self.export()
+        self.assertEqual(self.checkpoints[-1].saved['last_id'], self.templates[0].id)
+        # La respuesta en curso del tercer producto se aplicó y su mapeo se confirma al salir,
+        # así que la siguiente ejecución no vuelve a crearlo en Shopify
+        self.assertEqual(self.commits[-1], self.templates[0] | self.templates[2])
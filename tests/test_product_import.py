@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import functools
+from datetime import datetime
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import PIXEL, FakeResponse, ShopifyStubCase
+
+
+@tagged('post_install', '-at_install')
+class TestProductImport(ShopifyStubCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.templates = cls.env['product.template'].create([
+            {'name': 'Importado {}'.format(n), 'type': 'product', 'default_code': 'IMP-{}'.format(n)}
+            for n in range(3)])
+
+    def stub_fixtures(self):
+        return {'products': [{
+            'id': 100 + n,
+            'title': 'Importado {}'.format(n),
+            'updated_at': '2024-03-0{}T10:00:00Z'.format(n + 1),
+            'variants': [{'id': 200 + n, 'product_id': 100 + n, 'sku': 'IMP-{}'.format(n), 'barcode': None}],
+            'images': [{'id': 300 + n, 'position': 1, 'variant_ids': [],
+                        'src': 'https://cdn.example.com/{}.png'.format(n)}],
+        } for n in range(3)]}
+
+    def setUp(self):
+        super().setUp()
+        ShopifyWeb = type(self.env['shopify.web'])
+        self.writes = []
+
+        def write_with_retry(web, record, field_name, value, transaccional=True):
+            # La real hace commit en cada escritura
+            self.writes.append((field_name, value))
+            record.write({field_name: value})
+
+        self.patch(ShopifyWeb, 'write_with_retry', write_with_retry)
+        self.downloads = []
+
+        def download_image(model, url, headers=None):
+            self.downloads.append(url)
+            return FakeResponse(200, {'Content-Type': 'image/png'}, PIXEL)
+
+        self.patch(type(self.env['product.template']), '_download_image', download_image)
+        # Sin esperas entre los sondeos de la operación bulk
+        self.patch(self.client, 'run_bulk_query', functools.partial(
+            type(self.client).run_bulk_query, self.client, sleep=lambda seconds: None))
+
+    def import_products(self, **kwargs):
+        return self.env['product.template'].import_shopify_products_sub(self.instance, True, False, False, **kwargs)
+
+    def written(self, field_name):
+        return [value for name, value in self.writes if name == field_name]
+
+    def test_full_scan_moves_the_watermark_when_it_completes(self):
+        self.import_products()
+        scan_started = self.written('shopify_product_scan_started')[0]
+        self.assertEqual(self.written('shopify_last_date_product_import'), [scan_started])
+        # La marca se escribe después del último punto de control, nunca al empezar
+        fields_written = [name for name, _value in self.writes]
+        self.assertGreater(fields_written.index('shopify_last_date_product_import'),
+                           fields_written.index('shopify_last_import_product_id'))
+        self.assertFalse(self.instance.shopify_last_import_product_id)
+        self.assertFalse(self.instance.shopify_product_scan_started)
+
+    def test_interrupted_full_scan_keeps_the_watermark(self):
+        watermark = datetime(2024, 1, 1)
+        self.instance.shopify_last_date_product_import = watermark
+        ProductTemplate = type(self.env['product.template'])
+        original_process = ProductTemplate._process_imported_products
+        fail = [True]
+
+        def process(model, products, *args, **kwargs):
+            if fail[0]:
+                raise UserError('Cortado')
+            return original_process(model, products, *args, **kwargs)
+
+        self.patch(ProductTemplate, '_process_imported_products', process)
+        with self.assertRaises(UserError):
+            self.import_products(full_scan=True)
+        self.assertEqual(self.instance.shopify_last_date_product_import, watermark)
+        scan_started = self.instance.shopify_product_scan_started
+        self.assertTrue(scan_started)
+
+        # La siguiente ejecución reanuda el recorrido desde el último producto confirmado
+        # y, al terminarlo, la marca pasa al inicio del recorrido original
+        fail[0] = False
+        self.instance.shopify_last_import_product_id = '100'
+        self.import_products()
+        self.assertEqual(self.instance.shopify_last_date_product_import, scan_started)
+        self.assertFalse(self.instance.shopify_last_import_product_id)
+
+    def test_bulk_import_checkpoints_each_chunk(self):
+        self.instance.write({
+            'shopify_product_import_engine': 'bulk',
+            'shopify_last_date_product_import': datetime(2024, 3, 2, 9, 30),
+        })
+        products = self.import_products()
+        self.assertIn("updated_at:>='2024-03-02T09:30:00Z'", self.shop.bulk_operations[-1]['query'])
+        self.assertEqual(products, self.templates[1:].ids)
+        self.assertEqual(self.written('shopify_last_import_product_id'), ['102', False])
+        scan_started = self.written('shopify_product_scan_started')[0]
+        self.assertEqual(self.instance.shopify_last_date_product_import, scan_started)
+
+    def test_import_syncs_the_product_images(self):
+        self.import_products()
+        self.assertEqual(len(self.downloads), 3)
+        for template in self.templates:
+            self.assertTrue(template.image_1920)
+        images = self.env['shopify.product.image'].search([('shopify_template_id', 'in', self.templates.ids)])
+        self.assertEqual(len(images), 3)
+        # Los tres comparten contenido y, por tanto, adjunto
+        self.assertEqual(len(images.attachment_id), 1)
+
+    def test_image_helpers_download_when_called_alone(self):
+        ProductTemplate = self.env['product.template']
+        template = self.templates[0]
+        self.assertTrue(ProductTemplate.sync_simple_product_images(400, 'https://cdn.example.com/a.png', template, 1))
+        self.assertTrue(template.image_1920)
+        self.import_products()
+        self.assertTrue(ProductTemplate.sync_variable_product_images(401, 'https://cdn.example.com/b.png', ['200']))
+        self.assertEqual(self.downloads[0], 'https://cdn.example.com/a.png')
+        self.assertEqual(self.downloads[-1], 'https://cdn.example.com/b.png')
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import requests
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from odoo.addons.ws_shopify.models import shopify_client
+
+from .common import FakeResponse, ManualClock, start_stub, stub_client
+
+
+class NoBackoff(shopify_client.RetryPolicy):
+    def backoff(self, attempt):
+        return 0.0
+
+
+class FixedBackoff(shopify_client.RetryPolicy):
+    def backoff(self, attempt):
+        return 5.0
+
+
+def scripted_send(outcomes):
+    """Return ``(send, calls)``: ``send`` answers each attempt with the next outcome."""
+    calls = []
+
+    def send():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    return send, calls
+
+
+@tagged('post_install', '-at_install')
+class TestSendWithRetry(BaseCase):
+
+    def test_replays_server_errors_of_idempotent_calls(self):
+        send, calls = scripted_send([503, 502, 200])
+        response = shopify_client.send_with_retry(send, 'GET', 'products.json', policy=NoBackoff())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(response.shopify_retries, 2)
+
+    def test_post_not_replayed_after_server_error(self):
+        send, calls = scripted_send([500, 201])
+        response = shopify_client.send_with_retry(send, 'POST', 'products.json', policy=NoBackoff())
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(calls), 1)
+
+    def test_post_replayed_when_marked_idempotent(self):
+        send, calls = scripted_send([500, 200])
+        response = shopify_client.send_with_retry(
+            send, 'POST', 'inventory_levels/set.json', policy=NoBackoff(), idempotent=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_throttled_post_replayed(self):
+        send, calls = scripted_send([429, 201])
+        response = shopify_client.send_with_retry(send, 'POST', 'products.json', policy=NoBackoff())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.shopify_throttled, 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_throttle_without_limiter_waits_retry_after(self):
+        responses = [FakeResponse(429, {'Retry-After': '2.5'}), FakeResponse(200)]
+        sleeps = []
+        self.patch(shopify_client.time, 'sleep', sleeps.append)
+        response = shopify_client.send_with_retry(lambda: responses.pop(0), 'GET', 'bulk.jsonl', policy=FixedBackoff())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sleeps, [2.5])
+
+    def test_throttle_without_retry_after_waits_the_backoff(self):
+        send, calls = scripted_send([429, 200])
+        sleeps = []
+        self.patch(shopify_client.time, 'sleep', sleeps.append)
+        shopify_client.send_with_retry(send, 'GET', 'bulk.jsonl', policy=FixedBackoff())
+        self.assertEqual(sleeps, [5.0])
+
+    def test_connect_timeout_replayed_for_post(self):
+        send, calls = scripted_send([requests.exceptions.ConnectTimeout(), 201])
+        response = shopify_client.send_with_retry(send, 'POST', 'products.json', policy=NoBackoff())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(calls), 2)
+
+    def test_read_timeout_not_replayed_for_post(self):
+        send, calls = scripted_send([requests.exceptions.ReadTimeout(), 201])
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            shopify_client.send_with_retry(send, 'POST', 'products.json', policy=NoBackoff())
+        self.assertEqual(len(calls), 1)
+
+    def test_read_timeout_replayed_for_get(self):
+        send, calls = scripted_send([requests.exceptions.ReadTimeout(), 200])
+        response = shopify_client.send_with_retry(send, 'GET', 'products.json', policy=NoBackoff())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_last_response_returned_after_max_attempts(self):
+        send, calls = scripted_send([503, 503, 503, 200])
+        response = shopify_client.send_with_retry(send, 'GET', 'products.json', policy=NoBackoff(max_attempts=3))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(calls), 3)
+
+    def test_no_attempt_started_past_the_deadline(self):
+        send, calls = scripted_send([503, 200])
+        response = shopify_client.send_with_retry(send, 'GET', 'products.json', policy=FixedBackoff(deadline=1.0))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(calls), 1)
+
+    def test_client_error_not_replayed(self):
+        send, calls = scripted_send([422, 200])
+        response = shopify_client.send_with_retry(send, 'PUT', 'products/1.json', policy=NoBackoff())
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(calls), 1)
+
+
+@tagged('post_install', '-at_install')
+class TestLeakyBucketLimiter(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = ManualClock()
+        # 10 llamadas de capacidad, 2 de margen: vacía 0,5 llamadas por segundo
+        self.limiter = shopify_client.LeakyBucketLimiter(capacity=10, headroom=2)
+        self.limiter.clock = self.clock
+        self.limiter.updated = self.clock.now
+
+    def test_waits_only_once_the_headroom_is_reached(self):
+        waits = [self.limiter.reserve() for _i in range(8)]
+        self.assertEqual(waits, [0.0] * 8)
+        self.assertAlmostEqual(self.limiter.reserve(), 2.0)
+
+    def test_bucket_leaks_over_time(self):
+        for _i in range(8):
+            self.limiter.reserve()
+        self.assertGreater(self.limiter.reserve(), 0.0)
+        self.limiter.release()
+        # 4 s a 0,5 llamadas/s vacían dos huecos
+        self.clock.advance(4)
+        self.assertEqual(self.limiter.reserve(), 0.0)
+        self.assertAlmostEqual(self.limiter.fill, 7.0)
+
+    def test_release_gives_back_the_slot(self):
+        self.limiter.reserve()
+        self.limiter.release()
+        self.assertAlmostEqual(self.limiter.fill, 0.0)
+
+    def test_call_limit_header_resyncs_the_bucket(self):
+        self.limiter.observe(FakeResponse(200, {shopify_client.CALL_LIMIT_HEADER: '39/80'}))
+        self.assertEqual(self.limiter.capacity, 80)
+        self.assertAlmostEqual(self.limiter.leak_rate, 4.0)
+        self.assertAlmostEqual(self.limiter.fill, 39.0)
+
+    def test_throttle_blocks_until_retry_after(self):
+        self.limiter.observe(FakeResponse(429, {'Retry-After': '3.0'}))
+        self.assertAlmostEqual(self.limiter.blocked_until, self.clock.now + 3.0)
+        self.assertGreaterEqual(self.limiter.reserve(), 3.0)
+
+
+@tagged('post_install', '-at_install')
+class TestCircuitBreaker(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = ManualClock()
+        self.breaker = shopify_client.CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        self.breaker.clock = self.clock
+
+    def test_opens_after_consecutive_failures(self):
+        for _i in range(2):
+            self.breaker.record(False)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, shopify_client.CIRCUIT_OPEN)
+        self.assertTrue(self.breaker.is_open())
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_the_failure_count(self):
+        self.breaker.record(False)
+        self.breaker.record(False)
+        self.breaker.record(True)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, shopify_client.CIRCUIT_CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        for _i in range(3):
+            self.breaker.record(False)
+        self.clock.advance(61)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, shopify_client.CIRCUIT_HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, shopify_client.CIRCUIT_CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        for _i in range(3):
+            self.breaker.record(False)
+        self.clock.advance(61)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, shopify_client.CIRCUIT_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_only_server_errors_and_timeouts_are_failures(self):
+        self.assertTrue(self.breaker.is_failure(response=FakeResponse(503)))
+        self.assertFalse(self.breaker.is_failure(response=FakeResponse(422)))
+        self.assertTrue(self.breaker.is_failure(error=requests.exceptions.ReadTimeout()))
+        self.assertFalse(self.breaker.is_failure(error=requests.exceptions.InvalidURL()))
+
+
+@tagged('post_install', '-at_install')
+class TestPagination(BaseCase):
+
+    def test_parse_link_header(self):
+        links = shopify_client.parse_link_header(
+            '<https://shop.myshopify.com/admin/api/2024-01/orders.json?page_info=abc&limit=50>; rel="previous", '
+            '<https://shop.myshopify.com/admin/api/2024-01/orders.json?page_info=def&limit=50>; rel="next"')
+        self.assertEqual(links['next'], 'https://shop.myshopify.com/admin/api/2024-01/orders.json?page_info=def&limit=50')
+        self.assertIn('page_info=abc', links['previous'])
+        self.assertEqual(shopify_client.parse_link_header(None), {})
+
+    def test_iter_pages_follows_link_headers(self):
+        cards = [{'id': n, 'initial_value': '10.00', 'note': 'x'} for n in range(1, 121)]
+        shop, base_url = start_stub(self, {'gift_cards': cards})
+        client = stub_client(self, base_url)
+        pages = list(client.iter_pages('gift_cards.json', 'gift_cards', {'limit': 50, 'fields': 'id'}))
+        self.assertEqual([len(page) for page in pages], [50, 50, 20])
+        self.assertEqual([card['id'] for page in pages for card in page], list(range(1, 121)))
+        # La URL de la página siguiente conserva el parámetro fields
+        self.assertEqual({key for page in pages for card in page for key in card}, {'id'})
+        self.assertEqual(shop.stats()['by_endpoint']['GET gift_cards.json'], 3)
+
+    def test_iter_pages_stops_on_an_empty_result(self):
+        _shop, base_url = start_stub(self)
+        client = stub_client(self, base_url)
+        self.assertEqual(list(client.iter_pages('gift_cards.json', 'gift_cards', {'limit': 50})), [[]])
+
+
+@tagged('post_install', '-at_install')
+class TestRunPipelined(BaseCase):
+
+    def test_results_come_back_in_order(self):
+        results = list(shopify_client.run_pipelined(lambda n: n * 2, range(20), max_workers=3))
+        self.assertEqual(results, [(n, n * 2) for n in range(20)])
+
+    def test_items_error_raised_after_submitted_items(self):
+        def items():
+            yield from range(5)
+            raise ValueError('build failed')
+
+        yielded = []
+        with self.assertRaises(ValueError):
+            for item, result in shopify_client.run_pipelined(lambda n: n + 1, items(), max_workers=2):
+                yielded.append((item, result))
+        self.assertEqual(yielded, [(n, n + 1) for n in range(5)])
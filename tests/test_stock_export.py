@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+
+from odoo.addons.ws_shopify.models.shopify_sync_state import RunBudget
+
+from .common import ShopifyStubCase, shopify_stub
+
+
+@tagged('post_install', '-at_install')
+class TestStockExport(ShopifyStubCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.other_instance = cls.env['shopify.web'].create({
+            'name': 'Test stub 2',
+            'shopify_api_key': 'test',
+            'shopify_password': 'test',
+            'shopify_shared_secret': 'test',
+            'shopify_host': 'http://127.0.0.1',
+            'shopify_version': '2024-01',
+            'shopify_active': True,
+        })
+        cls.instances = cls.instance | cls.other_instance
+        cls.templates = cls.env['product.template'].create([
+            {'name': 'Taza {}'.format(n), 'type': 'product'} for n in range(2)])
+        cls.item_ids = []
+        for instance in cls.instances:
+            location = cls.env['shopify.location'].create({
+                'name': 'Stub Warehouse',
+                'shopify_location_id': str(shopify_stub.DEFAULT_LOCATION_ID),
+                'shopify_instance_id': instance.id,
+                'is_shopify': True,
+            })
+            for variant in cls.templates.product_variant_ids:
+                item_id = 7000 + len(cls.item_ids)
+                cls.item_ids.append(item_id)
+                cls.env['shopify.stock.map'].create({
+                    'web_stock_id': str(item_id),
+                    'odoo_id': variant.id,
+                    'shopify_instance_id': instance.id,
+                    'shopify_location_id': location.id,
+                })
+
+    def setUp(self):
+        super().setUp()
+        for item_id in self.item_ids:
+            self.shop.inventory_items[item_id] = {'id': item_id, 'sku': ''}
+
+    def export(self):
+        return self.env['product.product'].export_stock_to_shopify(self.instances, products=self.templates)
+
+    def test_every_instance_is_exported(self):
+        updated_ids = self.export()
+        self.assertEqual(self.calls('POST inventory_levels/set.json'), 4)
+        self.assertEqual(len(updated_ids), 4)
+        for checkpoint in self.checkpoints:
+            self.assertEqual(checkpoint.saved['last_id'], 0)
+
+    def test_exhausted_budget_does_not_stop_the_next_instance(self):
+        SyncState = type(self.env['shopify.sync.state'])
+        original_budget = SyncState._get_run_budget
+        instances_left = []
+
+        def get_run_budget(model, shopify_instance, sync_key, **kwargs):
+            instances_left.append(kwargs.get('instances_left'))
+            if shopify_instance == self.instance:
+                return RunBudget(0, item_seconds=1.0)
+            return original_budget(model, shopify_instance, sync_key, **kwargs)
+
+        self.patch(SyncState, '_get_run_budget', get_run_budget)
+        updated_ids = self.export()
+        # El tiempo que queda se reparte entre las instancias pendientes
+        self.assertEqual(instances_left, [2, 1])
+        self.assertEqual(self.calls('POST inventory_levels/set.json'), 2)
+        self.assertEqual(len(updated_ids), 2)
+        first, second = self.checkpoints
+        self.assertNotIn('last_date', first.saved)
+        self.assertEqual(first.saved['pending_items'], 2)
+        self.assertEqual(second.saved['last_id'], 0)
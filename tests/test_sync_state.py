@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import re
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase, TransactionCase
+from odoo.tools import config
+
+from odoo.addons.ws_shopify.models import shopify_sync_state
+from odoo.addons.ws_shopify.models.shopify_sync_state import RunBudget, SyncCheckpoint
+
+from .common import ManualClock
+
+
+class FakeCursor:
+    """Caller cursor of a checkpoint: counts commits."""
+
+    dbname = 'test'
+
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakeConnection:
+    """Stands in for ``db_connect``; keeps the values of every upsert."""
+
+    def __init__(self):
+        self.saves = []
+
+    def __call__(self, dbname):
+        return self
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def execute(self, query, params):
+        columns = re.search(r'sync_key, (.*), write_date\)', query).group(1).split(', ')
+        self.saves.append(dict(zip(columns, params[2:])))
+
+
+@tagged('post_install', '-at_install')
+class TestSyncCheckpoint(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cr = FakeCursor()
+        self.connection = FakeConnection()
+        self.clock = ManualClock()
+        self.patch(shopify_sync_state, 'db_connect', self.connection)
+
+    def checkpoint(self, **kwargs):
+        return SyncCheckpoint(self.cr, 1, 'product_export', clock=self.clock, **kwargs)
+
+    def test_saves_every_few_items(self):
+        checkpoint = self.checkpoint(every=3, interval=3600)
+        checkpoint.advance(10)
+        checkpoint.advance(11)
+        self.assertEqual(self.connection.saves, [])
+        checkpoint.advance(12)
+        self.assertEqual(self.connection.saves, [{'last_id': 12}])
+        # El trabajo de los elementos guardados se confirma antes que su progreso
+        self.assertEqual(self.cr.commits, 1)
+
+    def test_saves_after_the_interval(self):
+        checkpoint = self.checkpoint(every=100, interval=10)
+        checkpoint.advance(10)
+        self.clock.advance(11)
+        checkpoint.advance(11)
+        self.assertEqual(self.connection.saves, [{'last_id': 11}])
+
+    def test_complete_run_resets_the_last_id(self):
+        checkpoint = self.checkpoint(every=100)
+        checkpoint.advance(10)
+        checkpoint.report({'pending_items': 0})
+        checkpoint.finish('2024-01-01 00:00:00')
+        self.assertEqual(self.connection.saves, [
+            {'last_date': '2024-01-01 00:00:00', 'last_id': 0, 'pending_items': 0}])
+
+    def test_partial_finish_keeps_the_last_id(self):
+        checkpoint = self.checkpoint(every=100)
+        checkpoint.advance(10)
+        checkpoint.finish('2024-01-01 00:00:00', complete=False)
+        self.assertEqual(self.connection.saves, [{'last_date': '2024-01-01 00:00:00', 'last_id': 10}])
+
+    def test_pending_progress_saved_when_the_sync_fails(self):
+        with self.assertRaises(ValueError):
+            with self.checkpoint(every=100) as checkpoint:
+                checkpoint.advance(10)
+                raise ValueError('sync failed')
+        self.assertEqual(self.connection.saves, [{'last_id': 10}])
+
+    def test_nothing_saved_without_progress(self):
+        with self.checkpoint():
+            pass
+        self.assertEqual(self.connection.saves, [])
+        self.assertEqual(self.cr.commits, 1)
+
+    def test_work_after_a_flush_committed_when_the_sync_fails(self):
+        with self.assertRaises(ValueError):
+            with self.checkpoint(every=1) as checkpoint:
+                checkpoint.advance(10)
+                # Sin progreso pendiente tras el guardado; el trabajo en curso debe confirmarse igual
+                raise ValueError('sync failed')
+        self.assertEqual(self.connection.saves, [{'last_id': 10}])
+        self.assertEqual(self.cr.commits, 2)
+
+
+@tagged('post_install', '-at_install')
+class TestRunBudget(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = ManualClock()
+
+    def test_first_item_seeds_the_average(self):
+        budget = RunBudget(60, clock=self.clock)
+        self.clock.advance(3)
+        budget.tick()
+        self.assertAlmostEqual(budget.item_seconds, 3.0)
+
+    def test_average_moves_towards_new_samples(self):
+        budget = RunBudget(60, item_seconds=2.0, alpha=0.2, clock=self.clock)
+        self.clock.advance(4)
+        budget.tick()
+        self.assertAlmostEqual(budget.item_seconds, 2.4)
+        self.assertEqual(budget.items, 1)
+
+    def test_skipped_items_do_not_count(self):
+        budget = RunBudget(60, item_seconds=2.0, alpha=0.5, clock=self.clock)
+        self.clock.advance(10)
+        budget.skip()
+        self.clock.advance(2)
+        budget.tick()
+        self.assertAlmostEqual(budget.item_seconds, 2.0)
+        self.assertEqual(budget.items, 1)
+
+    def test_allows_while_the_next_items_fit(self):
+        budget = RunBudget(10, item_seconds=2.0, clock=self.clock)
+        self.clock.advance(7)
+        self.assertTrue(budget.allows())
+        # Con una llamada en curso ya no cabe otra
+        self.assertFalse(budget.allows(in_flight=1))
+
+    def test_drain_estimate(self):
+        budget = RunBudget(10, item_seconds=2.0, interval=300, clock=self.clock)
+        estimate = budget.drain_estimate(12)
+        self.assertEqual(estimate['pending_items'], 12)
+        self.assertEqual(estimate['drain_runs'], 3)
+        self.assertTrue(estimate['drain_eta'])
+        estimate = budget.drain_estimate(0)
+        self.assertEqual(estimate['drain_runs'], 0)
+        self.assertFalse(estimate['drain_eta'])
+
+    def test_no_eta_without_a_cron(self):
+        budget = RunBudget(10, item_seconds=2.0, clock=self.clock)
+        self.assertFalse(budget.drain_estimate(12)['drain_eta'])
+
+
+@tagged('post_install', '-at_install')
+class TestSyncState(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.instance = cls.env['shopify.web'].create({
+            'name': 'Test sync state',
+            'shopify_api_key': 'test',
+            'shopify_password': 'test',
+            'shopify_shared_secret': 'test',
+            'shopify_host': 'test',
+        })
+        cls.SyncState = cls.env['shopify.sync.state']
+
+    def test_instance_fields_read_and_write_the_state(self):
+        self.instance.write({'last_export_product_id': 42, 'last_export_stock_id': 7})
+        states = self.SyncState.search([('shopify_instance_id', '=', self.instance.id)])
+        self.assertEqual(
+            {state.sync_key: state.last_id for state in states}, {'product_export': 42, 'stock_export': 7})
+        self.instance.invalidate_recordset()
+        self.assertEqual(self.instance.last_export_product_id, 42)
+
+    def test_run_budget_uses_the_worker_limit(self):
+        self.patch(config, 'options', dict(config.options, limit_time_real=100, limit_time_real_cron=-1))
+        budget = self.SyncState._get_run_budget(self.instance, 'product_export', 300, elapsed=10)
+        self.assertAlmostEqual(budget.seconds, 70.0)
+        budget = self.SyncState._get_run_budget(self.instance, 'product_export', 30, elapsed=10)
+        self.assertAlmostEqual(budget.seconds, 30.0)
+
+    def test_run_budget_shared_between_instances(self):
+        self.patch(config, 'options', dict(config.options, limit_time_real=100, limit_time_real_cron=-1))
+        budget = self.SyncState._get_run_budget(self.instance, 'product_export', 300, elapsed=10, instances_left=2)
+        self.assertAlmostEqual(budget.seconds, 35.0)
+
+    def test_run_budget_starts_from_the_measured_cost(self):
+        self.SyncState._write_state(self.instance, 'stock_export', {'item_seconds': 1.5})
+        budget = self.SyncState._get_run_budget(self.instance, 'stock_export')
+        self.assertAlmostEqual(budget.item_seconds, 1.5)
+        # La exportación de stock no tiene tarea programada propia
+        self.assertEqual(budget.interval, 0)
+
+    def test_run_budget_interval_from_the_module_cron(self):
+        cron = self.env.ref('ws_shopify.cron_export_products_from_shopify')
+        cron.write({'active': True, 'interval_number': 5, 'interval_type': 'minutes'})
+        self.assertEqual(self.SyncState._get_run_budget(self.instance, 'product_export').interval, 300)
+        cron.active = False
+        self.assertEqual(self.SyncState._get_run_budget(self.instance, 'product_export').interval, 0)
@@ -40,6 +40,9 @@ class ShopifyOperation(models.TransientModel):
     date_filter = fields.Boolean(string="Date Filter")
     skip_existing_product = fields.Boolean(string="Do Not Update Existing Products",
                                            help="Check if you want to skip existing products.")
+    full_scan = fields.Boolean(string="Full Scan",
+                               help="Import the whole catalog instead of only the products updated in Shopify "
+                                    "since the last import.")
     skip_existing_customer = fields.Boolean(string="Do Not Update Existing Customers",
                                             help="Check if you want to skip existing customers.")
     skip_existing_order = fields.Boolean(string="Do Not Update Existing Orders",
@@ -59,11 +62,12 @@ class ShopifyOperation(models.TransientModel):
                 action_name = "ws_shopify.action_shopify_customer"
         elif self.shopify_operation == 'import_shopify_products':
             # call method to import products from shopify to odoo
+            # La marca de agua de la importación incremental la avanza la propia importación
             products = self.env['product.template'].import_shopify_products(self.shopify_instance_id,
                                                                             self.skip_existing_product,
-                                                                            self.orders_from_date, self.orders_to_date)
+                                                                            self.orders_from_date, self.orders_to_date,
+                                                                            full_scan=self.full_scan)
             if products:
-                self.shopify_instance_id.shopify_last_date_product_import = datetime.now()
                 ids = products
                 action_name = "ws_shopify.action_product_template_shopify"
         elif self.shopify_operation == 'import_locations':